@@ -1,114 +1,2644 @@
 import streamlit as st
-import edge_tts
 import asyncio
+import bisect
+import collections
+import collections.abc
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import contextvars
+import functools
+import hashlib
+import http.server
+import importlib
+import importlib.util
 import io
-import fitz  # pymupdf
-import docx
-import pytesseract
-from pdf2image import convert_from_bytes
-from PIL import Image, ImageOps
-import cv2
-import numpy as np
+import json
+import os
+import queue
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import xml.etree.ElementTree as ET
+import zipfile
 
-def process_image_for_ocr(image, threshold_value=128):
+try:
+    import fcntl  # POSIX only, used to coordinate cache eviction across processes
+except ImportError:
+    fcntl = None
+
+class _LazyModule:
     """
-    Applies pre-processing to an image for better OCR results.
+    Stands in for a module that is imported on first attribute access, so a
+    new worker doesn't pay for the extraction and synthesis backends it may
+    never use. Attributes set on the stand-in are set on the module.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = object.__getattribute__(self, "_module")
+        if module is None:
+            module = importlib.import_module(object.__getattribute__(self, "_name"))
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __repr__(self):
+        return f"<lazy module {object.__getattribute__(self, '_name')!r}>"
+
+edge_tts = _LazyModule("edge_tts")
+fitz = _LazyModule("fitz")  # pymupdf
+pytesseract = _LazyModule("pytesseract")
+Image = _LazyModule("PIL.Image")
+ImageOps = _LazyModule("PIL.ImageOps")
+cv2 = _LazyModule("cv2")
+np = _LazyModule("numpy")
+
+# In-process Tesseract API; without it, OCR runs the tesseract command per image
+tesserocr = _LazyModule("tesserocr") if importlib.util.find_spec("tesserocr") else None
+
+# Audio synthesis settings
+VOICE_OPTIONS = {
+    "Australian Female": "en-AU-NatashaNeural",
+    "Australian Male": "en-AU-WilliamNeural",
+    "US Female": "en-US-AriaNeural",
+    "US Male": "en-US-ChristopherNeural"
+}
+TTS_CHUNK_CHARS = 3000  # Max characters sent to a single edge-tts stream
+TTS_FIRST_CHUNK_CHARS = 300  # The first chunk is kept short so playback can start within seconds
+TTS_AUDIO_BYTES_PER_SECOND = 6000  # edge-tts streams 48 kbit/s constant bitrate MP3, so bytes map to time
+TTS_BOUNDARY_TICKS_PER_SECOND = 10_000_000  # Boundary event offsets are in 100ns units
+PAGE_AUDIO_PREFETCH_PAGES = 2  # Pages after the current one synthesized ahead in page audio mode
+DEFAULT_TTS_CONCURRENCY = 4  # Max edge-tts streams open at once
+TTS_PAGE_LOAD_AHEAD = 2  # Pages extracted ahead of synthesis when generating from pages not extracted yet
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Shared synthesis scheduling settings
+TTS_GLOBAL_CONCURRENCY = int(os.environ.get("TTS_GLOBAL_CONCURRENCY", 8))  # edge-tts streams open at once across all sessions
+TTS_MAX_ATTEMPTS = 4  # Tries per chunk before a generation fails
+TTS_RETRY_BASE_SECONDS = 1.0  # Pause after a failed stream, doubled for each further failure in a row...
+TTS_RETRY_MAX_SECONDS = 30.0  # ...up to this long
+
+# OCR settings
+OCR_WORKERS = os.cpu_count() or 1
+OCR_MAX_IN_FLIGHT_PAGES = int(os.environ.get("TTS_OCR_MAX_IN_FLIGHT_PAGES", 2 * OCR_WORKERS))
+OCR_MIN_PAGE_TEXT_CHARS = 20  # Pages with less native text than this are OCR'd
+OCR_SCANNED_PAGE_MAX_CHARS = 200  # Image-covered pages with less text than this are OCR'd
+OCR_SCANNED_IMAGE_COVERAGE = 0.5  # Fraction of the page covered by images to count as a scan
+
+# OCR engine settings
+OCR_ENGINE = os.environ.get("TTS_OCR_ENGINE", "auto")  # "tesserocr", "subprocess", or "auto" to prefer tesserocr
+OCR_ENGINE_POOL_SIZE = int(os.environ.get("TTS_OCR_ENGINE_POOL_SIZE", OCR_WORKERS))  # Warm Tesseract instances per process
+
+# OCR page rendering settings
+OCR_DPI = 300  # Resolution for pages without text or scanned images to go by
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+OCR_TARGET_TEXT_PX = 40  # Rendered height of the median font size; Tesseract reads 20-30px x-heights best
+OCR_MAX_PAGE_PIXELS = 40_000_000  # Oversized pages are rendered at a lower resolution
+
+# File type settings
+FILE_TYPES = {"pdf": "pdf", "docx": "docx", "jpg": "image", "jpeg": "image", "png": "image"}  # Extension -> kind of file
+EXTRACTION_BACKENDS = {  # Kind of file -> modules its extraction imports on first use
+    "pdf": ("fitz", "numpy", "cv2", "PIL.Image", "pytesseract"),
+    "docx": (),  # Read with zipfile and ElementTree
+    "image": ("PIL.Image", "PIL.ImageOps", "numpy", "cv2", "pytesseract"),
+}
+
+# Upload settings
+UPLOAD_SPOOL_BLOCK_BYTES = 1024 * 1024  # Uploads are copied to disk in blocks of this size
+
+# Parallel native text extraction settings
+PDF_PARALLEL_MIN_PAGES = 100  # Smaller PDFs are read on a single thread
+PDF_TEXT_RANGE_PAGES = 50  # Pages read by each worker task
+
+# Automatic threshold selection settings
+AUTO_THRESHOLD = "auto"
+AUTO_THRESHOLD_OFFSETS = (-40, -20, 0, 20, 40)  # Candidates around Otsu's threshold
+AUTO_THRESHOLD_SAMPLE_WIDTH = 1500  # Candidates are scored on a downscaled crop
+
+# Text region settings (photos are OCR'd one detected text block at a time)
+TEXT_REGION_MIN_INK = 0.02  # Blocks with less dark ink than this fraction are noise...
+TEXT_REGION_MAX_INK = 0.6  # ...and blocks with more are shadows or solid edges, not text
+TEXT_REGION_MIN_SKEW = 0.5  # Blocks tilted less than this many degrees are OCR'd as they are
+TEXT_REGION_MAX_SKEW = 20  # Larger angles are not taken for skew
+
+# Lazy extraction settings
+DEFAULT_PREFETCH_PAGES = 3  # Pages extracted ahead of the one being viewed
+
+# Boilerplate removal settings
+BOILERPLATE_EDGE_LINES = 3  # Lines at the top and bottom of a page that can be headers or footers
+BOILERPLATE_MIN_PAGES = 3  # A line must repeat on at least this many pages...
+BOILERPLATE_MIN_FRACTION = 0.4  # ...and on this fraction of them (odd/even headers alternate)
+BOILERPLATE_SAMPLE_PAGES = 40  # PDF pages read up front to find repeated lines
+SPEECH_CHARS_PER_SECOND = 15  # Rough speaking rate, for estimating the audio time saved
+PAGE_NUMBER_RE = re.compile(
+    r"^(?i:page\s*)?[-\u2013\u2014(\[]?\s*"  # "Page 3", "- 3 -", "(3)"
+    r"(?P<number>\d{1,4}|(?=[mdclxvi])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))"  # Arabic or lowercase Roman
+    r"\s*[-\u2013\u2014)\]]?(?:\s*(?i:of|/)\s*\d{1,4})?$"  # "3 of 10", "3/10"
+)
+HYPHENATED_LINE_END_RE = re.compile(r"(?<=[^\W\d_])-\n(?=[a-z])")
+
+# DOCX extraction settings
+DOCX_CHUNK_CHARS = 1000  # Paragraphs are grouped into pages of about this many characters
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MARKUP_COMPATIBILITY_NAMESPACE = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+
+# Session memory settings
+PREVIEW_MAX_WIDTH = 800  # Image previews kept in session state are downscaled to this width
+SESSION_SPILL_MIN_PAGES = 20  # Page lists at least this long are kept on disk instead of in memory
+
+# On-disk cache settings
+CACHE_ROOT = os.environ.get("TTS_APP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tts-audio-app"))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("TTS_AUDIO_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("TTS_EXTRACTION_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+JOB_RESULTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_JOB_RESULTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # Finished jobs' full MP3s
+CACHE_EVICT_TO_FRACTION = 0.9  # A full cache is evicted down to this fraction of its size, so not every write rescans it
+EXTRACTION_CACHE_VERSION = 4  # Bump when extraction output changes for the same input
+
+# Streaming playback settings
+AUDIO_STREAM_PORT = os.environ.get("TTS_AUDIO_STREAM_PORT")  # Stream audio to the player over HTTP on this port
+AUDIO_STREAM_URL = os.environ.get("TTS_AUDIO_STREAM_URL")  # Public base URL of that port, as the browser reaches it; required with the port
+
+# Metrics settings
+METRICS_FILE = os.environ.get("TTS_METRICS_FILE")  # Prometheus text file, e.g. for a textfile collector
+METRICS_PORT = os.environ.get("TTS_METRICS_PORT")  # Serve the metrics over HTTP on this port
+METRICS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)  # Stage duration histogram, in seconds
+METRICS_SPAN_FIELDS = ("pages", "chars", "bytes")  # Span sizes exported as counters
+
+class StageMetrics:
+    """
+    Thread-safe per-stage duration histograms and size counters.
+    Exported in the Prometheus text format, optionally to a file that is
+    rewritten at most once per write_interval seconds. Only the process that
+    created the registry records and writes; copies of it in forked worker
+    processes ignore spans (see submit_to_worker).
+    """
+
+    def __init__(self, path=None, write_interval=1.0):
+        self.path = path
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._last_write = 0.0
+        self._pid = os.getpid()
+
+    def record(self, span):
+        """Adds a finished span (a dict with "stage", "seconds" and optional sizes)."""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            stats = self._stages.get(span["stage"])
+            if stats is None:
+                stats = {"count": 0, "seconds": 0.0, "buckets": [0] * len(METRICS_BUCKETS)}
+                stats.update((field, 0) for field in METRICS_SPAN_FIELDS)
+                self._stages[span["stage"]] = stats
+            stats["count"] += 1
+            stats["seconds"] += span["seconds"]
+            for i, bound in enumerate(METRICS_BUCKETS):
+                if span["seconds"] <= bound:
+                    stats["buckets"][i] += 1
+            for field in METRICS_SPAN_FIELDS:
+                stats[field] += span.get(field) or 0
+            write_due = self.path and time.monotonic() - self._last_write >= self.write_interval
+            if write_due:
+                self._last_write = time.monotonic()
+        if write_due:
+            self.write_file()
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {stage: dict(stats, buckets=list(stats["buckets"])) for stage, stats in self._stages.items()}
+        lines = [
+            "# HELP tts_app_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE tts_app_stage_seconds histogram",
+        ]
+        for stage, stats in sorted(stages.items()):
+            for bound, count in zip(METRICS_BUCKETS, stats["buckets"]):
+                lines.append(f'tts_app_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'tts_app_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'tts_app_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]:.6f}')
+            lines.append(f'tts_app_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for field in METRICS_SPAN_FIELDS:
+            lines.append(f"# HELP tts_app_stage_{field}_total Total {field} processed by each pipeline stage.")
+            lines.append(f"# TYPE tts_app_stage_{field}_total counter")
+            for stage, stats in sorted(stages.items()):
+                lines.append(f'tts_app_stage_{field}_total{{stage="{stage}"}} {stats[field]}')
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path=None):
+        """Atomically writes the metrics to path (default: the configured file)."""
+        path = path or self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+def start_metrics_server(metrics, port):
+    """Serves metrics.render() at /metrics on a background thread."""
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep scrapes out of the app log
+
+    server = http.server.ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    return server
+
+@st.cache_resource
+def get_metrics():
+    """Returns the metrics registry shared by all sessions on this node."""
+    metrics = StageMetrics(path=METRICS_FILE)
+    if METRICS_PORT:
+        start_metrics_server(metrics, int(METRICS_PORT))
+    return metrics
+
+# Spans of the current app run, for the per-run breakdown in the sidebar
+_current_run_spans = contextvars.ContextVar("current_run_spans", default=None)
+
+# In a worker process, the spans of the running task, which are sent back with its result
+_worker_spans = None
+_worker_spans_lock = threading.Lock()
+
+@contextlib.contextmanager
+def timed_stage(stage, **attrs):
+    """
+    Times a pipeline stage and records it in the metrics registry.
+    Args:
+        stage: The stage name, used as the metrics label.
+        attrs: Span attributes such as pages, chars, bytes and voice. The span
+            dict is yielded so sizes known only at the end can be added.
+    """
+    span = {"stage": stage, **attrs}
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span["seconds"] = time.perf_counter() - started
+        if _worker_spans is not None:
+            with _worker_spans_lock:
+                _worker_spans.append(span)
+        else:
+            get_metrics().record(span)
+        run_spans = _current_run_spans.get()
+        if run_spans is not None:
+            run_spans.append(span)
+
+def _run_in_worker(parent_pid, func, *args):
+    # Collects the spans of func when it runs in another process, instead of recording them there
+    global _worker_spans
+    if os.getpid() == parent_pid:
+        return func(*args), []  # A thread pool; spans were recorded as usual
+    with _worker_spans_lock:
+        _worker_spans = []
+    try:
+        result = func(*args)
+    except Exception as e:
+        # Backend exceptions may not survive pickling, which would break the whole pool
+        raise RuntimeError(str(e)) from None
+    finally:
+        with _worker_spans_lock:
+            spans, _worker_spans = _worker_spans, None
+    return result, spans
+
+def submit_to_worker(executor, func, *args):
+    """
+    Submits func(*args) to an executor, which may be a process pool. The spans
+    func records in a worker process are sent back with its result and
+    recorded in this process's metrics, so they reach the exported metrics
+    and workers never write the metrics file.
+    Returns:
+        A concurrent.futures.Future of the result of func.
+    """
+    future = concurrent.futures.Future()
+    worker_future = executor.submit(_run_in_worker, os.getpid(), func, *args)
+    future.add_done_callback(lambda f: worker_future.cancel() if f.cancelled() else None)
+
+    def worker_done(worker_future):
+        with contextlib.suppress(concurrent.futures.InvalidStateError):  # Cancelled meanwhile
+            if worker_future.cancelled():
+                future.cancel()
+            elif worker_future.exception() is not None:
+                future.set_exception(worker_future.exception())
+            else:
+                result, spans = worker_future.result()
+                for span in spans:
+                    get_metrics().record(span)
+                future.set_result(result)
+
+    worker_future.add_done_callback(worker_done)
+    return future
+
+def file_kind(name):
+    """Returns the kind of file ("pdf", "docx" or "image") a file name is, going by its extension, or None if unsupported."""
+    return FILE_TYPES.get(os.path.splitext(name)[1].lower().lstrip("."))
+
+def load_extraction_backend(kind):
+    """
+    Imports the modules extracting a kind of file needs. Called before work
+    is handed to worker processes, so workers forked afterwards inherit the
+    modules instead of each importing them.
+    """
+    for name in EXTRACTION_BACKENDS[kind]:
+        importlib.import_module(name)
+
+def spool_file(file, path):
+    """
+    Writes the content of a file object to path without building a second
+    in-memory copy: in-memory uploads are written from their buffer, other
+    files are copied in blocks.
+    Returns:
+        The SHA-256 hex digest of the content.
+    """
+    hasher = hashlib.sha256()
+    with open(path, "wb") as out:
+        if hasattr(file, "getbuffer"):
+            with file.getbuffer() as view:
+                hasher.update(view)
+                out.write(view)
+        else:
+            file.seek(0)
+            for block in iter(lambda: file.read(UPLOAD_SPOOL_BLOCK_BYTES), b""):
+                hasher.update(block)
+                out.write(block)
+    file.seek(0)
+    return hasher.hexdigest()
+
+@contextlib.contextmanager
+def spooled_path(file):
+    """
+    Yields a path on disk holding the content of a file object, so PyMuPDF
+    and OpenCV can read it directly instead of being handed a copy of the
+    bytes. Files opened from disk are used in place; anything else is
+    spooled to a temporary file that is removed afterwards.
+    """
+    if isinstance(file, (io.BufferedReader, io.FileIO)) and os.path.isfile(file.name):
+        yield file.name
+        return
+    fd, path = tempfile.mkstemp(prefix="tts-upload-")
+    os.close(fd)
+    try:
+        spool_file(file, path)
+        yield path
+    finally:
+        os.remove(path)
+
+def sharpen(gray):
+    """Applies the sharpening kernel used before thresholding to a grayscale numpy array."""
+    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+    return cv2.filter2D(gray, -1, kernel)
+
+def prepare_image_file_for_threshold(path):
+    """
+    Like prepare_image_for_threshold, but for an image file on disk.
+    The file is read through a memory map and decoded by OpenCV straight to
+    grayscale (applying the EXIF orientation), so neither the encoded bytes nor
+    a full-color copy of the image are held in memory.
+    Returns:
+        The sharpened grayscale numpy array.
+    """
+    with timed_stage("image_preprocess") as span:
+        span["bytes"] = os.path.getsize(path)
+        gray = cv2.imdecode(np.memmap(path, dtype=np.uint8, mode="r"), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("The image could not be decoded.")
+
+        # Resize if too large (width > 3000)
+        height, width = gray.shape[:2]
+        if width > 3000:
+            gray = cv2.resize(gray, (3000, int(3000 * height / width)), interpolation=cv2.INTER_LANCZOS4)
+
+        return sharpen(gray)
+
+def make_file_preview(path, max_width=PREVIEW_MAX_WIDTH):
+    """Makes a display preview of an image file, decoding JPEGs at a reduced size."""
+    with Image.open(path) as image:
+        image.draft("RGB", (max_width, max_width))
+        return make_preview(ImageOps.exif_transpose(image), max_width)
+
+def prepare_image_for_threshold(image):
+    """
+    Applies the threshold-independent pre-processing steps for OCR.
+    The result can be kept and re-thresholded with apply_threshold, so that
+    changing the threshold does not redo the expensive steps.
     Args:
         image: A PIL Image object.
-        threshold_value: The manual threshold value for binary conversion.
     Returns:
-        A processed image as a numpy array.
+        A (resized_image, sharpened) tuple: the orientation-fixed, resized PIL
+        image and the sharpened grayscale numpy array.
     """
-    # Fix EXIF rotation
-    image = ImageOps.exif_transpose(image)
+    with timed_stage("image_preprocess"):
+        # Fix EXIF rotation
+        image = ImageOps.exif_transpose(image)
 
-    # Resize if too large (width > 3000)
-    if image.width > 3000:
-        aspect_ratio = image.height / image.width
-        new_height = int(3000 * aspect_ratio)
-        image = image.resize((3000, new_height), Image.Resampling.LANCZOS)
+        # Resize if too large (width > 3000)
+        if image.width > 3000:
+            aspect_ratio = image.height / image.width
+            new_height = int(3000 * aspect_ratio)
+            image = image.resize((3000, new_height), Image.Resampling.LANCZOS)
 
-    # Convert PIL Image to numpy array
-    img_array = np.array(image)
+        # Convert PIL Image to numpy array
+        img_array = np.array(image)
     
-    # Convert to grayscale
-    if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    elif len(img_array.shape) == 3 and img_array.shape[2] == 4:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
-    else:
-        # Assuming already grayscale
-        gray = img_array
+        # Convert to grayscale
+        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
+            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        elif len(img_array.shape) == 3 and img_array.shape[2] == 4:
+            gray = cv2.cvtColor(img_array, cv2.COLOR_RGBA2GRAY)
+        else:
+            # Assuming already grayscale
+            gray = img_array
     
-    # Apply Sharpening Kernel
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    sharpened = cv2.filter2D(gray, -1, kernel)
+        # Apply Sharpening Kernel
+        sharpened = sharpen(gray)
+
+    return image, sharpened
+
+def make_preview(image, max_width=PREVIEW_MAX_WIDTH, image_format="JPEG"):
+    """
+    Makes a small, compressed copy of an image for display.
+    Args:
+        image: A PIL Image object or a numpy array.
+        max_width: Images wider than this are downscaled to it.
+        image_format: The PIL format to encode the preview in.
+    Returns:
+        The encoded preview as bytes.
+    """
+    if not hasattr(image, "save"):
+        image = Image.fromarray(image)
+    if image.width > max_width:
+        image = image.resize((max_width, max(1, int(image.height * max_width / image.width))), Image.Resampling.LANCZOS)
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def downscale_array(array, max_width=PREVIEW_MAX_WIDTH):
+    """Downscales a numpy image array to at most max_width pixels wide."""
+    height, width = array.shape[:2]
+    if width <= max_width:
+        return array
+    return cv2.resize(array, (max_width, max(1, int(height * max_width / width))), interpolation=cv2.INTER_AREA)
+
+class SubprocessOcrEngine:
+    """OCRs images with pytesseract, which starts the tesseract command (and loads its model) for every image."""
+
+    name = "subprocess"
+
+    def image_to_string(self, image):
+        return pytesseract.image_to_string(image)
 
-    # Apply Binary Threshold
+    def word_confidences(self, image):
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+        return [float(conf) for conf in data["conf"]]
+
+class TesseractPool:
+    """
+    OCRs images with warm in-process Tesseract instances (tesserocr).
+    Each instance loads the language model once and is reused for every image,
+    which is passed as a numpy buffer, without temp files or a subprocess.
+    Instances are created on demand, up to size, and each is used by one thread
+    at a time; Tesseract releases the GIL while recognizing. A forked worker
+    process starts with an empty pool of its own. path is the tessdata
+    directory, e.g. from tessdata_path(); tesserocr's built-in one if None.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, size=OCR_ENGINE_POOL_SIZE, path=None):
+        self.size = max(1, size)
+        self.path = path
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Instances inherited through fork belong to the parent and are dropped
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _api(self):
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    api = tesserocr.PyTessBaseAPI() if self.path is None else tesserocr.PyTessBaseAPI(path=self.path)
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def _set_image(self, api, image):
+        if getattr(image, "mode", "L") not in ("L", "RGB", "RGBA"):
+            image = image.convert("L")
+        array = np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+        height, width = array.shape[:2]
+        bytes_per_pixel = 1 if array.ndim == 2 else array.shape[2]
+        api.SetImageBytes(array.tobytes(), width, height, bytes_per_pixel, array.strides[0])
+
+    def image_to_string(self, image):
+        with self._api() as api:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+
+    def word_confidences(self, image):
+        with self._api() as api:
+            self._set_image(api, image)
+            api.Recognize()
+            return [float(conf) for conf in api.AllWordConfidences()]
+
+def tessdata_path():
+    """
+    Returns the directory of the Tesseract language models: TESSDATA_PREFIX if
+    set, else the one the tesseract command uses, or None if neither is known.
+    tesserocr wheels bundle their own libtesseract, which doesn't look in the
+    system's tessdata directory by itself.
+    """
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    try:
+        listing = subprocess.run(["tesseract", "--list-langs"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'languages in "([^"]+)"', listing.stdout + listing.stderr)
+    return match.group(1) if match else None
+
+def make_ocr_engine(kind=None):
+    """
+    Creates an OCR engine.
+    Args:
+        kind: "tesserocr", "subprocess", or "auto" to use tesserocr when it is
+            installed. Defaults to OCR_ENGINE.
+    Returns:
+        A TesseractPool or SubprocessOcrEngine.
+    """
+    kind = kind or OCR_ENGINE
+    if kind == "tesserocr" or (kind == "auto" and tesserocr is not None):
+        if tesserocr is None:
+            raise RuntimeError("TTS_OCR_ENGINE is tesserocr, but tesserocr is not installed")
+        return TesseractPool(path=tessdata_path())
+    if kind not in ("auto", "subprocess"):
+        raise ValueError(f"Unknown OCR engine: {kind}")
+    return SubprocessOcrEngine()
+
+@st.cache_resource
+def get_ocr_engine():
+    """Returns the OCR engine shared by all sessions (and threads) of this process."""
+    return make_ocr_engine()
+
+def apply_threshold(sharpened, threshold_value=128):
+    """Applies the binary threshold to a sharpened grayscale numpy array."""
     _, thresh = cv2.threshold(sharpened, threshold_value, 255, cv2.THRESH_BINARY)
-    
     return thresh
 
-def extract_text_from_image(image):
-    """Extracts text from a pre-processed image (numpy array or PIL Image)."""
-    text = pytesseract.image_to_string(image)
+def _threshold_sample(sharpened):
+    """Returns the middle band of the image, downscaled, for quick candidate scoring."""
+    height = sharpened.shape[0]
+    sample = sharpened[height // 4:height - height // 4]
+    width = sample.shape[1]
+    if width > AUTO_THRESHOLD_SAMPLE_WIDTH:
+        scale = AUTO_THRESHOLD_SAMPLE_WIDTH / width
+        sample = cv2.resize(sample, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return sample
+
+def _threshold_score(image):
+    """
+    Scores an OCR candidate by the sum of Tesseract's word confidences, which
+    rewards both recognizing more words and recognizing them confidently.
+    """
+    return sum(conf for conf in get_ocr_engine().word_confidences(image) if conf > 0)
+
+def choose_threshold(sharpened, executor=None):
+    """
+    Picks a binary threshold for a sharpened grayscale image.
+    Otsu's method seeds a few candidate thresholds, which are OCR'd in parallel
+    on a downscaled crop; the candidate Tesseract is most confident about wins.
+    Args:
+        sharpened: The sharpened grayscale numpy array from prepare_image_for_threshold.
+        executor: A concurrent.futures executor. A thread pool is created if not given.
+    Returns:
+        The chosen threshold value (0-255).
+    """
+    otsu_value, _ = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    otsu_value = int(otsu_value)
+    candidates = sorted({min(255, max(0, otsu_value + offset)) for offset in AUTO_THRESHOLD_OFFSETS})
+    sample = _threshold_sample(sharpened)
+
+    def score(value):
+        return _threshold_score(apply_threshold(sample, value))
+
+    with timed_stage("auto_threshold"):
+        if executor is None:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+                scores = list(pool.map(score, candidates))
+        else:
+            scores = list(executor.map(score, candidates))
+
+    # Ties go to the candidate closest to Otsu's threshold
+    best = max(zip(candidates, scores), key=lambda item: (item[1], -abs(item[0] - otsu_value)))
+    return best[0]
+
+def process_image_for_ocr(image, threshold_value=128):
+    """
+    Applies pre-processing to an image for better OCR results.
+    Args:
+        image: A PIL Image object.
+        threshold_value: The manual threshold value for binary conversion, or
+            AUTO_THRESHOLD to pick one with choose_threshold.
+    Returns:
+        A processed image as a numpy array.
+    """
+    _, sharpened = prepare_image_for_threshold(image)
+    if threshold_value == AUTO_THRESHOLD:
+        threshold_value = choose_threshold(sharpened)
+    return apply_threshold(sharpened, threshold_value)
+
+def process_image_file_for_ocr(path, threshold_value=128, executor=None):
+    """
+    Like process_image_for_ocr, but decodes an image file on disk (see
+    prepare_image_file_for_threshold). executor is passed on to choose_threshold.
+    """
+    sharpened = prepare_image_file_for_threshold(path)
+    if threshold_value == AUTO_THRESHOLD:
+        threshold_value = choose_threshold(sharpened, executor=executor)
+    return apply_threshold(sharpened, threshold_value)
+
+TextRegion = collections.namedtuple("TextRegion", ["x", "y", "width", "height", "angle"])
+
+def _text_height(ink):
+    """Returns the median height of the glyph-sized connected components of an ink mask, or None."""
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    max_height = max(8, ink.shape[0] // 10)
+    heights = [int(h) for h in stats[1:, cv2.CC_STAT_HEIGHT] if 4 <= h <= max_height]
+    return statistics.median(heights) if heights else None
+
+def _split_at_gaps(regions, start, end):
+    """Groups regions whose [start, end) spans overlap, in order of start."""
+    groups = []
+    group_end = 0
+    for region in sorted(regions, key=start):
+        if groups and start(region) < group_end:
+            groups[-1].append(region)
+        else:
+            groups.append([region])
+        group_end = max(group_end, end(region))
+    return groups
+
+def _reading_order(regions):
+    """
+    Sorts regions into reading order with a recursive X-Y cut: regions are
+    split into columns at vertical gaps first, then into bands at horizontal
+    gaps, and each part is ordered the same way.
+    """
+    if len(regions) <= 1:
+        return list(regions)
+    for start, end in (
+        (lambda region: region.x, lambda region: region.x + region.width),
+        (lambda region: region.y, lambda region: region.y + region.height),
+    ):
+        groups = _split_at_gaps(regions, start, end)
+        if len(groups) > 1:
+            return [region for group in groups for region in _reading_order(group)]
+    return sorted(regions, key=lambda region: (region.y, region.x))
+
+def find_text_regions(binary):
+    """
+    Finds the blocks of text in a thresholded image.
+    Ink is smeared with a closing kernel sized from the median glyph height,
+    which joins letters into words, words into lines and lines into blocks
+    but not neighbouring columns. Blocks that are mostly empty or mostly
+    solid (table edges, shadows) are dropped.
+    Args:
+        binary: A thresholded numpy array, dark text on a white background.
+    Returns:
+        A list of TextRegion in reading order; angle is the block's skew in degrees.
+    """
+    ink = cv2.bitwise_not(binary)
+    text_height = _text_height(ink)
+    if text_height is None:
+        return []
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (int(1.5 * text_height), int(2 * text_height)))
+    blocks = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blocks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, width, height = cv2.boundingRect(contour)
+        if height < text_height / 2 or width < text_height:
+            continue
+        _, (rect_width, rect_height), angle = cv2.minAreaRect(contour)
+        ink_fraction = cv2.countNonZero(ink[y:y + height, x:x + width]) / max(1.0, rect_width * rect_height)
+        if not TEXT_REGION_MIN_INK <= ink_fraction <= TEXT_REGION_MAX_INK:
+            continue
+        # minAreaRect reports angles in (0, 90] or [-90, 0) depending on the OpenCV version
+        if angle > 45:
+            angle -= 90
+        elif angle < -45:
+            angle += 90
+        regions.append(TextRegion(x, y, width, height, angle))
+    return _reading_order(regions)
+
+def crop_text_region(binary, region, padding=8):
+    """Crops a TextRegion out of a thresholded image, adds a white margin and rotates it level."""
+    crop = binary[region.y:region.y + region.height, region.x:region.x + region.width]
+    crop = cv2.copyMakeBorder(crop, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=255)
+    if not TEXT_REGION_MIN_SKEW <= abs(region.angle) <= TEXT_REGION_MAX_SKEW:
+        return crop
+    height, width = crop.shape[:2]
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), region.angle, 1.0)
+    return cv2.warpAffine(crop, rotation, (width, height), flags=cv2.INTER_NEAREST, borderValue=255)
+
+def extract_text_from_image(image, threshold_value=None, crop_to_text=False, executor=None):
+    """
+    Extracts text from an image.
+    Args:
+        image: A pre-processed image (numpy array or PIL Image), or a raw PIL
+            Image if threshold_value is given.
+        threshold_value: If set (a value or AUTO_THRESHOLD), the image is first
+            run through process_image_for_ocr.
+        crop_to_text: OCR only the text blocks found by find_text_regions,
+            deskewed and in parallel, instead of the whole frame. Needs a
+            thresholded numpy array. The whole frame is OCR'd if no block is found.
+        executor: A concurrent.futures executor for the blocks. A thread pool
+            is created if not given.
+    """
+    if threshold_value is not None:
+        image = process_image_for_ocr(image, threshold_value)
+    engine = get_ocr_engine()
+    with timed_stage("image_ocr", pages=1) as span:
+        regions = find_text_regions(image) if crop_to_text else []
+        if regions:
+            span["regions"] = len(regions)
+            crops = [crop_text_region(image, region) for region in regions]
+            if executor is None:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(crops), OCR_ENGINE_POOL_SIZE)) as pool:
+                    texts = list(pool.map(engine.image_to_string, crops))
+            else:
+                texts = list(executor.map(engine.image_to_string, crops))
+            text = "\n".join(text.strip() for text in texts if text.strip())
+        else:
+            text = engine.image_to_string(image)
+        span["chars"] = len(text)
     return [text]
 
-def extract_text_from_pdf(file, force_ocr=False):
-    """Extracts text from a PDF file, returning a list of strings (one per page)."""
-    file.seek(0)
-    pdf_bytes = file.read()
+def ocr_render_dpi(page):
+    """
+    Picks the resolution to render a PDF page at for OCR.
+    Pages with a text layer are rendered so that their median font size comes
+    out OCR_TARGET_TEXT_PX tall. Scanned pages are rendered at the resolution
+    of their scan, as rendering above it adds no detail. The result is clamped
+    to OCR_MIN_DPI..OCR_MAX_DPI and lowered for oversized pages.
+    """
+    dpi = OCR_DPI
+    sizes = [
+        span["size"]
+        for block in page.get_text("dict")["blocks"]
+        for line in block.get("lines", ())
+        for span in line["spans"]
+        if span["text"].strip()
+    ]
+    if sizes:
+        dpi = OCR_TARGET_TEXT_PX * 72 / statistics.median(sizes)
+    else:
+        scan_dpis = [
+            info["width"] * 72 / (info["bbox"][2] - info["bbox"][0])
+            for info in page.get_image_info()
+            if info["bbox"][2] > info["bbox"][0]
+        ]
+        if scan_dpis:
+            dpi = max(scan_dpis)
+    dpi = min(max(dpi, OCR_MIN_DPI), OCR_MAX_DPI)
+    area = (page.rect.width / 72) * (page.rect.height / 72)  # In square inches
+    if area > 0:
+        dpi = min(dpi, (OCR_MAX_PAGE_PIXELS / area) ** 0.5)
+    return int(dpi)
+
+def render_pdf_page(page, dpi=None):
+    """Renders a PDF page in-process to a grayscale numpy array, at ocr_render_dpi(page) unless dpi is given."""
+    with timed_stage("pdf_rasterize", pages=1):
+        pixmap = page.get_pixmap(dpi=dpi or ocr_render_dpi(page), colorspace=fitz.csGRAY, alpha=False)
+        gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+    return gray[:, :pixmap.width]
+
+def process_gray_for_ocr(gray, threshold_value=None):
+    """
+    Applies the sharpening and threshold steps of process_image_for_ocr to a
+    grayscale numpy array. Without a threshold_value, Otsu's threshold is used.
+    """
+    sharpened = sharpen(gray)
+    if threshold_value is None:
+        threshold_value, _ = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    elif threshold_value == AUTO_THRESHOLD:
+        threshold_value = choose_threshold(sharpened)
+    return apply_threshold(sharpened, threshold_value)
+
+def ocr_pdf_page(pdf_path, number):
+    """
+    Renders, pre-processes and OCRs a 1-based PDF page. Runs in a worker, which
+    opens the document on its own and keeps its OCR engine warm between pages.
+    """
+    with fitz.open(pdf_path) as doc:
+        gray = render_pdf_page(doc[number - 1])
+    return get_ocr_engine().image_to_string(process_gray_for_ocr(gray))
+
+def ocr_pdf_pages(pdf_path, page_numbers, max_in_flight=OCR_MAX_IN_FLIGHT_PAGES, executor=None):
+    """
+    OCRs pages of a PDF in parallel while bounding memory use.
+    Each page is rendered and OCR'd by its own task on the executor, so page
+    images never pass between processes; at most max_in_flight pages are in
+    progress at any time.
+    Args:
+        pdf_path: The path of the PDF file.
+        page_numbers: The 1-based page numbers to OCR.
+        max_in_flight: The maximum number of pages in progress at once.
+        executor: A concurrent.futures executor. A process pool sized to the
+            available cores is created for the call if not given.
+    Returns:
+        A list of strings, one per page, in page order.
+    """
+    page_numbers = sorted(page_numbers)
+    if not page_numbers:
+        return []
+    if executor is None:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=OCR_WORKERS) as pool:
+            return ocr_pdf_pages(pdf_path, page_numbers, max_in_flight, pool)
+
+    max_in_flight = max(1, max_in_flight)
+    pending = collections.deque()
+    texts = {}
+
+    with timed_stage("pdf_ocr", pages=len(page_numbers), bytes=os.path.getsize(pdf_path)) as span:
+        for number in page_numbers:
+            if len(pending) >= max_in_flight:
+                done_number, future = pending.popleft()
+                texts[done_number] = future.result()
+            pending.append((number, submit_to_worker(executor, ocr_pdf_page, pdf_path, number)))
+
+        while pending:
+            number, future = pending.popleft()
+            texts[number] = future.result()
+        span["chars"] = sum(len(text) for text in texts.values())
+
+    return [texts[number] for number in page_numbers]
+
+class WorkerPool(concurrent.futures.Executor):
+    """
+    A process pool that replaces itself when it breaks. A worker killed for
+    running out of memory or crashing in Tesseract leaves a
+    ProcessPoolExecutor broken for good; here the pool is recreated, and each
+    task that failed with it is submitted once more.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self._submit(future, fn, args, kwargs, retries=1)
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def _submit(self, future, fn, args, kwargs, retries):
+        pool = self._pool
+        try:
+            task = pool.submit(fn, *args, **kwargs)
+        except concurrent.futures.process.BrokenProcessPool:
+            pool = self._replace(pool)
+            task = pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+
+        def task_done(task):
+            with contextlib.suppress(concurrent.futures.InvalidStateError):  # Cancelled meanwhile
+                if task.cancelled():
+                    future.cancel()
+                elif isinstance(task.exception(), concurrent.futures.process.BrokenProcessPool) and retries:
+                    self._replace(pool)
+                    self._submit(future, fn, args, kwargs, retries - 1)
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+        task.add_done_callback(task_done)
+
+    def _replace(self, broken):
+        # Tasks failing with the same broken pool replace it only once
+        with self._lock:
+            if self._pool is broken:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+                broken.shutdown(wait=False)
+            return self._pool
+
+class SerialExecutor(concurrent.futures.Executor):
+    """Runs each task in the calling thread as it is submitted, for code already running in one of many workers."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+@st.cache_resource
+def get_ocr_executor():
+    """Returns the OCR process pool shared by all sessions on this node."""
+    return WorkerPool(max_workers=OCR_WORKERS)
+
+def page_image_coverage(page):
+    """Returns the fraction (0-1) of a PyMuPDF page's area covered by images."""
+    rect = page.rect
+    page_area = rect.width * rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        # Clip the image to the visible page area
+        width = min(x1, rect.x1) - max(x0, rect.x0)
+        height = min(y1, rect.y1) - max(y0, rect.y0)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(1.0, covered / page_area)
+
+def page_needs_ocr(page, text):
+    """
+    Decides whether a PDF page should be OCR'd instead of using its native text.
+    Args:
+        page: A PyMuPDF page.
+        text: The native text extracted from the page.
+    Returns:
+        True if the page looks scanned (little or no text, or mostly image).
+    """
+    chars = len(text.strip())
+    if chars < OCR_MIN_PAGE_TEXT_CHARS:
+        return True
+    if chars >= OCR_SCANNED_PAGE_MAX_CHARS:
+        return False
+    # Only a little text on a page that is mostly image, e.g. a stamped header on a scan
+    return page_image_coverage(page) >= OCR_SCANNED_IMAGE_COVERAGE
+
+def _choose_page_text(native_text, ocr_text, force_ocr):
+    """Keeps the native text unless OCR was forced or found more text."""
+    if force_ocr or len(ocr_text.strip()) > len(native_text.strip()):
+        return ocr_text
+    return native_text
+
+def extract_native_text_range(pdf_path, first, last):
+    """
+    Reads the native text of the 1-based pages first to last (inclusive).
+    Runs in a worker process, which opens the document on its own.
+    Returns:
+        A list of (text, needs_ocr) tuples, one per page.
+    """
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for number in range(first, last + 1):
+            page = doc[number - 1]
+            text = page.get_text()
+            results.append((text, page_needs_ocr(page, text)))
+    return results
+
+class ParallelPdfText:
+    """
+    Reads the native text of a PDF in page ranges on a process pool.
+    Each worker opens the file from disk, so the PDF is never sent to the
+    workers. Pages become available with get() as their range completes, and
+    progress(done_pages, total_pages) is called when the ranges are submitted
+    and after each range. The file
+    must stay in place until the ranges are done.
+    """
+
+    def __init__(self, pdf_path, page_count, executor, progress=None, range_size=PDF_TEXT_RANGE_PAGES):
+        self.path = pdf_path
+        self.page_count = page_count
+        self.done_pages = 0
+        self._pages = {}  # Page number -> (text, needs_ocr)
+        self._progress = progress
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        ranges = [(first, min(first + range_size - 1, page_count)) for first in range(1, page_count + 1, range_size)]
+        self._pending = len(ranges)
+        self._futures = []
+        if progress is not None:
+            progress(0, page_count)  # So the progress bar shows from the start
+        for first, last in ranges:
+            future = submit_to_worker(executor, extract_native_text_range, self.path, first, last)
+            future.add_done_callback(functools.partial(self._range_done, first, last))
+            self._futures.append(future)
+        if not ranges:
+            self._finished.set()
+
+    def _range_done(self, first, last, future):
+        try:
+            results = future.result()
+        except Exception:
+            results = []  # Pages of a failed range are extracted on their own when needed
+        with self._lock:
+            for number, result in enumerate(results, start=first):
+                self._pages[number] = result
+            self.done_pages += last - first + 1
+            self._pending -= 1
+            finished = self._pending == 0
+            done_pages = self.done_pages
+        try:
+            if self._progress is not None:
+                self._progress(done_pages, self.page_count)
+        finally:
+            if finished:
+                self._finished.set()
+
+    def get(self, number):
+        """Returns the (text, needs_ocr) tuple of a 1-based page, or None if its range isn't done."""
+        return self._pages.get(number)
+
+    def result(self):
+        """Waits for every range and returns the (text, needs_ocr) tuples of all pages in order."""
+        for future in self._futures:
+            future.result()
+        self._finished.wait()
+        return [self._pages[number] for number in range(1, self.page_count + 1)]
+
+    def cancel(self):
+        """Cancels the ranges that haven't started."""
+        for future in self._futures:
+            future.cancel()
+
+def extract_text_from_pdf(file, force_ocr=False, max_in_flight=OCR_MAX_IN_FLIGHT_PAGES, executor=None, text_executor=None, progress=None):
+    """
+    Extracts text from a PDF file, returning a list of strings (one per page).
+    Native text is used for born-digital pages; only pages that look scanned
+    (or every page, if force_ocr is set) are rasterized and OCR'd.
+    With a text_executor (a process pool), the native text of large PDFs is
+    read in page ranges in parallel, and progress(done_pages, total_pages) is
+    called as ranges complete.
+    """
+    with spooled_path(file) as pdf_path:
+        return _extract_text_from_pdf_path(pdf_path, force_ocr, max_in_flight, executor, text_executor, progress)
+
+def _extract_text_from_pdf_path(pdf_path, force_ocr, max_in_flight, executor, text_executor, progress):
+    """Extracts the pages of a PDF file on disk; see extract_text_from_pdf."""
     pages = []
+    ocr_page_numbers = []
 
-    if not force_ocr:
-        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-            for page in doc:
-                pages.append(page.get_text())
+    with timed_stage("pdf_text", bytes=os.path.getsize(pdf_path)) as span, fitz.open(pdf_path) as doc:
+        if force_ocr:
+            pages = [""] * doc.page_count
+            ocr_page_numbers = list(range(1, doc.page_count + 1))
+        elif text_executor is not None and doc.page_count >= PDF_PARALLEL_MIN_PAGES:
+            native = ParallelPdfText(pdf_path, doc.page_count, text_executor, progress=progress)
+            for number, (text, needs_ocr) in enumerate(native.result(), start=1):
+                pages.append(text)
+                if needs_ocr:
+                    ocr_page_numbers.append(number)
+        else:
+            for number, page in enumerate(doc, start=1):
+                text = page.get_text()
+                pages.append(text)
+                if page_needs_ocr(page, text):
+                    ocr_page_numbers.append(number)
+        span["pages"] = len(pages)
+        span["chars"] = sum(len(page) for page in pages)
 
-    total_text_len = sum(len(p.strip()) for p in pages)
-    
-    # Fallback to OCR if forced, or if extracted text is empty/sparse
-    if force_ocr or total_text_len < 50:
-        images = convert_from_bytes(pdf_bytes)
-        pages = []
-        for image in images:
-            pages.append(pytesseract.image_to_string(image))
+    if ocr_page_numbers:
+        ocr_texts = ocr_pdf_pages(pdf_path, ocr_page_numbers, max_in_flight, executor)
+        for number, ocr_text in zip(ocr_page_numbers, ocr_texts):
+            pages[number - 1] = _choose_page_text(pages[number - 1], ocr_text, force_ocr)
 
     return pages
 
-def extract_text_from_docx(file):
-    """Extracts text from a DOCX file, returning a list of strings (chunked)."""
+def extract_pdf_page(pdf_path, number, force_ocr=False, executor=None, native=None):
+    """
+    Extracts the text of a single 1-based PDF page, OCR'ing it if it looks scanned.
+    native can be the page's (text, needs_ocr) tuple if it was already read.
+    """
+    text = ""
+    if native is not None and not force_ocr:
+        text, needs_ocr = native
+        if not needs_ocr:
+            return text
+    elif not force_ocr:
+        with timed_stage("pdf_text", pages=1) as span:
+            with fitz.open(pdf_path) as doc:
+                page = doc[number - 1]
+                text = page.get_text()
+                needs_ocr = page_needs_ocr(page, text)
+            span["chars"] = len(text)
+        if not needs_ocr:
+            return text
+
+    ocr_text = ocr_pdf_pages(pdf_path, [number], max_in_flight=1, executor=executor)[0]
+    return _choose_page_text(text, ocr_text, force_ocr)
+
+class SessionStore:
+    """
+    A per-session temporary directory for large data kept out of memory, such
+    as full-resolution image stages and page texts. The directory is removed by
+    clear(), or when the store is garbage collected with its session.
+    """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="tts-session-")
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def put_text(self, key, text):
+        with open(self._path(key), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def get_text(self, key):
+        with open(self._path(key), encoding="utf-8") as f:
+            return f.read()
+
+    def put_array(self, key, array):
+        np.save(self._path(key + ".npy"), array)
+
+    def get_array(self, key):
+        """Returns a read-only, memory-mapped view of a stored array, or None."""
+        path = self._path(key + ".npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def delete(self, key):
+        for path in (self._path(key), self._path(key + ".npy")):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self):
+        """Removes everything stored for the session."""
+        for name in os.listdir(self.directory):
+            os.remove(self._path(name))
+
+    def size_bytes(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory))
+
+class _PendingPage:
+    """Placeholder for a page that has not been extracted yet."""
+
+    def __init__(self, number):
+        self.number = number
+
+class _StoredPage:
+    """Placeholder for a page whose text lives in a SessionStore."""
+
+    def __init__(self, key, length):
+        self.key = key
+        self.length = length
+
+class LazyPages(collections.abc.MutableSequence):
+    """
+    A list of page texts that are only extracted when first accessed.
+    Reading a page extracts it on demand (or picks up a prefetched result) and
+    schedules the next few pending pages on the prefetch executor. Pages can be
+    edited and deleted like a normal list, so the pagination callbacks and the
+    audio generation work unchanged on top of it. With a SessionStore, page
+    texts are written to disk and read back on access instead of being kept
+    in memory.
+    """
+
+    def __init__(self, page_count, load_page, prefetch=DEFAULT_PREFETCH_PAGES, executor=None, store=None, futures=None):
+        """
+        Args:
+            page_count: The number of pages in the document.
+            load_page: A function taking a 1-based page number and returning its text.
+            prefetch: How many pending pages after the one being read to extract ahead.
+            executor: A concurrent.futures executor for prefetching. Without one,
+                pages are only extracted when read.
+            store: An optional SessionStore to keep page texts in.
+            futures: An optional dict of 1-based page numbers to futures of the
+                texts of pages already being extracted elsewhere.
+        """
+        self._slots = [_PendingPage(number) for number in range(1, page_count + 1)]
+        self._load_page = load_page
+        self._prefetch = prefetch
+        self._executor = executor
+        self._store = store
+        self._futures = dict(futures or {})
+        self._lock = threading.Lock()  # Pages can be loaded by page_sources() in other threads
+
+    @classmethod
+    def from_texts(cls, texts, store=None):
+        """Creates a LazyPages holding already extracted texts."""
+        pages = cls(0, None, store=store)
+        pages.extend(texts)
+        return pages
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        value = self._slots[index]
+        if isinstance(value, _PendingPage):
+            slot = value
+            value = self._load(slot.number)
+            self._fill(slot, value)
+        elif isinstance(value, _StoredPage):
+            value = self._store.get_text(value.key)
+        self._schedule_prefetch(index)
+        return value
+
+    def __setitem__(self, index, value):
+        self._discard(self._slots[index])
+        self._slots[index] = self._stored(value)
+
+    def __delitem__(self, index):
+        self._discard(self._slots[index])
+        del self._slots[index]
+
+    def insert(self, index, value):
+        self._slots.insert(index, self._stored(value))
+
+    def peek(self, index):
+        """Returns the text of a page if it has been extracted or prefetched, else None, without extracting it."""
+        value = self._slots[index]
+        if isinstance(value, _PendingPage):
+            future = self._futures.get(value.number)
+            if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+                return None
+            text = self._load(value.number)
+            self._fill(value, text)
+            return text
+        if isinstance(value, _StoredPage):
+            return self._store.get_text(value.key)
+        return value
+
+    def page_sources(self):
+        """
+        Returns the pages as they are now, without extracting any: the text of
+        pages already extracted, and for pending pages a function that
+        extracts the page and returns its text. The functions can be called in
+        another thread; the pages they extract are kept here unless edited or
+        deleted meanwhile.
+        """
+        sources = []
+        for slot in self._slots:
+            if isinstance(slot, _PendingPage):
+                sources.append(functools.partial(self._load_pending, slot))
+            elif isinstance(slot, _StoredPage):
+                sources.append(self._store.get_text(slot.key))
+            else:
+                sources.append(slot)
+        return sources
+
+    def release(self):
+        """Removes all pages, deleting their stored texts."""
+        for slot in self._slots:
+            self._discard(slot)
+        self._slots = []
+        self._futures = {}
+
+    def memory_size(self):
+        """Returns the approximate number of bytes of page text held in memory."""
+        return sum(sys.getsizeof(slot) for slot in self._slots if isinstance(slot, str))
+
+    def _stored(self, text):
+        if self._store is None:
+            return text
+        key = f"page-{uuid.uuid4().hex}"
+        self._store.put_text(key, text)
+        return _StoredPage(key, len(text))
+
+    def _load_pending(self, slot):
+        text = self._load(slot.number)
+        self._fill(slot, text)
+        return text
+
+    def _fill(self, slot, text):
+        # Replaces a pending slot with its text, if it is still there
+        with self._lock:
+            for index, current in enumerate(self._slots):
+                if current is slot:
+                    self._slots[index] = self._stored(text)
+                    return
+
+    def _discard(self, slot):
+        if isinstance(slot, _StoredPage):
+            self._store.delete(slot.key)
+
+    def _load(self, number):
+        future = self._futures.pop(number, None)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # Retry in the foreground so the error surfaces to the caller
+        return self._load_page(number)
+
+    def _schedule_prefetch(self, index):
+        if self._executor is None:
+            return
+        if index < 0:
+            index += len(self._slots)
+        for slot in self._slots[index + 1:index + 1 + self._prefetch]:
+            if isinstance(slot, _PendingPage) and slot.number not in self._futures:
+                self._futures[slot.number] = self._executor.submit(self._load_page, slot.number)
+
+def open_pdf_pages(file, force_ocr=False, ocr_executor=None, prefetch_executor=None, prefetch=DEFAULT_PREFETCH_PAGES, cache=None, store=None, boilerplate=None, text_executor=None, progress=None):
+    """
+    Opens a PDF for lazy extraction, returning a LazyPages of cleaned page texts.
+    Only the page count is read up front; pages are extracted when accessed.
+    If a cache is given, extracted pages are stored in it keyed by the file
+    content, so reopening the same file skips extraction for pages seen before.
+    The PDF is spooled to a file that is kept while the pages are in use, in
+    the SessionStore if one is given; extracted page texts are kept there too.
+    If a BoilerplateFilter is given, it is indexed with the native text of a
+    sample of pages, and strips the headers and footers of each loaded page.
+    With a text_executor (a process pool), the native text of large PDFs is
+    read in parallel page ranges in the background, calling
+    progress(done_pages, total_pages) as ranges complete; pages read before
+    their range is done are extracted on their own.
+    """
+    directory = store.directory if store is not None else tempfile.gettempdir()
+    pdf_path = os.path.join(directory, f"tts-upload-{uuid.uuid4().hex}.pdf")
+    content_hash = spool_file(file, pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if boilerplate is not None:
+            step = max(1, page_count / BOILERPLATE_SAMPLE_PAGES)
+            sample = sorted({int(i * step) for i in range(min(page_count, BOILERPLATE_SAMPLE_PAGES))})
+            boilerplate.add_pages(clean_text(doc[index].get_text()) for index in sample)
+    native = None
+    if text_executor is not None and not force_ocr and page_count >= PDF_PARALLEL_MIN_PAGES:
+        native = ParallelPdfText(pdf_path, page_count, text_executor, progress=progress)
+
+    def extract(number):
+        known = native.get(number) if native is not None else None
+        if known is not None:
+            return extract_pdf_page(pdf_path, number, force_ocr, ocr_executor, native=known)
+        return extract_pdf_page(pdf_path, number, force_ocr, ocr_executor)
+
+    def load_page(number):
+        if cache is None:
+            text = extract(number)
+        else:
+            key = extraction_cache_key(content_hash, kind="pdf_page", page=number, force_ocr=force_ocr)
+            text = cached_extraction(cache, key, lambda: [extract(number)])[0]
+        text = clean_text(text)
+        if boilerplate is not None:
+            text = boilerplate.strip(text)
+        return text
+
+    pages = LazyPages(page_count, load_page, prefetch=prefetch, executor=prefetch_executor, store=store)
+    weakref.finalize(pages, _remove_quietly, pdf_path)  # The spooled PDF lives as long as its pages
+    return pages
+
+def _remove_quietly(path):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+def photo_capture_time(path):
+    """Returns the EXIF capture time of a photo as a sortable "YYYY:MM:DD HH:MM:SS" string, or None."""
+    try:
+        with Image.open(path) as image:  # Reads the header only
+            exif = image.getexif()
+            return exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)  # DateTimeOriginal, else DateTime
+    except Exception:
+        return None
+
+def ocr_photo(path, threshold_value=128):
+    """
+    Pre-processes and OCRs a photo file, one text block at a time. Runs in a
+    worker; the workers already use every core, so the threshold candidates
+    and text blocks are OCR'd one after another rather than in threads.
+    """
+    serial = SerialExecutor()
+    image = process_image_file_for_ocr(path, threshold_value, executor=serial)
+    return extract_text_from_image(image, crop_to_text=True, executor=serial)[0]
+
+def _cancel_futures(futures):
+    for future in futures:
+        future.cancel()
+
+def read_image_file(file, threshold_value, store, cache=None):
+    """
+    Reads the text of a single uploaded image, keeping its previews in session
+    state for the processed image panel. The threshold-independent stages go
+    to the SessionStore, so moving the threshold slider only re-applies the
+    threshold. The text is cached by file content and threshold; on a cache
+    hit the image is still prepared for the previews and the slider, but not
+    OCR'd again, and the auto threshold picked before is reused.
+    Returns:
+        A list with the page text.
+    """
+    key = extraction_cache_key(file_content_hash(file), kind="image", threshold=threshold_value)
+    cached = cache.get(key) if cache is not None else None
+    sharpened = store.get_array("sharpened")
+    if sharpened is None:
+        # The full-resolution array goes to disk; session state only keeps small previews
+        with spooled_path(file) as image_path:
+            sharpened = prepare_image_file_for_threshold(image_path)
+            st.session_state.original_preview = make_file_preview(image_path)
+        store.put_array("sharpened", sharpened)
+        store.put_array("sharpened_preview", downscale_array(sharpened))
+
+    applied_threshold = threshold_value
+    if threshold_value == AUTO_THRESHOLD:
+        picked = cache.get(f"{key}-threshold") if cached is not None else None
+        applied_threshold = int(picked) if picked is not None else choose_threshold(sharpened)
+        st.session_state.auto_threshold_value = applied_threshold
+    processed_image = apply_threshold(sharpened, applied_threshold)
+    st.session_state.processed_preview = make_preview(processed_image, image_format="PNG")
+    st.session_state.last_preview_threshold = threshold_value
+
+    if cached is not None:
+        return json.loads(cached)
+    pages = extract_text_from_image(processed_image, crop_to_text=True)
+    if cache is not None:
+        if threshold_value == AUTO_THRESHOLD:
+            cache.put(f"{key}-threshold", str(applied_threshold).encode("utf-8"))
+        cache.put(key, json.dumps(pages).encode("utf-8"))
+    return pages
+
+def open_photo_pages(files, threshold_value=128, executor=None, store=None, cache=None, progress=None):
+    """
+    Opens several photos as the pages of one document, returning a LazyPages of cleaned page texts.
+    Photos are spooled to disk (to the SessionStore if one is given) and put
+    in capture order when every photo has an EXIF capture time, else in upload
+    order. All of them are submitted to the executor at once; reading a page
+    waits only for its own photo, so pages are available as each one finishes.
+    Args:
+        files: The uploaded photo files.
+        threshold_value: The threshold for every photo, or AUTO_THRESHOLD.
+        executor: A concurrent.futures executor, e.g. get_ocr_executor().
+            Photos are OCR'd when their page is read if not given.
+        store: An optional SessionStore for the photos and page texts.
+        cache: An optional DiskCache of extraction results, shared with single photos.
+        progress: An optional function called with (done_photos, total_photos).
+    """
+    directory = store.directory if store is not None else tempfile.gettempdir()
+    photos = []
+    for index, file in enumerate(files):
+        extension = os.path.splitext(getattr(file, "name", ""))[1].lower() or ".jpg"
+        path = os.path.join(directory, f"tts-upload-{uuid.uuid4().hex}{extension}")
+        content_hash = spool_file(file, path)
+        photos.append((photo_capture_time(path), index, path, content_hash))
+    if all(photo[0] is not None for photo in photos):
+        photos.sort()
+
+    keys = [extraction_cache_key(content_hash, kind="image", threshold=threshold_value) for *_, content_hash in photos]
+    cached = [cache.get(key) if cache is not None else None for key in keys]
+    done = [sum(data is not None for data in cached)]
+    lock = threading.Lock()
+
+    def photo_done(key, page_future, future):
+        if not future.cancelled() and future.exception() is None:
+            if cache is not None:
+                cache.put(key, json.dumps([future.result()]).encode("utf-8"))
+            page_future.set_result(clean_text(future.result()))
+        else:
+            page_future.set_exception(RuntimeError("photo was not read"))  # Read in the foreground instead
+        with lock:
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(photos))
+
+    if progress is not None:
+        progress(done[0], len(photos))
+    futures = []
+    page_futures = {}  # Page number -> future of the cleaned text, which LazyPages picks up
+    for number, ((_, _, path, _), key, data) in enumerate(zip(photos, keys, cached), start=1):
+        page_future = concurrent.futures.Future()
+        if data is not None:
+            page_future.set_result(clean_text(json.loads(data)[0]))
+        elif executor is not None:
+            future = submit_to_worker(executor, ocr_photo, path, threshold_value)
+            future.add_done_callback(functools.partial(photo_done, key, page_future))
+            futures.append(future)
+        else:
+            continue
+        page_futures[number] = page_future
+
+    def load_page(number):
+        # Photos not OCR'd in the pool, or whose OCR failed there, are read in the foreground
+        return clean_text(ocr_photo(photos[number - 1][2], threshold_value))
+
+    pages = LazyPages(len(photos), load_page, store=store, futures=page_futures)
+    weakref.finalize(pages, _cancel_futures, futures)
+    for _, _, path, _ in photos:
+        weakref.finalize(pages, _remove_quietly, path)
+    return pages
+
+@st.cache_resource
+def get_prefetch_executor():
+    """Returns the thread pool used to extract pages ahead of the viewer."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="prefetch")
+
+def iter_docx_paragraphs(file):
+    """
+    Yields the text of each paragraph of a DOCX file in document order,
+    including the paragraphs inside table cells. The paragraphs of a text box
+    follow the paragraph it is anchored in. Text boxes are stored twice, as
+    DrawingML and as a VML fallback for old readers; only the first is read.
+    word/document.xml is parsed incrementally and finished elements are
+    discarded, so memory use does not grow with the size of the document.
+    """
     file.seek(0)
-    doc = docx.Document(file)
-    pages = []
+    with zipfile.ZipFile(file) as archive, archive.open("word/document.xml") as xml:
+        body = None
+        open_paragraphs = []  # Text parts of the paragraphs being read; text boxes nest them
+        boxed_paragraphs = []  # For each paragraph being read, the finished paragraphs of its text boxes
+        in_properties = 0  # Inside paragraph properties, whose w:tab elements are tab stops
+        in_fallback = 0  # Inside an mc:Fallback, a copy of content already read
+        for event, element in ET.iterparse(xml, events=("start", "end")):
+            tag = element.tag
+            if tag == MARKUP_COMPATIBILITY_NAMESPACE + "Fallback":
+                in_fallback += 1 if event == "start" else -1
+                continue
+            if in_fallback:
+                continue
+            if event == "start":
+                if tag == WORD_NAMESPACE + "p":
+                    open_paragraphs.append([])
+                    boxed_paragraphs.append([])
+                elif tag == WORD_NAMESPACE + "pPr":
+                    in_properties += 1
+                elif tag == WORD_NAMESPACE + "body":
+                    body = element
+                continue
+
+            if tag == WORD_NAMESPACE + "pPr":
+                in_properties -= 1
+            elif not open_paragraphs or in_properties:
+                pass
+            elif tag == WORD_NAMESPACE + "t":
+                open_paragraphs[-1].append(element.text or "")
+            elif tag == WORD_NAMESPACE + "tab":
+                open_paragraphs[-1].append("\t")
+            elif tag in (WORD_NAMESPACE + "br", WORD_NAMESPACE + "cr"):
+                open_paragraphs[-1].append("\n")
+            elif tag == WORD_NAMESPACE + "p":
+                paragraphs = ["".join(open_paragraphs.pop()), *boxed_paragraphs.pop()]
+                if open_paragraphs:
+                    boxed_paragraphs[-1].extend(paragraphs)  # In a text box; read after its anchor
+                else:
+                    yield from paragraphs
+
+            if tag in (WORD_NAMESPACE + "p", WORD_NAMESPACE + "tc", WORD_NAMESPACE + "tbl"):
+                element.clear()
+                if body is not None and not open_paragraphs:
+                    body.clear()  # Detach the finished blocks so they can be freed
+
+def iter_docx_chunks(file, max_chars=DOCX_CHUNK_CHARS):
+    """Yields the text of a DOCX file as chunks of whole paragraphs of about max_chars characters."""
     current_chunk = ""
-    for para in doc.paragraphs:
-        para_text = para.text + "\n"
-        if len(current_chunk) + len(para_text) > 1000 and current_chunk:
-             pages.append(current_chunk)
-             current_chunk = para_text
+    for paragraph in iter_docx_paragraphs(file):
+        para_text = paragraph + "\n"
+        if len(current_chunk) + len(para_text) > max_chars and current_chunk:
+            yield current_chunk
+            current_chunk = para_text
         else:
-             current_chunk += para_text
-    
+            current_chunk += para_text
     if current_chunk:
-        pages.append(current_chunk)
-        
+        yield current_chunk
+
+def extract_text_from_docx(file):
+    """Extracts text from a DOCX file, returning a list of strings (chunked)."""
+    with timed_stage("docx") as span:
+        pages = list(iter_docx_chunks(file))
+        span["pages"] = len(pages)
+        span["chars"] = sum(len(page) for page in pages)
+
     return pages
 
 def clean_text(text):
     """Cleans extracted text by removing excessive newlines and whitespace."""
-    # Replace multiple newlines with a single newline
-    text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
+    with timed_stage("clean_text", chars=len(text)):
+        # Replace multiple newlines with a single newline
+        text = "\n".join([line.strip() for line in text.splitlines() if line.strip()])
     return text
 
-async def generate_audio(text, voice):
-    """Generates audio from text using edge-tts."""
-    communicate = edge_tts.Communicate(text, voice)
-    audio_data = b""
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_data += chunk["data"]
-    return audio_data
+def boilerplate_key(line):
+    """
+    Normalizes a line for counting repeats. Page numbers like "Page 3 of 9"
+    match whether they are Arabic or Roman ("- iv -", "- 12 -"); other lines
+    only match lines with the same text, so table rows that differ in their
+    numbers don't.
+    """
+    line = " ".join(line.split())
+    page_number = PAGE_NUMBER_RE.match(line)
+    if page_number:
+        return (line[:page_number.start("number")] + "#" + line[page_number.end("number"):]).lower()
+    return line
+
+def repair_hyphenation(text):
+    """Joins words hyphenated across a line break, e.g. "synthe-\nsis" becomes "synthesis"."""
+    return HYPHENATED_LINE_END_RE.sub("", text)
+
+def _edge_line_count(lines):
+    """Returns how many lines at each edge of a page can be a header or footer."""
+    # On a short page the lines near the edges are mostly the body itself
+    return BOILERPLATE_EDGE_LINES if len(lines) > 2 * BOILERPLATE_EDGE_LINES else 1
+
+class BoilerplateFilter:
+    """
+    Removes running headers, footers and page numbers from cleaned page texts.
+    Pages added with add_pages build a frequency index of the lines near their
+    top and bottom. strip then peels lines off both edges of a page for as long
+    as they repeat on enough pages of the document, so body text is never
+    touched, and repairs end-of-line hyphenation. Page numbers are removed the
+    same way: their number doesn't count, but a lone "2024" or "MIX" that only
+    looks like one is kept unless such lines are on most pages. Short pages
+    only have their first and last line looked at, and no page is stripped
+    to nothing.
+    The number of characters removed is kept for reporting.
+    """
+
+    def __init__(self):
+        self.page_count = 0
+        self.line_pages = collections.Counter()  # Line key -> number of pages it appears on
+        self.chars_removed = 0
+        self.lines_removed = 0
+        self._lock = threading.Lock()
+
+    def add_pages(self, pages):
+        """Counts the edge lines of the given page texts."""
+        for text in pages:
+            lines = text.splitlines()
+            edge_lines = _edge_line_count(lines)
+            edges = lines[:edge_lines] + lines[edge_lines:][-edge_lines:]
+            self.line_pages.update({boilerplate_key(line) for line in edges if line.strip()})
+            self.page_count += 1
+
+    def is_boilerplate(self, line):
+        """Returns whether a line, or a page number of its form, repeats on enough pages."""
+        pages = self.line_pages.get(boilerplate_key(line), 0)
+        return pages >= BOILERPLATE_MIN_PAGES and pages >= BOILERPLATE_MIN_FRACTION * self.page_count
+
+    def strip(self, text):
+        """Returns the page text without its boilerplate edge lines, with hyphenation repaired."""
+        with timed_stage("boilerplate", pages=1) as span:
+            lines = text.splitlines()
+            edge_lines = _edge_line_count(lines)
+            start, end = 0, len(lines)
+            while start < end and start < edge_lines and self.is_boilerplate(lines[start]):
+                start += 1
+            while end > start and len(lines) - end < edge_lines and self.is_boilerplate(lines[end - 1]):
+                end -= 1
+            if start == end:
+                start, end = 0, len(lines)  # Everything repeats, so it is content (e.g. a form), not boilerplate
+            removed = lines[:start] + lines[end:]
+            span["chars"] = sum(len(line) for line in removed)
+            with self._lock:
+                self.chars_removed += span["chars"]
+                self.lines_removed += len(removed)
+        return repair_hyphenation("\n".join(lines[start:end]))
+
+    def seconds_saved(self):
+        """Estimates how many seconds of audio the removed characters would have taken."""
+        return self.chars_removed / SPEECH_CHARS_PER_SECOND
+
+def remove_boilerplate(pages):
+    """
+    Removes the headers, footers and page numbers repeated across a document.
+    Args:
+        pages: A list of cleaned page texts.
+    Returns:
+        A (pages, boilerplate_filter) tuple; the filter holds what was removed.
+    """
+    boilerplate_filter = BoilerplateFilter()
+    boilerplate_filter.add_pages(pages)
+    return [boilerplate_filter.strip(page) for page in pages], boilerplate_filter
+
+class DiskCache:
+    """
+    A size-bounded, content-addressed cache of byte blobs stored as files.
+    Entries are written atomically (temp file + rename) so concurrent readers
+    never see partial data, and evicted least-recently-used first, using the
+    file modification time as the access time. Once over max_bytes, entries
+    are evicted down to CACHE_EVICT_TO_FRACTION of it, so the directory is
+    scanned once per batch of writes rather than on every write. Safe to
+    share between sessions and between processes pointing at the same directory.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._approx_size = self._total_size()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _entries(self):
+        """Returns (mtime, size, path) for every cached entry."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue  # Lock file and in-progress writes
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _total_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        """Returns the cached bytes for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Stores data under key and evicts old entries if over the size limit."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._approx_size += len(data)
+            if self._approx_size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Removes least-recently-used entries until the cache is back under its low-water mark."""
+        lock_file = open(os.path.join(self.directory, ".lock"), "w")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                self._approx_size = total  # Another process evicted meanwhile
+                return
+            for _, size, path in entries:
+                if total <= self.max_bytes * CACHE_EVICT_TO_FRACTION:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._approx_size = total
+        finally:
+            lock_file.close()  # Also releases the flock
+
+def normalize_text_for_cache(text):
+    """Collapses whitespace so formatting-only edits don't change cache keys."""
+    return " ".join(text.split())
+
+def audio_cache_key(text, voice, options=None):
+    """Returns the cache key for the audio of a chunk of text."""
+    payload = json.dumps(
+        {"text": normalize_text_for_cache(text), "voice": voice, "options": options or {}},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@st.cache_resource
+def get_audio_cache():
+    """Returns the audio cache shared by all sessions on this node."""
+    return DiskCache(os.path.join(CACHE_ROOT, "audio"), AUDIO_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_job_results_cache():
+    """
+    Returns the cache of finished audio jobs' MP3s on this node. It is kept
+    apart from the audio cache, so these one-off copies don't evict the chunk
+    audio that later generations reuse.
+    """
+    return DiskCache(os.path.join(CACHE_ROOT, "jobs"), JOB_RESULTS_CACHE_MAX_BYTES)
+
+def file_content_hash(file):
+    """Returns the SHA-256 hex digest of an uploaded file's content."""
+    file.seek(0)
+    hasher = hashlib.sha256()
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        hasher.update(block)
+    file.seek(0)
+    return hasher.hexdigest()
+
+def extraction_cache_key(content_hash, **params):
+    """Returns the cache key for extraction results of a file with the given parameters."""
+    payload = json.dumps(
+        {"file": content_hash, "params": params, "version": EXTRACTION_CACHE_VERSION},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def cached_extraction(cache, key, extract):
+    """
+    Returns the cached list of page texts for key, or calls extract() and caches its result.
+    Args:
+        cache: A DiskCache, or None to always extract.
+        key: The key from extraction_cache_key.
+        extract: A function returning a list of page strings.
+    """
+    if cache is not None:
+        data = cache.get(key)
+        if data is not None:
+            return json.loads(data)
+    pages = extract()
+    if cache is not None:
+        cache.put(key, json.dumps(pages).encode("utf-8"))
+    return pages
+
+@st.cache_resource
+def get_extraction_cache():
+    """Returns the extraction cache shared by all sessions on this node."""
+    return DiskCache(os.path.join(CACHE_ROOT, "extraction"), EXTRACTION_CACHE_MAX_BYTES)
+
+def _split_long_paragraph(paragraph, max_chars):
+    """Splits a paragraph longer than max_chars into sentence-sized parts."""
+    parts = []
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            # No sentence boundary close enough, fall back to the last space
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            parts.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            parts.append(sentence)
+    return parts
+
+def split_text_into_chunks(text, max_chars=TTS_CHUNK_CHARS, first_chunk_chars=None):
+    """
+    Splits text into chunks for synthesis, breaking at paragraph boundaries
+    where possible and at sentence boundaries for very long paragraphs.
+    Args:
+        text: The text to split.
+        max_chars: The maximum length of a single chunk.
+        first_chunk_chars: An optional smaller maximum for the first chunk.
+    Returns:
+        A list of non-empty strings, in document order.
+    """
+    chunks = []
+    current = []
+    current_len = 0
+    first_limit = min(max_chars, first_chunk_chars or max_chars)
+    for paragraph in text.splitlines():
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if first_limit < max_chars and not chunks and not current and len(paragraph) > first_limit:
+            # The first chunk is cut from the start of a long first paragraph
+            head = _split_long_paragraph(paragraph, first_limit)[0]
+            chunks.append(head)
+            paragraph = paragraph[len(head):].strip()
+            if not paragraph:
+                continue
+        if len(paragraph) > max_chars:
+            pieces = _split_long_paragraph(paragraph, max_chars)
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            if current and current_len + len(piece) + 1 > (max_chars if chunks else first_limit):
+                chunks.append("\n".join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks
+
+async def synthesize_chunk(text, voice, options=None, boundaries=None):
+    """
+    Synthesizes a single chunk of text with edge-tts, returning MP3 bytes.
+    If a boundaries list is given, the sentence (or word) boundary events of
+    the stream are appended to it as dicts with type, offset and duration in
+    seconds from the start of the chunk, and text.
+    """
+    with timed_stage("tts_request", chars=len(text), voice=voice) as span:
+        communicate = edge_tts.Communicate(text, voice, **(options or {}))
+        segments = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                segments.append(chunk["data"])
+            elif boundaries is not None and chunk["type"].endswith("Boundary"):
+                boundaries.append({
+                    "type": chunk["type"],
+                    "offset": chunk["offset"] / TTS_BOUNDARY_TICKS_PER_SECOND,
+                    "duration": chunk["duration"] / TTS_BOUNDARY_TICKS_PER_SECOND,
+                    "text": chunk["text"],
+                })
+        audio = b"".join(segments)
+        span["bytes"] = len(audio)
+    return audio
+
+def is_transient_tts_error(error):
+    """
+    Returns whether a failed edge-tts stream is worth retrying: dropped
+    connections, throttling and timeouts are, while errors about the request
+    itself (e.g. NoAudioReceived for text with nothing to speak, or a bad
+    voice) fail the same way every time.
+    """
+    transient = [ConnectionError, TimeoutError, asyncio.TimeoutError]
+    for module, name in (("aiohttp", "ClientError"), ("edge_tts.exceptions", "WebSocketError")):
+        try:
+            error_type = getattr(importlib.import_module(module), name)
+        except (ImportError, AttributeError):
+            continue  # Not installed, or replaced by a stand-in
+        if isinstance(error_type, type) and issubclass(error_type, BaseException):
+            transient.append(error_type)
+    return isinstance(error, tuple(transient))
+
+class SynthesisScheduler:
+    """
+    Shares the edge-tts streams of a process between all sessions.
+    At most max_concurrency streams are open at once. Requests beyond that
+    wait in one queue per session, and the queues are served round-robin, so
+    a long document doesn't hold up the other sessions. After a failed
+    stream, streams are held back for a pause that doubles with every failure
+    in a row, and goes back to none after a success. Thread-safe; requests can
+    come from any event loop.
+    """
+
+    def __init__(self, max_concurrency=TTS_GLOBAL_CONCURRENCY, backoff=TTS_RETRY_BASE_SECONDS, max_backoff=TTS_RETRY_MAX_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {"streams": 0, "failures": 0, "max_active": 0}
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = collections.OrderedDict()  # Session -> deque of (loop, future), in serving order
+        self._failures_in_row = 0
+        self._resume_at = 0.0
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session=None):
+        """Holds one of the streams while the block runs. session identifies the queue to wait in."""
+        await self._acquire(session)
+        try:
+            pause = self._resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            yield
+        finally:
+            self._release()
+
+    def succeeded(self):
+        with self._lock:
+            self._failures_in_row = 0
+
+    def failed(self):
+        """Records a failed stream and returns the pause before streams start again."""
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures_in_row += 1
+            pause = min(self.max_backoff, self.backoff * 2 ** (self._failures_in_row - 1))
+            self._resume_at = max(self._resume_at, time.monotonic() + pause)
+            return pause
+
+    async def _acquire(self, session):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                self._count_stream()
+                return
+            future = loop.create_future()
+            self._waiting.setdefault(session, collections.deque()).append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._waiting.get(session)
+                if queue is not None and (loop, future) in queue:
+                    queue.remove((loop, future))
+                    if not queue:
+                        del self._waiting[session]
+                    raise
+            if future.done() and not future.cancelled():
+                self._release()  # Granted just before the cancellation; pass it on
+            raise  # Otherwise _grant passes it on
+
+    def _release(self):
+        with self._lock:
+            if not self._waiting:
+                self._active -= 1
+                return
+            session, queue = self._waiting.popitem(last=False)
+            loop, future = queue.popleft()
+            if queue:
+                self._waiting[session] = queue  # Back of the line
+            self._count_stream()
+        loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future):
+        if future.cancelled():
+            self._release()
+        else:
+            future.set_result(None)
+
+    def _count_stream(self):
+        self.stats["streams"] += 1
+        self.stats["max_active"] = max(self.stats["max_active"], self._active)
+
+@st.cache_resource
+def get_synthesis_scheduler():
+    """Returns the edge-tts scheduler shared by all sessions on this node."""
+    return SynthesisScheduler()
+
+class AudioIndex:
+    """
+    Where each page and sentence starts in the MP3 assembled by generate_audio,
+    so playback can seek to them without generating anything again. Chunk
+    start times follow from their byte lengths, as edge-tts MP3 has a constant
+    bitrate; times within a chunk come from its boundary events.
+    """
+
+    def __init__(self):
+        self.page_starts = []  # Start time of each page, in seconds
+        self.sentences = []  # (start_seconds, page_index, text), in order
+        self.duration = 0.0
+
+    def build(self, page_count, chunk_pages, segments, boundaries):
+        """
+        Args:
+            page_count: The number of pages, including empty ones.
+            chunk_pages: The page index of each chunk, in order.
+            segments: The MP3 bytes of each chunk.
+            boundaries: The boundary events of each chunk, from synthesize_chunk.
+        """
+        page_starts = []
+        sentences = []
+        offset = 0.0
+        chunk = 0
+        for page in range(page_count):
+            page_starts.append(offset)
+            while chunk < len(chunk_pages) and chunk_pages[chunk] == page:
+                sentences.extend((offset + event["offset"], page, event["text"]) for event in boundaries[chunk])
+                offset += len(segments[chunk]) / TTS_AUDIO_BYTES_PER_SECOND
+                chunk += 1
+        self.page_starts = page_starts
+        self.sentences = sentences
+        self.duration = offset
+
+    def page_at(self, seconds):
+        """Returns the index of the page playing at the given time."""
+        return max(0, bisect.bisect_right(self.page_starts, seconds) - 1)
+
+    def find(self, query):
+        """Returns (start_seconds, page_index) of the first sentence containing query, or None."""
+        query = query.casefold().strip()
+        for start, page, text in self.sentences:
+            if query and query in text.casefold():
+                return start, page
+        return None
+
+def get_cached_chunk(cache, key):
+    """Returns the cached (mp3_bytes, boundaries) of a chunk, or None on a miss."""
+    data = cache.get(key)
+    if data is None:
+        return None
+    boundaries = cache.get(f"{key}-boundaries")
+    return data, json.loads(boundaries) if boundaries is not None else []
+
+def put_cached_chunk(cache, key, data, boundaries):
+    """Caches the MP3 bytes and boundary events of a chunk."""
+    cache.put(key, data)
+    cache.put(f"{key}-boundaries", json.dumps(boundaries).encode("utf-8"))
+
+async def generate_audio(text, voice, max_concurrency=DEFAULT_TTS_CONCURRENCY, cache=None, options=None, progress=None, on_segment=None, index=None, scheduler=None, session=None, page_executor=None):
+    """
+    Generates audio from text using edge-tts.
+    The text is split into chunks which are synthesized concurrently, with at
+    most max_concurrency streams open at once, and stitched back together in order.
+    The first chunk is at most TTS_FIRST_CHUNK_CHARS long and is started
+    first, so the beginning of the document is ready within seconds.
+    A chunk whose stream failed with a transient error (see
+    is_transient_tts_error) is retried on its own, up to TTS_MAX_ATTEMPTS
+    times with exponential backoff; if it still fails, or fails otherwise, the other chunks are finished
+    (and cached) before the error is raised, so generating again only
+    synthesizes the chunks that failed.
+    Args:
+        text: A string, or a list of page strings. Pages are chunked separately so
+            that editing one page leaves the cached audio of the others reusable.
+            A page can also be a function returning its text (see
+            LazyPages.page_sources); such pages are extracted in order, at most
+            TTS_PAGE_LOAD_AHEAD ahead of the page being synthesized.
+        voice: The edge-tts voice name.
+        max_concurrency: The maximum number of concurrent edge-tts streams.
+        cache: An optional DiskCache for per-chunk MP3 segments.
+        options: Optional extra edge-tts settings (rate, volume, pitch).
+        progress: An optional function called with (chunks_done, chunks_total)
+            whenever a chunk finishes.
+        on_segment: An optional function called with (chunk_index, mp3_bytes)
+            whenever a chunk finishes, e.g. AudioJob.add_segment.
+        index: An optional AudioIndex, built once all chunks are done.
+        scheduler: An optional SynthesisScheduler that every stream goes through,
+            shared with other generations.
+        session: The queue of the scheduler to wait in, e.g. the session ID.
+        page_executor: The executor pages given as functions are extracted on,
+            e.g. get_prefetch_executor(). The event loop's default executor if None.
+    Returns:
+        The MP3 audio as bytes.
+    """
+    pages = [text] if isinstance(text, str) else list(text)
+    loop = asyncio.get_running_loop()
+    chunks = []
+    chunk_pages = []
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    cached_chunks = 0
+    done_chunks = 0
+
+    async def synthesize_limited(chunk_text):
+        # Returns the MP3 bytes and boundary events of a chunk
+        nonlocal cached_chunks
+        key = None
+        if cache is not None:
+            # Cache files are read and written off the loop, which is shared by every session's synthesis
+            key = audio_cache_key(chunk_text, voice, options)
+            cached = await loop.run_in_executor(None, get_cached_chunk, cache, key)
+            if cached is not None:
+                cached_chunks += 1
+                return cached
+        async with semaphore:
+            data, boundaries = await synthesize_with_retry(chunk_text)
+        if key is not None and data:
+            await loop.run_in_executor(None, put_cached_chunk, cache, key, data, boundaries)
+        return data, boundaries
+
+    async def synthesize_with_retry(chunk_text):
+        for attempt in range(1, TTS_MAX_ATTEMPTS + 1):
+            boundaries = []
+            try:
+                if scheduler is None:
+                    data = await synthesize_chunk(chunk_text, voice, options, boundaries=boundaries)
+                else:
+                    async with scheduler.slot(session):
+                        data = await synthesize_chunk(chunk_text, voice, options, boundaries=boundaries)
+                    scheduler.succeeded()
+                return data, boundaries
+            except Exception as e:
+                if attempt == TTS_MAX_ATTEMPTS or not is_transient_tts_error(e):
+                    raise
+                if scheduler is None:
+                    await asyncio.sleep(min(TTS_RETRY_MAX_SECONDS, TTS_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+                else:
+                    scheduler.failed()  # The next slot waits out the pause
+
+    async def synthesize_and_report(chunk_index, chunk_text):
+        nonlocal done_chunks
+        data, boundaries = await synthesize_limited(chunk_text)
+        if on_segment is not None:
+            on_segment(chunk_index, data)
+        done_chunks += 1
+        if progress is not None:
+            progress(done_chunks, len(chunks))
+        return data, boundaries
+
+    def load_page(page):
+        # Pages that are already text don't wait on the loop, so their chunks are all known before any finishes
+        return loop.run_in_executor(page_executor, page) if callable(page) else page
+
+    lazy = any(callable(page) for page in pages)
+
+    with timed_stage("synthesis", pages=len(pages), voice=voice) as span:
+        # Chunks are synthesized as soon as their page is there, while the next pages are extracted
+        tasks = []
+        loads = collections.deque()
+        try:
+            for page_index in range(len(pages)):
+                while len(loads) <= TTS_PAGE_LOAD_AHEAD and page_index + len(loads) < len(pages):
+                    loads.append(load_page(pages[page_index + len(loads)]))
+                page = loads.popleft()
+                if isinstance(page, asyncio.Future):
+                    page = await page
+                page_chunks = split_text_into_chunks(page, first_chunk_chars=None if chunks else TTS_FIRST_CHUNK_CHARS)
+                for chunk_text in page_chunks:
+                    tasks.append(asyncio.ensure_future(synthesize_and_report(len(chunks), chunk_text)))
+                    chunks.append(chunk_text)
+                    chunk_pages.append(page_index)
+                if lazy and progress is not None:
+                    progress(done_chunks, len(chunks))  # The total grows as pages are extracted
+            if not lazy and progress is not None:
+                progress(0, len(chunks))
+        except BaseException:
+            for task in [*loads, *tasks]:
+                if isinstance(task, asyncio.Future):
+                    task.cancel()
+            raise
+        span["chars"] = sum(len(c) for c in chunks)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(chunks)} parts failed: {errors[0]}") from errors[0]
+        segments = [data for data, _ in results]
+        audio = b"".join(segments)
+        span["bytes"] = len(audio)
+        span["cached_chunks"] = cached_chunks
+    if index is not None:
+        index.build(len(pages), chunk_pages, segments, [boundaries for _, boundaries in results])
+    return audio
+
+class AudioJob:
+    """An audio generation job run by SynthesisJobs, with its progress and result."""
+
+    def __init__(self, label=""):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.status = "queued"  # queued, running, done, failed or cancelled
+        self.done_chunks = 0
+        self.total_chunks = 0
+        self.result = None  # The MP3, unless it was put in result_cache
+        self.result_cache = None
+        self.result_bytes = 0
+        self.error = None
+        self.finished_at = None
+        self.future = None
+        self.index = None  # An AudioIndex of the result, if one was requested
+        self.segments = []  # MP3 segments ready from the start of the audio, in order
+        self._later_segments = {}
+        self._segments_changed = threading.Condition()
+        self._readers = 0
+
+    def is_running(self):
+        return self.status in ("queued", "running")
+
+    def update_progress(self, done_chunks, total_chunks):
+        self.done_chunks = done_chunks
+        self.total_chunks = total_chunks
+
+    def add_segment(self, index, data):
+        """Adds the MP3 segment of a chunk, which may finish out of order."""
+        with self._segments_changed:
+            self._later_segments[index] = data
+            while len(self.segments) in self._later_segments:
+                self.segments.append(self._later_segments.pop(len(self.segments)))
+            self._segments_changed.notify_all()
+
+    def set_result(self, data, cache=None):
+        """Keeps the finished MP3, in cache if one is given so it is not held in memory."""
+        self.result_bytes = len(data)
+        if cache is None:
+            self.result = data
+            return
+        cache.put(self.result_key(), data)
+        self.result_cache = cache
+
+    def result_key(self):
+        return f"job-{self.id}"
+
+    def audio(self):
+        """Returns the finished MP3, or None if not done or evicted from the cache."""
+        if self.result_cache is None:
+            return self.result
+        return self.result_cache.get(self.result_key())
+
+    def finish(self, status):
+        """Sets the final status and wakes up readers of iter_audio."""
+        with self._segments_changed:
+            self.status = status
+            self.finished_at = time.time()
+            self._drop_segments()
+            self._segments_changed.notify_all()
+
+    def iter_audio(self):
+        """Yields the MP3 segments in order as they become ready, until the job has finished."""
+        with self._segments_changed:
+            self._readers += 1
+        try:
+            index = 0
+            while True:
+                with self._segments_changed:
+                    while index >= len(self.segments) and self.is_running():
+                        self._segments_changed.wait(1.0)
+                    ready = self.segments[index:]
+                    finished_first = not ready and index == 0 and self.status == "done"
+                if finished_first:
+                    # Finished before this reader started
+                    audio = self.audio()
+                    ready = [audio] if audio else []
+                if not ready:
+                    return
+                yield from ready
+                index += len(ready)
+        finally:
+            with self._segments_changed:
+                self._readers -= 1
+                self._drop_segments()
+
+    def _drop_segments(self):
+        # Once finished and no longer streamed, the segments are only a copy of result
+        if not self.is_running() and not self._readers:
+            self.segments = []
+            self._later_segments = {}
+
+    def cancel(self):
+        """Requests cancellation; the chunks in flight are abandoned."""
+        if self.future is not None and self.future.cancel():
+            self.finish("cancelled")
+
+class SynthesisJobs:
+    """
+    Runs audio generation jobs on one long-lived event loop in a background
+    thread, so synthesis continues across Streamlit reruns and sessions can
+    reattach to their job by ID. Finished audio is kept in cache, if one is
+    given, rather than in memory.
+    """
+
+    def __init__(self, max_finished=50, cache=None):
+        self.max_finished = max_finished
+        self.cache = cache
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="synthesis-jobs")
+        self._thread.start()
+
+    def submit(self, make_coroutine, label="", segments=False):
+        """
+        Starts a job.
+        Args:
+            make_coroutine: A function taking a progress callback (done, total)
+                and returning the coroutine that produces the audio bytes.
+            label: A description of the job, e.g. the file name.
+            segments: Also pass job.add_segment to make_coroutine, so the
+                audio can be played (see iter_audio) while it is generated.
+        Returns:
+            The AudioJob.
+        """
+        job = AudioJob(label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        callbacks = (job.update_progress, job.add_segment) if segments else (job.update_progress,)
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, make_coroutine, callbacks), self._loop)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with the given ID, or None if unknown or pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def schedule(self, coroutine):
+        """Runs a coroutine on the jobs' event loop without tracking it as a job, returning a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _run(self, job, make_coroutine, callbacks):
+        job.status = "running"
+        status = "cancelled"
+        try:
+            result = await make_coroutine(*callbacks)
+            # Written off the loop, which other jobs' synthesis runs on
+            await asyncio.get_running_loop().run_in_executor(None, job.set_result, result, self.cache)
+            status = "done"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.error = str(e)
+            status = "failed"
+        finally:
+            job.finish(status)
+
+    def _prune(self):
+        """Forgets the oldest finished jobs beyond max_finished."""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.is_running()]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+@st.cache_resource
+def get_synthesis_jobs():
+    """Returns the audio generation worker shared by all sessions on this node."""
+    return SynthesisJobs(cache=get_job_results_cache())
+
+class PageAudio:
+    """
+    The audio of single pages, for listening page by page. The page being
+    read is synthesized on demand and the next few are prefetched on the
+    synthesis loop, so the audio of the next page is usually ready by the
+    time the listener gets there. Pages are keyed by their text, voice and
+    settings, so an edited page is synthesized again; the audio of pages
+    away from the one being read is dropped.
+    """
+
+    def __init__(self, jobs, cache=None, scheduler=None, session=None):
+        self._jobs = jobs
+        self._cache = cache
+        self._scheduler = scheduler
+        self._session = session
+        self._futures = {}
+
+    def update(self, current, ahead, voice, max_concurrency=DEFAULT_TTS_CONCURRENCY, keep=()):
+        """
+        Args:
+            current: The text of the page being read, synthesized first.
+            ahead: The texts of the next pages, prefetched in order.
+            voice: The edge-tts voice name.
+            max_concurrency: The maximum number of edge-tts streams per page.
+            keep: Texts of other pages whose audio is kept if already there.
+        Returns:
+            The concurrent.futures.Future of the current page's MP3 bytes.
+        """
+        wanted = [audio_cache_key(text, voice) for text in [current, *ahead]]
+        previous = None
+        for text, key in zip([current, *ahead], wanted):
+            if key not in self._futures:
+                self._futures[key] = self._jobs.schedule(self._synthesize(text, voice, max_concurrency, previous))
+            previous = self._futures[key]
+        retained = set(wanted) | {audio_cache_key(text, voice) for text in keep}
+        for key in list(self._futures):
+            if key not in retained:
+                self._futures.pop(key).cancel()
+        return self._futures[wanted[0]]
+
+    async def _synthesize(self, text, voice, max_concurrency, previous=None):
+        if previous is not None:
+            # Pages are prefetched one after another, nearest first
+            await asyncio.wait([asyncio.wrap_future(previous)])
+        return await generate_audio(
+            text, voice, max_concurrency=max_concurrency, cache=self._cache, scheduler=self._scheduler, session=self._session
+        )
+
+    def release(self):
+        """Cancels and forgets all page audio."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+def loaded_page(pages, index):
+    """Returns the text of pages[index] if it is available without extracting it, else None."""
+    if not 0 <= index < len(pages):
+        return None
+    if isinstance(pages, LazyPages):
+        return pages.peek(index)
+    return pages[index]
+
+def start_audio_stream_server(jobs, port):
+    """
+    Serves the audio of each job at /audio/<job id>.mp3 on a background thread.
+    The response streams the job's segments as they are synthesized, which
+    browsers play as they arrive, and ends with the last segment.
+    """
+
+    class AudioStreamHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = re.fullmatch(r"/audio/([0-9a-f]{32})\.mp3", self.path)
+            job = jobs.get(match.group(1)) if match else None
+            if job is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            try:
+                for segment in job.iter_audio():
+                    self.wfile.write(segment)
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The listener went away
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("", port), AudioStreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="audio-stream-server").start()
+    return server
+
+@st.cache_resource
+def get_audio_stream_server():
+    """Returns the audio streaming server of this node, or None if AUDIO_STREAM_PORT is not set."""
+    if not AUDIO_STREAM_PORT:
+        return None
+    if not AUDIO_STREAM_URL:
+        # localhost only works when the browser runs on this machine
+        raise RuntimeError("TTS_AUDIO_STREAM_PORT is set, but TTS_AUDIO_STREAM_URL, the public URL of that port, is not")
+    return start_audio_stream_server(get_synthesis_jobs(), int(AUDIO_STREAM_PORT))
+
+def audio_stream_url(job):
+    """Returns the URL the player streams a job's audio from, or None without a streaming server."""
+    server = get_audio_stream_server()
+    if server is None:
+        return None
+    return f"{AUDIO_STREAM_URL.rstrip('/')}/audio/{job.id}.mp3"
+
+# Session memory
+def get_session_id():
+    """Returns an ID for the current session, e.g. to queue its synthesis separately from other sessions."""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+def get_session_store():
+    """Returns the SessionStore of the current session, creating it on first use."""
+    if "session_store" not in st.session_state:
+        st.session_state.session_store = SessionStore()
+    return st.session_state.session_store
+
+def estimate_size(value):
+    """Returns the approximate number of bytes a session state value keeps in memory."""
+    if isinstance(value, LazyPages):
+        return value.memory_size()
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(getattr(value, "nbytes", None), int):
+        return value.nbytes  # numpy arrays
+    if hasattr(value, "getbands") and hasattr(value, "size"):
+        width, height = value.size  # PIL images
+        return width * height * len(value.getbands())
+    return sys.getsizeof(value)
+
+def session_memory_usage():
+    """
+    Measures what the current session holds.
+    Returns:
+        A dict with the bytes held in memory per session state key ("keys"),
+        their total ("in_memory") and the bytes spilled to the session's
+        temporary store ("on_disk").
+    """
+    keys = {}
+    for key, value in st.session_state.items():
+        if isinstance(value, SessionStore):
+            continue
+        keys[key] = estimate_size(value)
+    store = st.session_state.get("session_store")
+    return {
+        "keys": keys,
+        "in_memory": sum(keys.values()),
+        "on_disk": store.size_bytes() if store is not None else 0,
+    }
+
+def release_session_pages():
+    """Deletes the stored texts of the current pages before they are replaced."""
+    pages = st.session_state.get("pages")
+    if isinstance(pages, LazyPages):
+        pages.release()
 
 # Callbacks
 def save_editor_content():
@@ -145,28 +2675,249 @@ def delete_page():
         else:
             st.session_state.editor = "" # Empty state
 
+def audio_preview_position(job):
+    """
+    Returns how far the session's preview of a job has played, in seconds,
+    or None without one. Preview players autoplay, so this counts from when
+    the preview was shown, up to its end.
+    """
+    state = st.session_state
+    if state.get("audio_preview_job_id") != job.id or "audio_preview" not in state:
+        return None
+    preview_end = len(state.audio_preview) / TTS_AUDIO_BYTES_PER_SECOND
+    return min(preview_end, state.audio_preview_start + time.time() - state.audio_preview_shown_at)
+
+def audio_preview_due(job):
+    """
+    Returns whether the preview of a running job should be (re)built: there
+    is none yet and a segment is ready, or it has played to its end and more
+    segments are ready than it holds.
+    """
+    position = audio_preview_position(job)
+    if position is None:
+        return bool(job.segments)
+    preview_bytes = len(st.session_state.audio_preview)
+    return position >= preview_bytes / TTS_AUDIO_BYTES_PER_SECOND and sum(map(len, list(job.segments))) > preview_bytes
+
+def update_audio_preview(job):
+    """Rebuilds the preview from every ready segment, to carry on where the previous preview ended."""
+    state = st.session_state
+    position = audio_preview_position(job)
+    state.audio_preview = b"".join(list(job.segments))
+    state.audio_preview_job_id = job.id
+    state.audio_preview_start = position or 0.0
+    state.audio_preview_shown_at = time.time()
+
+@st.fragment(run_every=1.0)
+def render_audio_job_progress(job_id):
+    """Polls a running audio job, switching to the full page once it finishes."""
+    job = get_synthesis_jobs().get(job_id)
+    if job is None or not job.is_running():
+        st.rerun()
+        return
+    if audio_stream_url(job) is None and audio_preview_due(job):
+        st.rerun()  # Show the parts ready so far above while the rest is generated
+        return
+    if job.total_chunks:
+        st.progress(job.done_chunks / job.total_chunks, text=f"Generating audio... {job.done_chunks} of {job.total_chunks} parts done")
+    else:
+        st.progress(0.0, text="Generating audio...")
+    st.button("Cancel", on_click=job.cancel)
+
+@st.fragment(run_every=1.0)
+def render_page_audio_progress(future):
+    """Waits for the audio of the current page, then shows it."""
+    if future.done():
+        st.rerun()
+        return
+    st.caption("Preparing the audio of this page...")
+
+def render_page_audio(voice, max_concurrency):
+    """Shows the audio of the current page, prefetching the next pages' audio."""
+    page_audio = st.session_state.get("page_audio")
+    if page_audio is None:
+        page_audio = st.session_state.page_audio = PageAudio(
+            get_synthesis_jobs(), cache=get_audio_cache(), scheduler=get_synthesis_scheduler(), session=get_session_id()
+        )
+    pages = st.session_state.pages
+    current = st.session_state.current_page
+    text = st.session_state.editor
+    if not text.strip():
+        st.caption("This page has no text to read.")
+        return
+    ahead = [loaded_page(pages, index) for index in range(current + 1, current + 1 + PAGE_AUDIO_PREFETCH_PAGES)]
+    future = page_audio.update(
+        text,
+        [page for page in ahead if page and page.strip()],
+        voice,
+        max_concurrency=max_concurrency,
+        keep=[page for page in [loaded_page(pages, current - 1)] if page],
+    )
+    if not future.done():
+        render_page_audio_progress(future)
+    elif future.cancelled() or future.exception() is not None:
+        st.error(f"Could not generate the audio of this page: {'cancelled' if future.cancelled() else future.exception()}")
+    else:
+        st.audio(future.result(), format="audio/mp3")
+
+@st.fragment(run_every=1.0)
+def render_extraction_progress():
+    """Shows background extraction (a large PDF's text, or a batch of photos) until it is done."""
+    progress = st.session_state.get("extraction_progress")
+    if not progress or progress["done"] >= progress["total"]:
+        st.rerun()
+        return
+    st.progress(
+        progress["done"] / progress["total"],
+        text=f"{progress['label']}... {progress['done']} of {progress['total']} {progress['unit']}",
+    )
+
+def render_audio_job(job, file_name):
+    """
+    Shows the progress or the result of the session's audio job. With a
+    streaming server, one player streams the audio while it is generated and
+    keeps playing once it is done. Without one, the parts ready so far are
+    played, extended with the newer parts each time they have been played
+    through, and the full audio carries on from there once it is done.
+    """
+    stream_url = audio_stream_url(job)
+    if job.is_running():
+        if stream_url is not None:
+            st.audio(stream_url, format="audio/mpeg")
+        else:
+            if audio_preview_due(job):
+                update_audio_preview(job)
+            if audio_preview_position(job) is not None:
+                # Only replaced once played through, so the player is not reset while it plays
+                st.audio(st.session_state.audio_preview, format="audio/mp3",
+                         start_time=int(st.session_state.audio_preview_start), autoplay=True)
+                st.caption("Playing the parts ready so far while the rest is generated.")
+        render_audio_job_progress(job.id)
+    elif job.status == "done":
+        st.success("Audio generated successfully!")
+        position = audio_preview_position(job)
+        if position is not None:
+            st.session_state.audio_resume = (job.id, position)
+        st.session_state.pop("audio_preview", None)
+        resume = st.session_state.get("audio_resume")
+        resume_at = resume[1] if resume is not None and resume[0] == job.id else 0
+
+        start_time = 0
+        if job.index is not None and len(job.index.page_starts) > 1:
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                start_page = st.number_input(
+                    "Start at page", 1, len(job.index.page_starts),
+                    min(st.session_state.get("current_page", 0) + 1, len(job.index.page_starts)),
+                )
+            with col2:
+                query = st.text_input("...or at the sentence containing", placeholder="Words to find")
+            start_time = job.index.page_starts[start_page - 1]
+            found = job.index.find(query) if query else None
+            if found is not None:
+                start_time = found[0]
+                st.caption(f"Found on page {found[1] + 1}.")
+            elif query:
+                st.caption("No sentence contains those words.")
+
+        audio = job.audio()
+        if audio is None:
+            st.warning("The generated audio has expired from the cache. Generate it again.")
+            return
+
+        # The stream can't seek, the full MP3 can; it carries on from the preview if one was playing
+        start_time = start_time or resume_at
+        st.audio(audio if start_time else (stream_url or audio), format="audio/mp3", start_time=int(start_time), autoplay=bool(resume_at))
+
+        st.download_button(
+            label="Download MP3",
+            data=audio,
+            file_name=file_name,
+            mime="audio/mp3"
+        )
+    elif job.status == "failed":
+        st.error(f"An error occurred during audio generation: {job.error}")
+        st.caption("Parts that were generated are kept, so generating again only retries the parts that failed.")
+    elif job.status == "cancelled":
+        st.info("Audio generation was cancelled.")
+
+def render_timing_breakdown(spans):
+    """Shows how long each pipeline stage took in this run in the sidebar."""
+    st.sidebar.markdown("**Timing breakdown (this run)**")
+    if not spans:
+        st.sidebar.caption("Nothing was processed in this run.")
+        return
+    totals = {}
+    for span in spans:
+        total = totals.setdefault(span["stage"], {"seconds": 0.0, "count": 0, "pages": 0, "chars": 0})
+        total["seconds"] += span["seconds"]
+        total["count"] += 1
+        total["pages"] += span.get("pages") or 0
+        total["chars"] += span.get("chars") or 0
+    for stage, total in sorted(totals.items(), key=lambda item: -item[1]["seconds"]):
+        details = f"{total['count']}x"
+        if total["pages"]:
+            details += f", {total['pages']} pages"
+        if total["chars"]:
+            details += f", {total['chars']} chars"
+        st.sidebar.caption(f"{stage}: {total['seconds']:.2f}s ({details})")
+    voices = {span["voice"] for span in spans if span.get("voice")}
+    if voices:
+        st.sidebar.caption(f"Voice: {', '.join(sorted(voices))}")
+
+def render_session_memory():
+    """Shows the memory and temporary disk space held by this session in the sidebar."""
+    usage = session_memory_usage()
+    st.sidebar.markdown("**Session memory**")
+    st.sidebar.caption(f"In memory: {usage['in_memory'] / 1024:.0f} KB, spilled to disk: {usage['on_disk'] / 1024:.0f} KB")
+    for key, size in sorted(usage["keys"].items(), key=lambda item: -item[1])[:5]:
+        st.sidebar.caption(f"{key}: {size / 1024:.0f} KB")
+    job = get_synthesis_jobs().get(st.session_state.get("audio_job_id"))
+    if job is not None and job.result_bytes:
+        where = "on disk" if job.result_cache is not None else "in memory"
+        st.sidebar.caption(f"Generated audio: {job.result_bytes / 1024:.0f} KB {where}")
+
 def main():
+    # Collect this run's timing spans for the optional sidebar breakdown
+    run_spans = []
+    token = _current_run_spans.set(run_spans)
+    try:
+        render_app()
+    finally:
+        _current_run_spans.reset(token)
+
+    if st.sidebar.checkbox("Show timing breakdown", help="How long each processing step took in this run."):
+        render_timing_breakdown(run_spans)
+    if st.sidebar.checkbox("Show session memory", help="How much memory and temporary disk space this session uses."):
+        render_session_memory()
+
+def render_app():
     st.title("Document to Speech Converter")
     st.markdown("Convert PDF and Word documents into natural-sounding speech using Microsoft Edge TTS.")
 
     # Sidebar for Voice Selection
     st.sidebar.header("Settings")
-    voice_options = {
-        "Australian Female": "en-AU-NatashaNeural",
-        "Australian Male": "en-AU-WilliamNeural",
-        "US Female": "en-US-AriaNeural",
-        "US Male": "en-US-ChristopherNeural"
-    }
-    selected_voice_name = st.sidebar.selectbox("Select Voice", list(voice_options.keys()))
-    selected_voice = voice_options[selected_voice_name]
+    selected_voice_name = st.sidebar.selectbox("Select Voice", list(VOICE_OPTIONS.keys()))
+    selected_voice = VOICE_OPTIONS[selected_voice_name]
+
+    # Synthesis Settings
+    tts_concurrency = st.sidebar.slider("Parallel synthesis streams", 1, 8, DEFAULT_TTS_CONCURRENCY, help="How many parts of the document are sent to the speech service at once.")
 
     # OCR Settings
     force_ocr = st.sidebar.checkbox("Force OCR (for scanned docs)")
+    skip_boilerplate = st.sidebar.checkbox("Skip headers, footers and page numbers", value=True, help="Leave out lines repeated at the top or bottom of most pages.")
 
     # File Uploader
     st.subheader("Input Source")
     
-    uploaded_file = st.file_uploader("📄 Upload File or Take Photo (Tap here ➔ Camera)", type=["pdf", "docx", "jpg", "jpeg", "png"])
+    uploaded_files = st.file_uploader(
+        "📄 Upload File or Take Photos (Tap here ➔ Camera)",
+        type=list(FILE_TYPES),
+        accept_multiple_files=True,
+        help="Upload one PDF or Word document, or one or more photos. Several photos are read as the pages of one document.",
+    ) or []
+    uploaded_file = uploaded_files[0] if uploaded_files else None
+    photo_batch = len(uploaded_files) > 1
     
     # Initialize Session State
     if "pages" not in st.session_state:
@@ -179,64 +2930,126 @@ def main():
         st.session_state.last_force_ocr = False
     if "last_threshold_value" not in st.session_state:
         st.session_state.last_threshold_value = 128
+    if "last_skip_boilerplate" not in st.session_state:
+        st.session_state.last_skip_boilerplate = True
     
     current_file_id = None
+    document_name = None
     if uploaded_file is not None:
-        # Simple ID: name + size
-        current_file_id = f"{uploaded_file.name}_{uploaded_file.size}"
+        # Simple ID: name + size + upload ID, so a different file with the same name and size is reprocessed
+        current_file_id = "|".join(f"{file.name}_{file.size}_{getattr(file, 'file_id', '')}" for file in uploaded_files)
+        document_name = f"{len(uploaded_files)} photos" if photo_batch else uploaded_file.name
+        if photo_batch and any(file_kind(file.name) != "image" for file in uploaded_files):
+            st.error("Upload several photos, or a single PDF or Word document.")
+            return
 
     # Threshold Slider (Only visible for images)
     threshold_val = 128
     is_image = False
     if uploaded_file is not None:
-         file_type = uploaded_file.name.split(".")[-1].lower()
-         if file_type in ["jpg", "jpeg", "png"]:
+         if file_kind(uploaded_file.name) == "image":
              is_image = True
-             threshold_val = st.slider("Adjust Shadow/Contrast (Threshold)", 0, 255, 128, help="Slide until the text is clear black and the background is white.")
+             auto_threshold = st.checkbox("✨ Auto threshold", help="Try several thresholds and keep the one the text is read best with.")
+             threshold_val = st.slider("Adjust Shadow/Contrast (Threshold)", 0, 255, 128, help="Slide until the text is clear black and the background is white.", disabled=auto_threshold)
+             if auto_threshold:
+                 threshold_val = AUTO_THRESHOLD
 
     if uploaded_file is not None:
         # Check if file changed or OCR settings/Threshold changed
         file_changed = (st.session_state.last_processed_file_id != current_file_id)
-        ocr_changed = (st.session_state.last_force_ocr != force_ocr)
+        ocr_changed = (st.session_state.last_force_ocr != force_ocr) or (st.session_state.last_skip_boilerplate != skip_boilerplate)
         threshold_changed = (st.session_state.last_threshold_value != threshold_val)
 
-        if file_changed or ocr_changed or (is_image and threshold_changed):
-            file_type = uploaded_file.name.split(".")[-1].lower()
+        # Moving the slider only updates the preview; OCR runs when requested
+        read_text_requested = False
+        if is_image and threshold_changed and not file_changed and threshold_val == AUTO_THRESHOLD:
+            read_text_requested = True  # Auto mode picks the threshold and reads in one pass
+        elif is_image and threshold_changed and not file_changed:
+            if not photo_batch:
+                st.caption("Preview updated. Read the text again to use the new threshold.")
+            read_text_requested = st.button("🔍 Read Text at This Threshold")
+
+        if file_changed or ocr_changed or read_text_requested:
+            kind = file_kind(uploaded_file.name)
             
             with st.spinner("Processing..."):
                 try:
                     pages = []
                     processed_image = None
-                    original_image = None
-
-                    if file_type == "pdf":
-                        pages = extract_text_from_pdf(uploaded_file, force_ocr=force_ocr)
-                    elif file_type == "docx":
-                        pages = extract_text_from_docx(uploaded_file)
-                    elif file_type in ["jpg", "jpeg", "png"]:
-                        # Rewind file just in case
-                        uploaded_file.seek(0)
-                        original_image = Image.open(uploaded_file)
-                        
-                        # Process Image
-                        processed_image = process_image_for_ocr(original_image, threshold_value=threshold_val)
-                        
-                        # Store processed image in session state to display it
-                        st.session_state.last_processed_image = processed_image
-                        st.session_state.last_original_image = original_image
-                        
-                        pages = extract_text_from_image(processed_image)
-                    else:
+                    extraction_cache = get_extraction_cache()
+                    boilerplate = BoilerplateFilter() if skip_boilerplate else None
+                    store = get_session_store()
+                    if kind is None:
                         st.error("Unsupported file format.")
                         return
+                    load_extraction_backend(kind)
+                    if file_changed:
+                        # Nothing of the previous file is needed any more
+                        st.session_state.pop("extraction_progress", None)
+                        release_session_pages()
+                        st.session_state.pages = []
+                        store.clear()
+
+                    if photo_batch:
+                        # Photos are OCR'd in the worker pool; each page is ready as soon as its photo is
+                        photo_progress = {"done": 0, "total": len(uploaded_files), "label": "Reading photos", "unit": "photos"}
+                        st.session_state.extraction_progress = photo_progress
+                        pages = open_photo_pages(
+                            uploaded_files,
+                            threshold_value=threshold_val,
+                            executor=get_ocr_executor(),
+                            store=store,
+                            cache=extraction_cache,
+                            progress=lambda done, total: photo_progress.update(done=done, total=total),
+                        )
+                        for key in ("processed_preview", "original_preview", "auto_threshold_value"):
+                            st.session_state.pop(key, None)
+                    elif kind == "pdf":
+                        # Pages are extracted lazily as the user navigates, while the
+                        # native text of large PDFs is read in parallel in the background
+                        text_progress = {"done": 0, "total": 0, "label": "Reading text", "unit": "pages"}
+                        st.session_state.extraction_progress = text_progress
+                        pages = open_pdf_pages(
+                            uploaded_file,
+                            force_ocr=force_ocr,
+                            ocr_executor=get_ocr_executor(),
+                            prefetch_executor=get_prefetch_executor(),
+                            cache=extraction_cache,
+                            store=store,
+                            boilerplate=boilerplate,
+                            text_executor=get_ocr_executor(),
+                            progress=lambda done, total: text_progress.update(done=done, total=total),
+                        )
+                    elif kind == "docx":
+                        cache_key = extraction_cache_key(file_content_hash(uploaded_file), kind="docx")
+                        pages = cached_extraction(extraction_cache, cache_key, lambda: extract_text_from_docx(uploaded_file))
+                    else:
+                        pages = read_image_file(uploaded_file, threshold_val, store, cache=extraction_cache)
 
-                    cleaned_pages = [clean_text(page) for page in pages]
+                    if isinstance(pages, LazyPages):
+                        cleaned_pages = pages  # Cleaned as each page is loaded
+                    else:
+                        cleaned_pages = [clean_text(page) for page in pages]
+                        if boilerplate is not None and kind != "docx":
+                            # DOCX pages are paragraph chunks without headers or footers
+                            cleaned_pages, boilerplate = remove_boilerplate(cleaned_pages)
+                        if len(cleaned_pages) >= SESSION_SPILL_MIN_PAGES:
+                            cleaned_pages = LazyPages.from_texts(cleaned_pages, store=store)
+                    release_session_pages()
                     st.session_state.pages = cleaned_pages
                     st.session_state.current_page = 0
                     st.session_state.last_processed_file_id = current_file_id
                     st.session_state.last_force_ocr = force_ocr
                     st.session_state.last_threshold_value = threshold_val
-                    
+                    st.session_state.last_skip_boilerplate = skip_boilerplate
+                    st.session_state.boilerplate = boilerplate
+                    if file_changed:
+                        # Audio of the previous file no longer applies
+                        st.session_state.pop("audio_job_id", None)
+                        st.session_state.pop("audio_preview", None)
+                        if "page_audio" in st.session_state:
+                            st.session_state.page_audio.release()
+
                     # Initialize editor content
                     if cleaned_pages:
                         st.session_state.editor = cleaned_pages[0]
@@ -247,15 +3060,33 @@ def main():
                     st.error(f"Error processing document: {e}")
                     return
 
+        extraction_progress = st.session_state.get("extraction_progress")
+        if extraction_progress and extraction_progress["done"] < extraction_progress["total"]:
+            render_extraction_progress()
+
+        # Re-apply only the threshold step for the preview while the slider moves
+        if (
+            is_image
+            and threshold_val != AUTO_THRESHOLD
+            and "processed_preview" in st.session_state
+            and st.session_state.get("last_preview_threshold") != threshold_val
+        ):
+            sharpened_preview = get_session_store().get_array("sharpened_preview")
+            if sharpened_preview is not None:
+                st.session_state.processed_preview = make_preview(apply_threshold(sharpened_preview, threshold_val), image_format="PNG")
+                st.session_state.last_preview_threshold = threshold_val
+
         # Display Images if available (and relevant)
-        if "last_processed_image" in st.session_state and is_image:
+        if "processed_preview" in st.session_state and is_image:
+             if threshold_val == AUTO_THRESHOLD and "auto_threshold_value" in st.session_state:
+                 st.caption(f"Auto threshold picked {st.session_state.auto_threshold_value}.")
              with st.expander("👁️ View Processed Image", expanded=True):
                  col1, col2 = st.columns(2)
                  with col1:
-                     if "last_original_image" in st.session_state:
-                         st.image(st.session_state.last_original_image, caption="Original", use_container_width=True)
+                     if "original_preview" in st.session_state:
+                         st.image(st.session_state.original_preview, caption="Original", use_container_width=True)
                  with col2:
-                     st.image(st.session_state.last_processed_image, caption="What the AI Sees", use_container_width=True)
+                     st.image(st.session_state.processed_preview, caption="What the AI Sees", use_container_width=True)
 
         # UI Display
         if st.session_state.pages:
@@ -273,30 +3104,60 @@ def main():
             # Editor
             st.text_area("Edit Page Text", key="editor", height=300)
 
+            if st.checkbox("🔊 Listen page by page", help="Read the current page aloud, preparing the next pages while you listen."):
+                render_page_audio(selected_voice, tts_concurrency)
+            elif "page_audio" in st.session_state:
+                st.session_state.page_audio.release()
+
             # Audio Generation
-            if st.button("Generate Audio for Whole Document"):
+            synthesis_jobs = get_synthesis_jobs()
+            job = synthesis_jobs.get(st.session_state.get("audio_job_id"))
+            generating = job is not None and job.is_running()
+            if st.button("Generate Audio for Whole Document", disabled=generating):
                 save_editor_content() # Save current edits first
-                full_text = "\n".join(st.session_state.pages)
-                
-                if not full_text.strip():
+                pages = st.session_state.pages
+                if isinstance(pages, LazyPages):
+                    pages = pages.page_sources()  # Pages not extracted yet are extracted by the job as it gets to them
+                else:
+                    pages = list(pages)
+
+                if not any(callable(page) or page.strip() for page in pages):
                     st.warning("No text found in the document.")
                 else:
-                    with st.spinner("Generating audio..."):
-                        try:
-                            audio_bytes = asyncio.run(generate_audio(full_text, selected_voice))
-                            
-                            st.success("Audio generated successfully!")
-                            
-                            st.audio(audio_bytes, format="audio/mp3")
-                            
-                            st.download_button(
-                                label="Download MP3",
-                                data=audio_bytes,
-                                file_name=f"{uploaded_file.name.split('.')[0]}.mp3",
-                                mime="audio/mp3"
-                            )
-                        except Exception as e:
-                            st.error(f"An error occurred during audio generation: {e}")
+                    # Runs in the background so reruns don't interrupt it
+                    audio_cache = get_audio_cache()
+                    audio_index = AudioIndex()
+                    scheduler = get_synthesis_scheduler()
+                    session_id = get_session_id()
+                    job = synthesis_jobs.submit(
+                        lambda progress, on_segment: generate_audio(
+                            pages,
+                            selected_voice,
+                            max_concurrency=tts_concurrency,
+                            cache=audio_cache,
+                            progress=progress,
+                            on_segment=on_segment,
+                            index=audio_index,
+                            scheduler=scheduler,
+                            session=session_id,
+                            page_executor=get_prefetch_executor(),
+                        ),
+                        label=document_name,
+                        segments=True,
+                    )
+                    job.index = audio_index
+                    st.session_state.audio_job_id = job.id
+
+            boilerplate = st.session_state.get("boilerplate")
+            if boilerplate is not None and boilerplate.chars_removed:
+                st.caption(
+                    f"Skipped {boilerplate.lines_removed} header, footer and page number lines "
+                    f"({boilerplate.chars_removed} characters, about {boilerplate.seconds_saved():.0f}s of audio) "
+                    "in the pages read so far."
+                )
+
+            if job is not None:
+                render_audio_job(job, "photos.mp3" if photo_batch else f"{uploaded_file.name.split('.')[0]}.mp3")
         else:
             # Empty state message if pages were deleted
             if uploaded_file is not None:
@@ -305,13 +3166,32 @@ def main():
     else:
         # Reset state if file is removed
         if st.session_state.last_processed_file_id is not None:
+            release_session_pages()
             st.session_state.pages = []
             st.session_state.current_page = 0
             st.session_state.last_processed_file_id = None
-            if "last_processed_image" in st.session_state:
-                del st.session_state.last_processed_image
-            if "last_original_image" in st.session_state:
-                del st.session_state.last_original_image
+            if "session_store" in st.session_state:
+                st.session_state.session_store.clear()
+            if "processed_preview" in st.session_state:
+                del st.session_state.processed_preview
+            if "original_preview" in st.session_state:
+                del st.session_state.original_preview
+            if "last_preview_threshold" in st.session_state:
+                del st.session_state.last_preview_threshold
+            if "auto_threshold_value" in st.session_state:
+                del st.session_state.auto_threshold_value
+            if "boilerplate" in st.session_state:
+                del st.session_state.boilerplate
+            if "extraction_progress" in st.session_state:
+                del st.session_state.extraction_progress
+            if "audio_job_id" in st.session_state:
+                job = get_synthesis_jobs().get(st.session_state.audio_job_id)
+                if job is not None:
+                    job.cancel()
+                del st.session_state.audio_job_id
+            st.session_state.pop("audio_preview", None)
+            if "page_audio" in st.session_state:
+                st.session_state.page_audio.release()
 
 if __name__ == "__main__":
     main()
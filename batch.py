@@ -0,0 +1,253 @@
+"""
+Headless batch conversion of documents and photos to MP3.
+
+Usage:
+    python batch.py INPUT [INPUT ...] --output-dir OUT [--voice en-US-AriaNeural]
+
+Inputs can be files or directories (searched recursively). Extraction and OCR
+run in a process pool, synthesis runs on a single asyncio event loop. MP3s are
+written atomically, so an interrupted run is resumed by running the same
+command again: finished files are skipped, and cached extraction results and
+audio chunks are reused for the rest.
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import time
+
+import app
+
+FileResult = collections.namedtuple(
+    "FileResult",
+    ["source", "output", "status", "pages", "chars", "extract_seconds", "synth_seconds", "audio_bytes", "error", "skipped_chars"],
+    defaults=[0],
+)
+
+def parse_threshold(value):
+    """Parses the --threshold option: a value from 0 to 255, or "auto"."""
+    if value == app.AUTO_THRESHOLD:
+        return value
+    threshold = int(value)
+    if not 0 <= threshold <= 255:
+        raise argparse.ArgumentTypeError("threshold must be between 0 and 255, or 'auto'")
+    return threshold
+
+def find_jobs(inputs, output_dir):
+    """
+    Finds the files to convert.
+    Args:
+        inputs: File and directory paths. Directories are searched recursively.
+        output_dir: The directory MP3s are written to. The layout of input
+            directories is mirrored below it.
+    Returns:
+        A list of (source_path, output_path) pairs in a stable order.
+    """
+    jobs = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for root, dirs, files in os.walk(input_path):
+                dirs.sort()
+                for name in sorted(files):
+                    if app.file_kind(name) is None:
+                        continue
+                    source = os.path.join(root, name)
+                    relative = os.path.splitext(os.path.relpath(source, input_path))[0]
+                    jobs.append((source, os.path.join(output_dir, relative + ".mp3")))
+        else:
+            name = os.path.splitext(os.path.basename(input_path))[0]
+            jobs.append((input_path, os.path.join(output_dir, name + ".mp3")))
+    return jobs
+
+def extract_file(path, force_ocr=False, threshold_value=128, ocr_threads=1):
+    """Extracts the raw page texts of a file. Runs in a worker process."""
+    kind = app.file_kind(path)
+    if kind == "image":
+        return [app.ocr_photo(path, threshold_value)]
+    with open(path, "rb") as f:
+        if kind == "pdf":
+            # Tesseract runs in a subprocess or releases the GIL, so threads are enough to parallelize pages
+            with concurrent.futures.ThreadPoolExecutor(max_workers=ocr_threads) as ocr_pool:
+                return app.extract_text_from_pdf(f, force_ocr=force_ocr, executor=ocr_pool)
+        if kind == "docx":
+            return app.extract_text_from_docx(f)
+    raise ValueError(f"Unsupported file format: {os.path.splitext(path)[1].lower()}")
+
+def write_atomic(path, data):
+    """Writes data to path so that the file either exists complete or not at all."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".mp3")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+async def convert_file(source, output, options, executor, synthesis_slots, extraction_cache=None, audio_cache=None, scheduler=None):
+    """Extracts, cleans and synthesizes a single file, returning a FileResult."""
+    pages = []
+    chars = 0
+    skipped_chars = 0
+    extract_seconds = 0.0
+    synth_seconds = 0.0
+    try:
+        started = time.perf_counter()
+        with open(source, "rb") as f:
+            content_hash = app.file_content_hash(f)
+        cache_key = app.extraction_cache_key(
+            content_hash,
+            kind=os.path.splitext(source)[1].lower(),
+            force_ocr=options.force_ocr,
+            threshold=options.threshold,
+        )
+        cached = extraction_cache.get(cache_key) if extraction_cache is not None else None
+        if cached is not None:
+            pages = json.loads(cached)
+        else:
+            pages = await asyncio.wrap_future(app.submit_to_worker(
+                executor, extract_file, source, options.force_ocr, options.threshold, options.ocr_threads
+            ))
+            if extraction_cache is not None:
+                extraction_cache.put(cache_key, json.dumps(pages).encode("utf-8"))
+        pages = [app.clean_text(page) for page in pages]
+        if options.skip_boilerplate and os.path.splitext(source)[1].lower() != ".docx":
+            pages, boilerplate = app.remove_boilerplate(pages)
+            skipped_chars = boilerplate.chars_removed
+        chars = sum(len(page) for page in pages)
+        extract_seconds = time.perf_counter() - started
+
+        if not chars:
+            return FileResult(source, output, "empty", len(pages), 0, extract_seconds, 0.0, 0, None)
+
+        async with synthesis_slots:
+            started = time.perf_counter()
+            audio = await app.generate_audio(
+                pages, options.voice, max_concurrency=options.tts_concurrency, cache=audio_cache,
+                scheduler=scheduler, session=source,
+            )
+            synth_seconds = time.perf_counter() - started
+
+        write_atomic(output, audio)
+        return FileResult(source, output, "done", len(pages), chars, extract_seconds, synth_seconds, len(audio), None, skipped_chars)
+    except Exception as e:
+        return FileResult(source, output, "failed", len(pages), chars, extract_seconds, synth_seconds, 0, str(e), skipped_chars)
+
+async def run_batch(jobs, options, executor=None, extraction_cache=None, audio_cache=None, log=print):
+    """
+    Converts every job, skipping outputs that already exist when options.resume is set.
+    Returns:
+        A list of FileResult, in the order of jobs.
+    """
+    results = {}
+    pending = []
+    for source, output in jobs:
+        if options.resume and os.path.exists(output):
+            results[source] = FileResult(source, output, "skipped", 0, 0, 0.0, 0.0, os.path.getsize(output), None)
+        else:
+            pending.append((source, output))
+
+    own_executor = executor is None
+    if own_executor:
+        # Imported here first, so the workers forked below inherit the backends
+        for kind in {app.file_kind(source) for source, _ in pending} - {None}:
+            app.load_extraction_backend(kind)
+        executor = app.WorkerPool(max_workers=options.workers)
+    try:
+        synthesis_slots = asyncio.Semaphore(max(1, options.synthesis_jobs))
+        # Caps the edge-tts streams of all files together and backs off when the service drops them
+        scheduler = app.SynthesisScheduler(max_concurrency=options.tts_global_concurrency)
+        tasks = [
+            convert_file(source, output, options, executor, synthesis_slots, extraction_cache, audio_cache, scheduler)
+            for source, output in pending
+        ]
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            result = await task
+            results[result.source] = result
+            message = f"[{done}/{len(tasks)}] {result.status}: {result.source}"
+            if result.error:
+                message += f" ({result.error})"
+            log(message)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return [results[source] for source, _ in jobs]
+
+def format_summary(results, elapsed):
+    """Formats a per-file timing and throughput table with totals."""
+    lines = [f"{'File':<40} {'Status':<8} {'Pages':>5} {'Chars':>9} {'Extract':>8} {'Synth':>8} {'Chars/s':>9}"]
+    for result in results:
+        seconds = result.extract_seconds + result.synth_seconds
+        rate = f"{result.chars / seconds:9.0f}" if seconds and result.chars else f"{'-':>9}"
+        name = os.path.basename(result.source)[:40]
+        lines.append(
+            f"{name:<40} {result.status:<8} {result.pages:>5} {result.chars:>9} "
+            f"{result.extract_seconds:7.2f}s {result.synth_seconds:7.2f}s {rate}"
+        )
+
+    counts = collections.Counter(result.status for result in results)
+    total_chars = sum(result.chars for result in results)
+    total_audio = sum(result.audio_bytes for result in results if result.status == "done")
+    skipped_chars = sum(result.skipped_chars for result in results)
+    lines.append("")
+    lines.append(", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    lines.append(
+        f"{total_chars} characters in {elapsed:.1f}s "
+        f"({total_chars / elapsed if elapsed else 0:.0f} chars/s, "
+        f"{counts['done'] * 60 / elapsed if elapsed else 0:.1f} files/min, "
+        f"{total_audio / (1024 * 1024):.1f} MB of audio)"
+    )
+    if skipped_chars:
+        lines.append(
+            f"Skipped {skipped_chars} characters of headers, footers and page numbers "
+            f"(about {skipped_chars / app.SPEECH_CHARS_PER_SECOND:.0f}s of audio)"
+        )
+    return "\n".join(lines)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert documents and photos to MP3 without the web UI.")
+    parser.add_argument("inputs", nargs="+", help="Files or directories to convert.")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory the MP3 files are written to.")
+    parser.add_argument("--voice", default=app.VOICE_OPTIONS["Australian Female"], help="edge-tts voice name.")
+    parser.add_argument("--workers", type=int, default=app.OCR_WORKERS, help="Extraction/OCR worker processes.")
+    parser.add_argument("--ocr-threads", type=int, default=1, help="OCR threads per worker for scanned PDFs.")
+    parser.add_argument("--synthesis-jobs", type=int, default=2, help="Files synthesized at the same time.")
+    parser.add_argument("--tts-concurrency", type=int, default=app.DEFAULT_TTS_CONCURRENCY, help="edge-tts streams per file.")
+    parser.add_argument("--tts-global-concurrency", type=int, default=app.TTS_GLOBAL_CONCURRENCY, help="edge-tts streams across all files.")
+    parser.add_argument("--force-ocr", action="store_true", help="OCR every PDF page.")
+    parser.add_argument("--threshold", type=parse_threshold, default=128, help="Image threshold (0-255) or 'auto'.")
+    parser.add_argument("--keep-boilerplate", dest="skip_boilerplate", action="store_false", help="Keep repeated headers, footers and page numbers.")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="Convert files even if their MP3 exists.")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="Don't use the on-disk caches.")
+    return parser
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    jobs = find_jobs(options.inputs, options.output_dir)
+    if not jobs:
+        print("No supported files found.", file=sys.stderr)
+        return 1
+
+    extraction_cache = None
+    audio_cache = None
+    if options.cache:
+        extraction_cache = app.DiskCache(os.path.join(app.CACHE_ROOT, "extraction"), app.EXTRACTION_CACHE_MAX_BYTES)
+        audio_cache = app.DiskCache(os.path.join(app.CACHE_ROOT, "audio"), app.AUDIO_CACHE_MAX_BYTES)
+
+    started = time.perf_counter()
+    results = asyncio.run(run_batch(jobs, options, extraction_cache=extraction_cache, audio_cache=audio_cache))
+    print(format_summary(results, time.perf_counter() - started))
+    if app.METRICS_FILE:
+        app.get_metrics().write_file()
+    return 1 if any(result.status == "failed" for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
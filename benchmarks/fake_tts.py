@@ -0,0 +1,78 @@
+"""
+Offline stand-in for edge-tts, for benchmarks and tests.
+
+make_fake_edge_tts() returns a module-like object with a Communicate class
+that mimics edge_tts.Communicate: stream() yields "audio" chunks and
+"WordBoundary" events with a realistic time to first byte and streaming rate,
+and can inject failures. Swap it in for app.edge_tts to run synthesis without
+network access.
+"""
+import asyncio
+import random
+import types
+
+AUDIO_BYTES_PER_SECOND = 6000  # 48 kbit/s mono MP3, as produced by edge-tts
+SPOKEN_CHARS_PER_SECOND = 15
+TICKS_PER_SECOND = 10_000_000  # edge-tts offsets are in 100ns units
+
+class FakeTTSError(ConnectionError):
+    """Raised by the fake service to simulate a dropped or throttled stream."""
+
+def make_fake_edge_tts(first_byte_latency=0.3, realtime_factor=20.0, chunk_bytes=4096,
+                       failure_rate=0.0, seed=0):
+    """
+    Creates a fake edge_tts module.
+    Args:
+        first_byte_latency: Seconds before the first audio chunk of a stream.
+        realtime_factor: How many times faster than real time audio is streamed.
+        chunk_bytes: Size of the audio chunks yielded by stream().
+        failure_rate: Probability (0-1) that a stream fails partway through.
+        seed: Seed for the failure injection, so runs are reproducible.
+    Returns:
+        An object with a Communicate class and a stats dict (streams, failures,
+        active, max_active).
+    """
+    rng = random.Random(seed)
+    stats = {"streams": 0, "failures": 0, "active": 0, "max_active": 0}
+
+    class Communicate:
+        def __init__(self, text, voice="en-US-AriaNeural", **kwargs):
+            self.text = text
+            self.voice = voice
+
+        async def stream(self):
+            stats["streams"] += 1
+            stats["active"] += 1
+            stats["max_active"] = max(stats["max_active"], stats["active"])
+            try:
+                fail = rng.random() < failure_rate
+                await asyncio.sleep(first_byte_latency)
+
+                words = self.text.split()
+                audio_seconds = len(self.text) / SPOKEN_CHARS_PER_SECOND
+                total_bytes = max(chunk_bytes, int(audio_seconds * AUDIO_BYTES_PER_SECOND))
+                seconds_per_word = audio_seconds / max(1, len(words))
+                sent = 0
+                word_index = 0
+                while sent < total_bytes:
+                    if fail and sent >= total_bytes // 2:
+                        stats["failures"] += 1
+                        raise FakeTTSError("Stream dropped by fake TTS service")
+                    size = min(chunk_bytes, total_bytes - sent)
+                    await asyncio.sleep(size / AUDIO_BYTES_PER_SECOND / realtime_factor)
+                    yield {"type": "audio", "data": bytes(size)}
+                    sent += size
+
+                    # Word boundaries for the audio sent so far
+                    while word_index < len(words) and word_index * seconds_per_word * AUDIO_BYTES_PER_SECOND < sent:
+                        yield {
+                            "type": "WordBoundary",
+                            "offset": int(word_index * seconds_per_word * TICKS_PER_SECOND),
+                            "duration": int(seconds_per_word * TICKS_PER_SECOND),
+                            "text": words[word_index],
+                        }
+                        word_index += 1
+            finally:
+                stats["active"] -= 1
+
+    return types.SimpleNamespace(Communicate=Communicate, stats=stats)
@@ -0,0 +1,537 @@
+"""
+Benchmarks every stage of the document-to-speech pipeline on synthetic inputs.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--pages 300] [--output bench_results.json]
+    python benchmarks/run_benchmarks.py --baseline old.json
+
+Inputs (text PDFs, scanned PDFs, DOCX files, photos) are generated with a fixed
+seed, and synthesis runs against the offline fake edge-tts in fake_tts.py, so
+results are reproducible and comparable between runs. Each stage reports its
+median time, throughput and how far the RSS of this process rose above its
+level at the start of the stage, so inputs and memory left over from earlier
+stages don't count towards it. Stages
+whose external tools (tesseract, tesserocr) are missing are reported as skipped.
+The app_import and docx_cold_start stages start a fresh interpreter, as a new
+container's worker would, to catch cold start regressions.
+"""
+import argparse
+import asyncio
+import atexit
+import concurrent.futures
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+from fake_tts import make_fake_edge_tts
+
+WORDS = (
+    "the of and to in is for that with on as by this be are from or at an which "
+    "document policy form section page report audio speech reader text result "
+    "information service system value process analysis data review summary"
+).split()
+
+class PeakRssSampler:
+    """
+    Samples this process's resident set size in a background thread. growth
+    is how far it rose above the RSS on entering, which is what the block
+    itself allocated rather than the process's lifetime high-water mark.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss():
+        """Returns the current RSS in bytes (falls back to the lifetime peak off Linux)."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            self._stop.wait(self.interval)
+
+    @property
+    def growth(self):
+        return self.peak - self.start
+
+    def __enter__(self):
+        self.start = self.peak = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+def make_text(rng, words):
+    """Returns deterministic filler text with sentences and paragraphs."""
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    return "\n".join(paragraphs)
+
+def make_text_pdf(rng, pages, lines_per_page=45):
+    """Returns the bytes of a born-digital PDF with text on every page."""
+    import fitz
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n".join(make_text(rng, 12) for _ in range(lines_per_page))
+        page.insert_textbox(fitz.Rect(50, 50, 560, 790), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def make_scanned_pdf(text_pdf_bytes, pages, dpi=200):
+    """Returns the bytes of an image-only PDF made by rendering the first pages of a text PDF."""
+    import fitz
+    scanned = fitz.open()
+    with fitz.open(stream=text_pdf_bytes, filetype="pdf") as source:
+        for page in list(source)[:pages]:
+            pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            new_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pixmap)
+    data = scanned.tobytes()
+    scanned.close()
+    return data
+
+def make_docx(rng, paragraphs):
+    """Returns the bytes of a DOCX file with the given number of paragraphs."""
+    import docx
+    document = docx.Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(make_text(rng, rng.randint(20, 80)))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def make_photo(rng, megapixels):
+    """Returns a PIL image simulating a phone photo of a printed page."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    np_rng = np.random.default_rng(rng.randint(0, 2**32 - 1))
+    # Uneven lighting plus sensor noise on a light background
+    gradient = np.linspace(170, 235, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    noise = np_rng.normal(0, 6, (height, width)).astype(np.float32)
+    gray = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    line_height = max(40, height // 40)
+    for y in range(line_height * 2, height - line_height, line_height):
+        cv2.putText(gray, make_text(rng, 8), (width // 12, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    line_height / 40, 30, max(1, line_height // 20), cv2.LINE_AA)
+    return Image.fromarray(cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB))
+
+def missing_tools(*tools):
+    """Returns a skip reason if any command line tool is missing, else None."""
+    missing = [tool for tool in tools if shutil.which(tool) is None]
+    return f"missing {', '.join(missing)}" if missing else None
+
+def measure(name, func, units, unit, repeat, **meta):
+    """
+    Runs func repeat times and returns a result dict for the stage. If func
+    returns a dict of extra timings, their medians are reported too.
+    """
+    timings = []
+    extras = {}
+    peak_rss = 0
+    rss_growth = 0
+    for _ in range(repeat):
+        gc.collect()
+        with PeakRssSampler() as sampler:
+            started = time.perf_counter()
+            extra = func()
+            timings.append(time.perf_counter() - started)
+        peak_rss = max(peak_rss, sampler.peak)
+        rss_growth = max(rss_growth, sampler.growth)
+        if isinstance(extra, dict):
+            for key, value in extra.items():
+                extras.setdefault(key, []).append(value)
+    median = statistics.median(timings)
+    return {
+        "stage": name,
+        "seconds": median,
+        "seconds_min": min(timings),
+        "runs": timings,
+        "units": units,
+        "unit": unit,
+        "throughput": units / median if median else None,
+        "rss_growth_mb": rss_growth / (1024 * 1024),
+        "process_peak_rss_mb": peak_rss / (1024 * 1024),
+        **{key: statistics.median(values) for key, values in extras.items()},
+        **meta,
+    }
+
+# Run in a fresh interpreter, as a new Streamlit worker would: imports the app,
+# optionally extracts a file, and reports the timings and which heavy modules got loaded
+COLD_START_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter()
+if len(sys.argv) > 2:
+    with open(sys.argv[2], "rb") as f:
+        app.extract_text_from_docx(f)
+heavy = ["edge_tts", "fitz", "pytesseract", "cv2", "PIL.Image"]
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_file_seconds": time.perf_counter() - imported,
+    "heavy_modules_loaded": sum(name in sys.modules for name in heavy),
+    "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+def cold_start(path=None):
+    """Runs COLD_START_SCRIPT in a new interpreter and returns its report."""
+    repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    command = [sys.executable, "-c", COLD_START_SCRIPT, repo] + ([path] if path else [])
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def build_stages(args):
+    """Returns (name, setup) pairs; setup returns (func, units, unit, meta) or a skip reason."""
+    inputs = {}
+
+    def rng(offset):
+        # A separate generator per input keeps inputs identical whichever stages run
+        return random.Random(args.seed * 1000 + offset)
+
+    def text_pdf():
+        if "text_pdf" not in inputs:
+            inputs["text_pdf"] = make_text_pdf(rng(1), args.pages)
+        return inputs["text_pdf"]
+
+    def scanned_pdf():
+        if "scanned_pdf" not in inputs:
+            inputs["scanned_pdf"] = make_scanned_pdf(text_pdf(), args.scanned_pages)
+        return inputs["scanned_pdf"]
+
+    def photo():
+        if "photo" not in inputs:
+            inputs["photo"] = make_photo(rng(2), args.photo_megapixels)
+        return inputs["photo"]
+
+    def on_disk(name, data, suffix):
+        # The app spools uploads to disk and has PyMuPDF and OpenCV read the file
+        if name not in inputs:
+            fd, path = tempfile.mkstemp(prefix="bench-", suffix=suffix)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            atexit.register(os.remove, path)
+            inputs[name] = path
+        return inputs[name]
+
+    def photo_jpeg():
+        buffer = io.BytesIO()
+        photo().save(buffer, format="JPEG", quality=92)
+        return buffer.getvalue()
+
+    def pdf_text_extraction():
+        data = text_pdf()
+        return (lambda: app.extract_text_from_pdf(io.BytesIO(data)), args.pages, "pages",
+                {"input_bytes": len(data)})
+
+    def pdf_text_extraction_parallel():
+        data = text_pdf()
+        # A long-lived pool, as in the app; started before timing
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=args.text_workers)
+        pool.submit(int).result()
+        return (lambda: app.extract_text_from_pdf(io.BytesIO(data), text_executor=pool), args.pages, "pages",
+                {"input_bytes": len(data), "workers": args.text_workers})
+
+    def pdf_rasterization():
+        import fitz
+        data = scanned_pdf()
+        path = on_disk("scanned_pdf_path", data, ".pdf")
+
+        def run():
+            with fitz.open(path) as doc:
+                for page in doc:
+                    app.render_pdf_page(page)
+
+        return (run, args.scanned_pages, "pages", {"input_bytes": len(data)})
+
+    def pdf_ocr():
+        reason = missing_tools("tesseract")
+        if reason:
+            return reason
+        data = scanned_pdf()
+        pages = range(1, args.scanned_pages + 1)
+        path = on_disk("scanned_pdf_path", data, ".pdf")
+        return (lambda: app.ocr_pdf_pages(path, pages), args.scanned_pages, "pages", {"input_bytes": len(data)})
+
+    def docx_extraction():
+        data = make_docx(rng(3), args.docx_paragraphs)
+        return (lambda: app.extract_text_from_docx(io.BytesIO(data)), args.docx_paragraphs, "paragraphs",
+                {"input_bytes": len(data)})
+
+    def image_preprocessing():
+        image = photo()
+        return (lambda: app.process_image_for_ocr(image), 1, "images",
+                {"width": image.width, "height": image.height})
+
+    def image_file_preprocessing():
+        data = photo_jpeg()
+        path = on_disk("photo_path", data, ".jpg")
+        return (lambda: app.process_image_file_for_ocr(path), 1, "images", {"input_bytes": len(data)})
+
+    def image_ocr():
+        reason = missing_tools("tesseract")
+        if reason:
+            return reason
+        processed = app.process_image_for_ocr(photo())
+        return (lambda: app.extract_text_from_image(processed), 1, "images", {})
+
+    def ocr_bands():
+        # Small images, where starting tesseract and loading its model dominate
+        if "ocr_bands" not in inputs:
+            import fitz
+            with fitz.open(on_disk("scanned_pdf_path", scanned_pdf(), ".pdf")) as doc:
+                page = app.process_gray_for_ocr(app.render_pdf_page(doc[0]))
+            band = page.shape[0] // args.ocr_images
+            inputs["ocr_bands"] = [page[i * band:(i + 1) * band] for i in range(args.ocr_images)]
+        return inputs["ocr_bands"]
+
+    def ocr_engine(kind):
+        def setup():
+            reason = missing_tools("tesseract") if kind == "subprocess" else None
+            if kind == "tesserocr" and app.tesserocr is None:
+                reason = "missing tesserocr"
+            if reason:
+                return reason
+            engine = app.make_ocr_engine(kind)
+            bands = ocr_bands()
+            engine.image_to_string(bands[0])  # Warm up, as a long-lived worker would be
+            return (lambda: [engine.image_to_string(band) for band in bands], len(bands), "images", {})
+
+        return setup
+
+    def text_region_detection():
+        processed = app.process_image_for_ocr(photo())
+        return (lambda: app.find_text_regions(processed), 1, "images",
+                {"regions": len(app.find_text_regions(processed))})
+
+    def image_ocr_regions():
+        reason = missing_tools("tesseract")
+        if reason:
+            return reason
+        processed = app.process_image_for_ocr(photo())
+        return (lambda: app.extract_text_from_image(processed, crop_to_text=True), 1, "images", {})
+
+    def clean_text():
+        # Raw text as extracted from PDF pages, with its line breaks and padding
+        text = "\n".join(app.extract_text_from_pdf(io.BytesIO(text_pdf())))
+        return (lambda: app.clean_text(text), len(text), "chars", {})
+
+    def synthesis():
+        text = make_text(rng(4), args.synthesis_chars // 6)[:args.synthesis_chars]
+        fake = make_fake_edge_tts(first_byte_latency=args.tts_latency)
+
+        def run():
+            original = app.edge_tts
+            app.edge_tts = fake
+            started = time.perf_counter()
+            extra = {}
+
+            def on_segment(index, data):
+                # How long a listener waits before playback can start
+                if index == 0:
+                    extra["first_audio_seconds"] = time.perf_counter() - started
+
+            try:
+                asyncio.run(app.generate_audio(
+                    text, "en-US-AriaNeural", max_concurrency=args.tts_concurrency, on_segment=on_segment
+                ))
+            finally:
+                app.edge_tts = original
+            return extra
+
+        return (run, len(text), "chars",
+                {"tts_latency": args.tts_latency, "tts_concurrency": args.tts_concurrency})
+
+    def synthesis_shared():
+        # Several sessions generating at once through the node's scheduler, with streams dropped at random
+        text = make_text(rng(4), args.synthesis_chars // 6)[:args.synthesis_chars]
+        fake = make_fake_edge_tts(first_byte_latency=args.tts_latency, failure_rate=args.tts_failure_rate, seed=args.seed)
+
+        def run():
+            original = app.edge_tts
+            app.edge_tts = fake
+            scheduler = app.SynthesisScheduler(max_concurrency=args.tts_global_concurrency)
+            started = time.perf_counter()
+            first_audio = {}
+
+            def on_segment(session):
+                def report(index, data):
+                    if index == 0:
+                        first_audio[session] = time.perf_counter() - started
+                return report
+
+            async def generate_all():
+                await asyncio.gather(*(
+                    app.generate_audio(
+                        text, "en-US-AriaNeural", max_concurrency=args.tts_concurrency,
+                        on_segment=on_segment(session), scheduler=scheduler, session=session,
+                    )
+                    for session in range(args.sessions)
+                ))
+
+            try:
+                asyncio.run(generate_all())
+            finally:
+                app.edge_tts = original
+            return {
+                "first_audio_seconds_max": max(first_audio.values()),
+                "failed_streams": scheduler.stats["failures"],
+                "max_active_streams": scheduler.stats["max_active"],
+            }
+
+        return (run, len(text) * args.sessions, "chars",
+                {"tts_latency": args.tts_latency, "tts_concurrency": args.tts_concurrency, "sessions": args.sessions,
+                 "tts_global_concurrency": args.tts_global_concurrency, "tts_failure_rate": args.tts_failure_rate})
+
+    def app_import():
+        return (lambda: cold_start(), 1, "imports", {})
+
+    def docx_cold_start():
+        # A fresh worker whose first upload is a DOCX file, which needs none of the heavy backends
+        data = make_docx(rng(3), args.docx_paragraphs)
+        path = on_disk("docx_path", data, ".docx")
+        return (lambda: cold_start(path), 1, "files", {"input_bytes": len(data)})
+
+    return [
+        ("app_import", app_import),
+        ("docx_cold_start", docx_cold_start),
+        ("pdf_text_extraction", pdf_text_extraction),
+        ("pdf_text_extraction_parallel", pdf_text_extraction_parallel),
+        ("pdf_rasterization", pdf_rasterization),
+        ("pdf_ocr", pdf_ocr),
+        ("docx_extraction", docx_extraction),
+        ("image_preprocessing", image_preprocessing),
+        ("image_file_preprocessing", image_file_preprocessing),
+        ("image_ocr", image_ocr),
+        ("text_region_detection", text_region_detection),
+        ("image_ocr_regions", image_ocr_regions),
+        ("ocr_engine_subprocess", ocr_engine("subprocess")),
+        ("ocr_engine_tesserocr", ocr_engine("tesserocr")),
+        ("clean_text", clean_text),
+        ("synthesis", synthesis),
+        ("synthesis_shared", synthesis_shared),
+    ]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_results(results, baseline=None):
+    """Formats results as a table, with the change against a baseline run if given."""
+    previous = {r["stage"]: r for r in (baseline or {}).get("results", []) if "seconds" in r}
+    lines = [f"{'Stage':<28} {'Median':>9} {'Throughput':>22} {'RSS growth':>10} {'vs base':>8}"]
+    for result in results:
+        if "skipped" in result:
+            lines.append(f"{result['stage']:<28} skipped ({result['skipped']})")
+            continue
+        change = ""
+        if result["stage"] in previous:
+            change = f"{result['seconds'] / previous[result['stage']]['seconds']:7.2f}x"
+        throughput = f"{result['throughput']:.1f} {result['unit']}/s"
+        lines.append(f"{result['stage']:<28} {result['seconds']:8.3f}s {throughput:>22} "
+                     f"{result['rss_growth_mb']:8.1f}MB {change:>8}")
+    return "\n".join(lines)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the document-to-speech pipeline stages.")
+    parser.add_argument("--stages", nargs="*", help="Only run these stages.")
+    parser.add_argument("--pages", type=int, default=300, help="Pages in the text PDF.")
+    parser.add_argument("--text-workers", type=int, default=app.OCR_WORKERS, help="Processes for parallel PDF text.")
+    parser.add_argument("--scanned-pages", type=int, default=20, help="Pages in the scanned PDF.")
+    parser.add_argument("--ocr-images", type=int, default=20, help="Small images OCR'd by the OCR engine stages.")
+    parser.add_argument("--docx-paragraphs", type=int, default=5000, help="Paragraphs in the DOCX file.")
+    parser.add_argument("--photo-megapixels", type=float, default=12, help="Size of the synthetic photo.")
+    parser.add_argument("--synthesis-chars", type=int, default=20_000, help="Characters to synthesize.")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Fake TTS time to first byte (s).")
+    parser.add_argument("--tts-concurrency", type=int, default=app.DEFAULT_TTS_CONCURRENCY)
+    parser.add_argument("--sessions", type=int, default=4, help="Sessions synthesizing at once in synthesis_shared.")
+    parser.add_argument("--tts-global-concurrency", type=int, default=app.TTS_GLOBAL_CONCURRENCY)
+    parser.add_argument("--tts-failure-rate", type=float, default=0.1, help="Share of fake TTS streams that fail.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write results to.")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = []
+    for name, setup in build_stages(args):
+        if args.stages and name not in args.stages:
+            continue
+        try:
+            stage = setup()
+        except ImportError as e:
+            stage = f"missing {e.name}"
+        if isinstance(stage, str):
+            results.append({"stage": name, "skipped": stage})
+        else:
+            func, units, unit, meta = stage
+            results.append(measure(name, func, units, unit, args.repeat, **meta))
+        print(format_results(results[-1:]).splitlines()[-1], flush=True)
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print()
+    print(format_results(results, baseline))
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
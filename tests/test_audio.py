@@ -0,0 +1,545 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import asyncio
+import sys
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Mock dependencies globally before import
+sys.modules["streamlit"] = MagicMock()
+sys.modules["edge_tts"] = MagicMock()
+sys.modules["fitz"] = MagicMock()
+sys.modules["docx"] = MagicMock()
+sys.modules["pytesseract"] = MagicMock()
+sys.modules["PIL"] = MagicMock()
+sys.modules["PIL.Image"] = MagicMock()
+sys.modules["PIL.ImageOps"] = MagicMock()
+sys.modules["cv2"] = MagicMock()
+sys.modules["numpy"] = MagicMock()
+
+# Add repo root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import app
+from fake_tts import make_fake_edge_tts
+
+# Stand-in for edge_tts.Communicate that streams the text back as "audio"
+class FakeCommunicate:
+    active = 0
+    max_active = 0
+    calls = []
+
+    def __init__(self, text, voice, **kwargs):
+        self.text = text
+        self.voice = voice
+        FakeCommunicate.calls.append(text)
+
+    async def stream(self):
+        FakeCommunicate.active += 1
+        FakeCommunicate.max_active = max(FakeCommunicate.max_active, FakeCommunicate.active)
+        try:
+            await asyncio.sleep(0.01)
+            yield {"type": "audio", "data": self.text.encode()}
+            yield {"type": "WordBoundary", "offset": 0, "duration": 0, "text": ""}
+        finally:
+            FakeCommunicate.active -= 1
+
+class SentenceCommunicate(FakeCommunicate):
+    """Reports a sentence boundary for every line, one second apart."""
+
+    async def stream(self):
+        yield {"type": "audio", "data": self.text.encode()}
+        for i, line in enumerate(self.text.splitlines()):
+            yield {"type": "SentenceBoundary", "offset": i * 10_000_000, "duration": 5_000_000, "text": line}
+
+class TestChunking(unittest.TestCase):
+
+    def test_short_text_single_chunk(self):
+        self.assertEqual(app.split_text_into_chunks("Hello.\nWorld."), ["Hello.\nWorld."])
+
+    def test_empty_text(self):
+        self.assertEqual(app.split_text_into_chunks("  \n\n "), [])
+
+    def test_splits_at_paragraphs(self):
+        text = "\n".join(["A" * 40, "B" * 40, "C" * 40])
+        chunks = app.split_text_into_chunks(text, max_chars=90)
+        self.assertEqual(chunks, ["A" * 40 + "\n" + "B" * 40, "C" * 40])
+
+    def test_long_paragraph_splits_at_sentences(self):
+        text = "First sentence here. Second sentence here. Third one."
+        chunks = app.split_text_into_chunks(text, max_chars=25)
+        self.assertEqual(chunks, ["First sentence here.", "Second sentence here.", "Third one."])
+        self.assertTrue(all(len(c) <= 25 for c in chunks))
+
+    def test_first_chunk_is_short(self):
+        text = "First sentence here. Second sentence here.\nNext paragraph."
+        chunks = app.split_text_into_chunks(text, max_chars=100, first_chunk_chars=25)
+        self.assertEqual(chunks, ["First sentence here.", "Second sentence here.\nNext paragraph."])
+
+    def test_unbroken_text_is_hard_split(self):
+        chunks = app.split_text_into_chunks("X" * 25, max_chars=10)
+        self.assertEqual(chunks, ["X" * 10, "X" * 10, "X" * 5])
+
+class TestGenerateAudio(unittest.TestCase):
+
+    def setUp(self):
+        self.original_communicate = app.edge_tts.Communicate
+        app.edge_tts.Communicate = FakeCommunicate
+        FakeCommunicate.active = 0
+        FakeCommunicate.max_active = 0
+        FakeCommunicate.calls = []
+
+    def tearDown(self):
+        app.edge_tts.Communicate = self.original_communicate
+
+    def test_segments_stitched_in_order(self):
+        text = "\n".join(f"Paragraph {i}." for i in range(10))
+        audio = asyncio.run(app.generate_audio(text, "voice"))
+        self.assertEqual(audio, text.encode())
+
+    def test_concurrency_is_bounded(self):
+        # Each paragraph becomes its own chunk
+        text = "\n".join("P" * 2900 for _ in range(8))
+        audio = asyncio.run(app.generate_audio(text, "voice", max_concurrency=3))
+        self.assertEqual(len(audio), 2900 * 8)
+        self.assertEqual(FakeCommunicate.max_active, 3)
+
+    def test_pages_are_chunked_separately(self):
+        audio = asyncio.run(app.generate_audio(["Page one.", "Page two."], "voice"))
+        self.assertEqual(audio, b"Page one.Page two.")
+        self.assertEqual(FakeCommunicate.calls, ["Page one.", "Page two."])
+
+    def test_cache_only_resynthesizes_edited_page(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            asyncio.run(app.generate_audio(["Page one.", "Page two."], "voice", cache=cache))
+            FakeCommunicate.calls = []
+
+            audio = asyncio.run(app.generate_audio(["Page one.", "Page 2 edited."], "voice", cache=cache))
+
+            self.assertEqual(audio, b"Page one.Page 2 edited.")
+            self.assertEqual(FakeCommunicate.calls, ["Page 2 edited."])
+
+    def test_cache_key_depends_on_voice(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            asyncio.run(app.generate_audio("Hello.", "voice-a", cache=cache))
+            asyncio.run(app.generate_audio("Hello.", "voice-b", cache=cache))
+            self.assertEqual(len(FakeCommunicate.calls), 2)
+
+    def test_segments_reported_as_chunks_finish(self):
+        segments = {}
+        text = "Opening line.\n" + "\n".join("P" * 2900 for _ in range(2))
+        audio = asyncio.run(app.generate_audio(text, "voice", on_segment=lambda index, data: segments.update({index: data})))
+
+        self.assertEqual(FakeCommunicate.calls[0], "Opening line.")
+        self.assertEqual(sorted(segments), [0, 1, 2])
+        self.assertEqual(b"".join(segments[i] for i in range(3)), audio)
+
+    def test_index_maps_pages_and_sentences_to_time(self):
+        app.edge_tts.Communicate = SentenceCommunicate
+        pages = ["A" * 3000 + "\nSecond line", "", "Last page."]
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.object(app, "TTS_FIRST_CHUNK_CHARS", 3000), \
+                patch.object(app, "TTS_AUDIO_BYTES_PER_SECOND", 1000):
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            for _ in range(2):  # The second run is served from the cache
+                index = app.AudioIndex()
+                asyncio.run(app.generate_audio(pages, "voice", cache=cache, index=index))
+
+                self.assertEqual(index.page_starts, [0.0, 3.011, 3.011])
+                self.assertEqual(index.sentences[1:], [(3.0, 0, "Second line"), (3.011, 2, "Last page.")])
+                self.assertEqual(index.find("last PAGE"), (3.011, 2))
+                self.assertIsNone(index.find("missing"))
+                self.assertEqual(index.page_at(3.5), 2)
+                self.assertEqual(index.duration, 3.021)
+
+    def test_page_audio_prefetches_ahead(self):
+        jobs = app.SynthesisJobs()
+        page_audio = app.PageAudio(jobs)
+
+        current = page_audio.update("Page one.", ["Page two.", "Page three."], "voice")
+        self.assertEqual(current.result(timeout=5), b"Page one.")
+        later = page_audio.update("Page two.", ["Page three."], "voice", keep=["Page one."])
+        self.assertEqual(later.result(timeout=5), b"Page two.")
+        page_audio.update("Page three.", [], "voice", keep=["Page two."]).result(timeout=5)
+
+        # Pages already prefetched are not synthesized again, and ahead pages wait for the current one
+        self.assertEqual(FakeCommunicate.calls, ["Page one.", "Page two.", "Page three."])
+        self.assertEqual(len(page_audio._futures), 2)
+
+    def test_pages_are_extracted_as_synthesis_gets_to_them(self):
+        loaded = []
+        first_segment = []
+
+        def source(number):
+            def load():
+                time.sleep(0.02)  # OCR
+                loaded.append(number)
+                return f"Page {number}."
+            return load
+
+        pages = ["Page 0.", *(source(number) for number in range(1, 8))]
+        with patch.object(app, "TTS_PAGE_LOAD_AHEAD", 1):
+            audio = asyncio.run(app.generate_audio(
+                pages, "voice", on_segment=lambda index, data: first_segment.append(len(loaded)) if index == 0 else None
+            ))
+
+        self.assertEqual(audio, b"".join(f"Page {i}.".encode() for i in range(8)))
+        self.assertEqual(sorted(loaded), list(range(1, 8)))
+        self.assertLess(first_segment[0], 7)  # Playback could start before the last page was extracted
+
+    def test_progress_reports_every_chunk(self):
+        reports = []
+        asyncio.run(app.generate_audio(["One.", "Two.", "Three."], "voice", progress=lambda *args: reports.append(args)))
+        self.assertEqual(reports, [(0, 3), (1, 3), (2, 3), (3, 3)])
+
+class FlakyCommunicate(FakeCommunicate):
+    """Fails every stream of text containing "fail"."""
+
+    async def stream(self):
+        if "fail" in self.text:
+            raise ConnectionError("stream dropped")
+        yield {"type": "audio", "data": self.text.encode()}
+
+class RejectingCommunicate(FakeCommunicate):
+    """Rejects every stream of text containing "bad", as edge-tts does for text it can't speak."""
+
+    async def stream(self):
+        if "bad" in self.text:
+            raise ValueError("no audio received")
+        yield {"type": "audio", "data": self.text.encode()}
+
+class TestSynthesisScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.original_edge_tts = app.edge_tts
+        self.fake = make_fake_edge_tts(first_byte_latency=0.01, realtime_factor=1000, failure_rate=0.3, seed=1)
+        app.edge_tts = self.fake
+        FakeCommunicate.calls = []
+        patcher = patch.multiple(app, TTS_RETRY_BASE_SECONDS=0, TTS_MAX_ATTEMPTS=10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        app.edge_tts = self.original_edge_tts
+
+    def test_cap_is_shared_between_generations(self):
+        scheduler = app.SynthesisScheduler(max_concurrency=3, backoff=0)
+        text = "\n".join("P" * 2900 for _ in range(4))
+
+        async def run():
+            return await asyncio.gather(*(
+                app.generate_audio(text, "voice", max_concurrency=4, scheduler=scheduler, session=session)
+                for session in ["a", "b"]
+            ))
+
+        asyncio.run(run())
+
+        self.assertEqual(self.fake.stats["max_active"], 3)
+        self.assertEqual(scheduler.stats["max_active"], 3)
+
+    def test_only_failed_chunks_are_retried(self):
+        scheduler = app.SynthesisScheduler(max_concurrency=4, backoff=0)
+        text = "\n".join(f"Paragraph {i}. " + "P" * 2900 for i in range(8))
+
+        audio = asyncio.run(app.generate_audio(text, "voice", scheduler=scheduler))
+
+        chunks = app.split_text_into_chunks(text, first_chunk_chars=app.TTS_FIRST_CHUNK_CHARS)
+        self.assertGreater(self.fake.stats["failures"], 0)
+        self.assertEqual(self.fake.stats["streams"], len(chunks) + self.fake.stats["failures"])
+        self.assertEqual(scheduler.stats["failures"], self.fake.stats["failures"])
+        expected = asyncio.run(app.generate_audio(text, "voice"))
+        self.assertEqual(len(audio), len(expected))
+
+    def test_sessions_are_served_in_turn(self):
+        scheduler = app.SynthesisScheduler(max_concurrency=1, backoff=0)
+        order = []
+
+        async def request(session, name, queued=None):
+            async with scheduler.slot(session):
+                order.append(name)
+                if queued is not None:
+                    await queued.wait()
+                await asyncio.sleep(0)
+
+        async def run():
+            queued = asyncio.Event()
+            first = asyncio.create_task(request("a", "a1", queued))
+            await asyncio.sleep(0.01)
+            tasks = [asyncio.create_task(request("a", f"a{i}")) for i in range(2, 5)]
+            tasks.append(asyncio.create_task(request("b", "b1")))
+            await asyncio.sleep(0.01)
+            queued.set()
+            await asyncio.gather(first, *tasks)
+
+        asyncio.run(run())
+
+        self.assertEqual(order, ["a1", "a2", "b1", "a3", "a4"])
+
+    def test_cancelled_waiter_passes_slot_on(self):
+        scheduler = app.SynthesisScheduler(max_concurrency=1, backoff=0)
+
+        async def run():
+            async with scheduler.slot("a"):
+                waiter = asyncio.create_task(scheduler._acquire("b"))
+                await asyncio.sleep(0.01)
+                waiter.cancel()
+                await asyncio.sleep(0.01)
+            async with scheduler.slot("c"):
+                return True
+
+        self.assertTrue(asyncio.run(asyncio.wait_for(run(), timeout=5)))
+
+    def test_backoff_doubles_until_success(self):
+        scheduler = app.SynthesisScheduler(backoff=1, max_backoff=3)
+        self.assertEqual([scheduler.failed() for _ in range(4)], [1, 2, 3, 3])
+        scheduler.succeeded()
+        self.assertEqual(scheduler.failed(), 1)
+
+    def test_finished_parts_are_kept_when_a_part_fails(self):
+        app.edge_tts = MagicMock(Communicate=FlakyCommunicate)
+        with tempfile.TemporaryDirectory() as tmp, patch.object(app, "TTS_MAX_ATTEMPTS", 2):
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            with self.assertRaisesRegex(RuntimeError, "1 of 3 parts failed"):
+                asyncio.run(app.generate_audio(["Page one.", "Page fail.", "Page three."], "voice", cache=cache))
+            self.assertEqual(FakeCommunicate.calls.count("Page fail."), 2)
+
+            FakeCommunicate.calls = []
+            app.edge_tts = MagicMock(Communicate=FakeCommunicate)
+            audio = asyncio.run(app.generate_audio(["Page one.", "Page fail.", "Page three."], "voice", cache=cache))
+
+        self.assertEqual(audio, b"Page one.Page fail.Page three.")
+        self.assertEqual(FakeCommunicate.calls, ["Page fail."])
+
+    def test_only_transient_errors_are_retried(self):
+        app.edge_tts = MagicMock(Communicate=RejectingCommunicate)
+        scheduler = app.SynthesisScheduler(backoff=0)
+        with self.assertRaisesRegex(RuntimeError, "1 of 2 parts failed: no audio received"):
+            asyncio.run(app.generate_audio(["Page one.", "Page bad."], "voice", scheduler=scheduler))
+
+        self.assertEqual(FakeCommunicate.calls.count("Page bad."), 1)
+        self.assertEqual(scheduler.stats["failures"], 0)  # Other streams are not held back
+        self.assertTrue(app.is_transient_tts_error(ConnectionError("stream dropped")))
+        self.assertTrue(app.is_transient_tts_error(asyncio.TimeoutError()))
+        self.assertFalse(app.is_transient_tts_error(ValueError("no audio received")))
+
+class TestSynthesisJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = app.SynthesisJobs(max_finished=2)
+
+    def wait(self, job):
+        try:
+            job.future.result(timeout=5)
+        except BaseException:
+            pass
+
+    def test_job_runs_in_background_with_progress(self):
+        async def work(progress):
+            for done in range(1, 4):
+                await asyncio.sleep(0.001)
+                progress(done, 3)
+            return b"audio"
+
+        job = self.jobs.submit(work, label="doc.pdf")
+        self.wait(job)
+
+        self.assertIs(self.jobs.get(job.id), job)
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.result, b"audio")
+        self.assertEqual((job.done_chunks, job.total_chunks), (3, 3))
+
+    def test_job_streams_segments_in_order(self):
+        release = threading.Event()
+
+        async def work(progress, on_segment):
+            on_segment(1, b"B")
+            on_segment(0, b"A")
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+            on_segment(2, b"C")
+            return b"ABC"
+
+        job = self.jobs.submit(work, segments=True)
+        stream = job.iter_audio()
+        self.assertEqual([next(stream), next(stream)], [b"A", b"B"])
+        release.set()
+        self.assertEqual(list(stream), [b"C"])
+        self.wait(job)
+
+        self.assertEqual(job.result, b"ABC")
+        self.assertEqual(job.segments, [])  # Only result is kept once nobody streams
+        self.assertEqual(list(job.iter_audio()), [b"ABC"])
+
+    def test_finished_audio_kept_in_cache(self):
+        async def work(progress):
+            return b"audio"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            jobs = app.SynthesisJobs(cache=cache)
+            job = jobs.submit(work)
+            self.wait(job)
+
+            self.assertEqual(job.status, "done")
+            self.assertIsNone(job.result)  # Not held in memory
+            self.assertEqual(job.result_bytes, 5)
+            self.assertEqual(job.audio(), b"audio")
+            self.assertEqual(list(job.iter_audio()), [b"audio"])
+
+            os.remove(os.path.join(tmp, job.result_key()))
+            self.assertIsNone(job.audio())
+            self.assertEqual(list(job.iter_audio()), [])
+
+    def test_stream_server(self):
+        async def work(progress, on_segment):
+            on_segment(0, b"first ")
+            on_segment(1, b"second")
+            return b"first second"
+
+        job = self.jobs.submit(work, segments=True)
+        server = app.start_audio_stream_server(self.jobs, 0)
+        self.addCleanup(server.shutdown)
+        url = f"http://localhost:{server.server_address[1]}"
+
+        with urllib.request.urlopen(f"{url}/audio/{job.id}.mp3", timeout=5) as response:
+            self.assertEqual(response.headers["Content-Type"], "audio/mpeg")
+            self.assertEqual(response.read(), b"first second")
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/audio/{'0' * 32}.mp3", timeout=5)
+
+    def test_failed_job_keeps_error(self):
+        async def work(progress):
+            raise RuntimeError("service unavailable")
+
+        job = self.jobs.submit(work)
+        self.wait(job)
+
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "service unavailable")
+
+    def test_cancel_running_job(self):
+        started = threading.Event()
+
+        async def work(progress):
+            started.set()
+            await asyncio.sleep(10)
+
+        job = self.jobs.submit(work)
+        self.assertTrue(started.wait(5))
+        job.cancel()
+        self.wait(job)
+
+        self.assertEqual(job.status, "cancelled")
+        self.assertFalse(job.is_running())
+
+    def test_old_finished_jobs_are_pruned(self):
+        async def work(progress):
+            return b""
+
+        finished = []
+        for _ in range(3):
+            job = self.jobs.submit(work)
+            self.wait(job)
+            finished.append(job)
+        self.jobs.submit(work)
+
+        self.assertIsNone(self.jobs.get(finished[0].id))
+        self.assertIs(self.jobs.get(finished[2].id), finished[2])
+
+class SessionState(dict):
+    """Stand-in for st.session_state, with attribute access."""
+
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+class TestAudioPreview(unittest.TestCase):
+
+    def setUp(self):
+        self.original_session_state = app.st.session_state
+        app.st.session_state = SessionState()
+        self.addCleanup(setattr, app.st, "session_state", self.original_session_state)
+        self.now = 1000.0
+        patcher = patch.multiple(app, TTS_AUDIO_BYTES_PER_SECOND=10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(app.time, "time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preview_grows_once_played_through(self):
+        job = app.AudioJob()
+        self.assertFalse(app.audio_preview_due(job))
+        job.add_segment(0, b"A" * 20)  # 2 seconds
+        self.assertTrue(app.audio_preview_due(job))
+        app.update_audio_preview(job)
+
+        job.add_segment(1, b"B" * 30)
+        self.now += 1
+        self.assertFalse(app.audio_preview_due(job))  # Still playing
+        self.now += 1
+        self.assertTrue(app.audio_preview_due(job))
+        app.update_audio_preview(job)
+
+        self.assertEqual(app.st.session_state.audio_preview, b"A" * 20 + b"B" * 30)
+        self.assertEqual(app.st.session_state.audio_preview_start, 2)  # Carries on where the first part ended
+        self.now += 2
+        self.assertEqual(app.audio_preview_position(job), 4)
+        self.now += 10
+        self.assertEqual(app.audio_preview_position(job), 5)  # Waits at the end for more
+        self.assertFalse(app.audio_preview_due(job))
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_put_and_get(self):
+        cache = app.DiskCache(self.tmp.name, max_bytes=100)
+        self.assertIsNone(cache.get("missing"))
+        cache.put("key", b"data")
+        self.assertEqual(cache.get("key"), b"data")
+
+    def test_evicts_least_recently_used(self):
+        cache = app.DiskCache(self.tmp.name, max_bytes=25)
+        cache.put("a", b"A" * 10)
+        cache.put("b", b"B" * 10)
+        # Make "a" older than "b", then touch it so "b" becomes the LRU entry
+        old = time.time() - 100
+        os.utime(os.path.join(self.tmp.name, "a"), (old, old))
+        os.utime(os.path.join(self.tmp.name, "b"), (old + 1, old + 1))
+        cache.get("a")
+
+        cache.put("c", b"C" * 10)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"A" * 10)
+        self.assertEqual(cache.get("c"), b"C" * 10)
+
+    def test_full_cache_is_not_rescanned_on_every_put(self):
+        cache = app.DiskCache(self.tmp.name, max_bytes=1000)
+        with patch.object(cache, "_entries", wraps=cache._entries) as scans:
+            for i in range(300):
+                cache.put(f"key{i}", b"X" * 10)
+
+        self.assertLessEqual(scans.call_count, 300 // 10)  # Once per 10 writes, as 10% is freed each time
+        self.assertLessEqual(sum(entry[1] for entry in cache._entries()), 1000)
+
+    def test_normalized_text_shares_key(self):
+        self.assertEqual(
+            app.audio_cache_key("Hello   world.\n", "voice"),
+            app.audio_cache_key("Hello world.", "voice"),
+        )
+        self.assertNotEqual(
+            app.audio_cache_key("Hello world.", "voice"),
+            app.audio_cache_key("Hello world.", "voice", {"rate": "+10%"}),
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import asyncio
+import concurrent.futures
+import os
+import sys
+import tempfile
+
+# Mock dependencies globally before import
+sys.modules["streamlit"] = MagicMock()
+sys.modules["edge_tts"] = MagicMock()
+sys.modules["fitz"] = MagicMock()
+sys.modules["docx"] = MagicMock()
+sys.modules["pytesseract"] = MagicMock()
+sys.modules["PIL"] = MagicMock()
+sys.modules["PIL.Image"] = MagicMock()
+sys.modules["PIL.ImageOps"] = MagicMock()
+sys.modules["cv2"] = MagicMock()
+sys.modules["numpy"] = MagicMock()
+
+# Add repo root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+import batch
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input_dir = os.path.join(self.tmp.name, "in")
+        self.output_dir = os.path.join(self.tmp.name, "out")
+        os.makedirs(os.path.join(self.input_dir, "sub"))
+        for name in ["a.docx", "b.docx", os.path.join("sub", "c.docx"), "notes.txt"]:
+            with open(os.path.join(self.input_dir, name), "wb") as f:
+                f.write(name.encode())
+        self.options = batch.build_parser().parse_args([self.input_dir, "-o", self.output_dir])
+
+    def run_batch(self, jobs):
+        async def fake_generate_audio(pages, voice, **kwargs):
+            return "|".join(pages).encode()
+
+        with patch.object(app, "generate_audio", side_effect=fake_generate_audio), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            return asyncio.run(batch.run_batch(jobs, self.options, executor=pool, log=lambda message: None))
+
+    def test_find_jobs_mirrors_layout(self):
+        jobs = batch.find_jobs([self.input_dir], self.output_dir)
+        outputs = [os.path.relpath(output, self.output_dir) for _, output in jobs]
+        self.assertEqual(outputs, ["a.mp3", "b.mp3", os.path.join("sub", "c.mp3")])
+
+    def test_converts_and_resumes(self):
+        jobs = batch.find_jobs([self.input_dir], self.output_dir)
+        with patch.object(app, "extract_text_from_docx", side_effect=lambda f: [f.name]) as extract_mock:
+            results = self.run_batch(jobs)
+            self.assertEqual([r.status for r in results], ["done", "done", "done"])
+            with open(os.path.join(self.output_dir, "a.mp3"), "rb") as f:
+                self.assertTrue(f.read().endswith(b"a.docx"))
+
+            # Interrupted run: one output missing
+            os.remove(os.path.join(self.output_dir, "b.mp3"))
+            extract_mock.reset_mock()
+            results = self.run_batch(jobs)
+
+        self.assertEqual([r.status for r in results], ["skipped", "done", "skipped"])
+        self.assertEqual(extract_mock.call_count, 1)
+
+    def test_failure_does_not_stop_batch(self):
+        jobs = batch.find_jobs([self.input_dir], self.output_dir)
+
+        def extract(f):
+            if f.name.endswith("b.docx"):
+                raise ValueError("corrupt file")
+            return ["Text"]
+
+        with patch.object(app, "extract_text_from_docx", side_effect=extract):
+            results = self.run_batch(jobs)
+
+        self.assertEqual([r.status for r in results], ["done", "failed", "done"])
+        self.assertEqual(results[1].error, "corrupt file")
+        self.assertIn("2 done, 1 failed", batch.format_summary(results, 1.0))
+
+    def test_parse_threshold(self):
+        self.assertEqual(batch.parse_threshold("auto"), app.AUTO_THRESHOLD)
+        self.assertEqual(batch.parse_threshold("90"), 90)
+        with self.assertRaises(Exception):
+            batch.parse_threshold("300")
+
+if __name__ == '__main__':
+    unittest.main()
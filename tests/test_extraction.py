@@ -1,7 +1,14 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+import concurrent.futures
+import io
+import tempfile
+import threading
+import time
 import sys
 import os
+import zipfile
+import gc
 
 # Mock dependencies globally before import
 sys.modules["streamlit"] = MagicMock()
@@ -9,7 +16,6 @@ sys.modules["edge_tts"] = MagicMock()
 sys.modules["fitz"] = MagicMock()
 sys.modules["docx"] = MagicMock()
 sys.modules["pytesseract"] = MagicMock()
-sys.modules["pdf2image"] = MagicMock()
 sys.modules["PIL"] = MagicMock()
 sys.modules["PIL.Image"] = MagicMock()
 sys.modules["cv2"] = MagicMock()
@@ -20,63 +26,336 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import app
 
+def make_docx(body):
+    """Returns a minimal DOCX file whose document body is the given WordprocessingML."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+            ' xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+            ' xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape"'
+            ' xmlns:v="urn:schemas-microsoft-com:vml">'
+            f"<w:body>{body}</w:body></w:document>",
+        )
+    buffer.seek(0)
+    return buffer
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+def die_once(marker):
+    """Kills its worker process the first time, as the OOM killer would."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "read"
+
+class TesseractNotFound(Exception):
+    def __init__(self, path, reason):
+        super().__init__(f"{path}: {reason}")  # Can't be rebuilt from its message when unpickled
+
+def raise_unpicklable():
+    raise TesseractNotFound("tesseract", "not installed")
+
 class TestExtraction(unittest.TestCase):
 
     def test_extract_pdf_pages(self):
         mock_doc = MagicMock()
-        mock_page1 = MagicMock()
-        # Make text long enough > 50 chars to avoid OCR fallback
-        mock_page1.get_text.return_value = "Page 1 Text " * 10
-        mock_page2 = MagicMock()
-        mock_page2.get_text.return_value = "Page 2 Text " * 10
+        # Make text long enough to avoid OCR fallback
+        mock_page1 = self._mock_page("Page 1 Text " * 10)
+        mock_page2 = self._mock_page("Page 2 Text " * 10)
         mock_doc.__iter__.return_value = [mock_page1, mock_page2]
 
         app.fitz.open.return_value.__enter__.return_value = mock_doc
 
-        file_mock = MagicMock()
-        file_mock.read.return_value = b"pdf_content"
+        file_mock = io.BytesIO(b"pdf_content")
 
         pages = app.extract_text_from_pdf(file_mock)
 
         self.assertEqual(len(pages), 2)
         self.assertTrue(pages[0].startswith("Page 1 Text"))
 
-    def test_extract_docx_chunks(self):
+    def _mock_page(self, text, image_bboxes=()):
+        page = MagicMock()
+        page.get_text.return_value = text
+        page.rect.x0, page.rect.y0, page.rect.x1, page.rect.y1 = 0, 0, 600, 800
+        page.rect.width, page.rect.height = 600, 800
+        page.get_image_info.return_value = [{"bbox": bbox} for bbox in image_bboxes]
+        return page
+
+    def test_extract_pdf_ocr_only_scanned_pages(self):
         mock_doc = MagicMock()
-        p1 = MagicMock(); p1.text = "Paragraph 1"
-        p2 = MagicMock(); p2.text = "Paragraph 2"
-        mock_doc.paragraphs = [p1, p2]
+        mock_doc.__iter__.return_value = [
+            self._mock_page("Native text " * 20),
+            self._mock_page(""),  # Scanned page, no text layer
+            self._mock_page("Page 3 header", [(0, 0, 600, 800)]),  # Full-page scan with a stamp
+            self._mock_page("Short caption under a photo", [(0, 0, 100, 100)]),
+        ]
+        app.fitz.open.return_value.__enter__.return_value = mock_doc
+
+        file_mock = io.BytesIO(b"pdf_content")
+
+        with patch.object(app, "ocr_pdf_pages", return_value=["OCR page 2", "OCR page 3 text"]) as ocr_mock:
+            pages = app.extract_text_from_pdf(file_mock, executor="pool")
+
+        self.assertEqual(ocr_mock.call_args[0][1], [2, 3])
+        self.assertEqual(pages, ["Native text " * 20, "OCR page 2", "OCR page 3 text", "Short caption under a photo"])
+
+    def test_extract_pdf_force_ocr(self):
+        mock_doc = MagicMock()
+        mock_doc.page_count = 2
+        app.fitz.open.return_value.__enter__.return_value = mock_doc
+
+        file_mock = io.BytesIO(b"pdf_content")
+
+        with patch.object(app, "ocr_pdf_pages", return_value=["a", "b"]) as ocr_mock:
+            pages = app.extract_text_from_pdf(file_mock, force_ocr=True, executor="pool")
+
+        self.assertEqual(pages, ["a", "b"])
+        self.assertEqual(ocr_mock.call_args[0][1], [1, 2])
+
+    def test_page_image_coverage(self):
+        page = self._mock_page("", [(0, 0, 600, 400), (-100, 400, 300, 900)])
+        self.assertAlmostEqual(app.page_image_coverage(page), 0.75)
+
+    def test_ocr_pdf_pages_bounded_in_flight(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_ocr_page(pdf_path, number):
+            with lock:
+                in_flight.append(number)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(number)
+            return f"text{number}"
+
+        with patch.object(app, "ocr_pdf_page", side_effect=fake_ocr_page), \
+                patch("os.path.getsize", return_value=3), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            texts = app.ocr_pdf_pages("doc.pdf", [5, 1, 2, 3, 4, 9], max_in_flight=2, executor=pool)
+
+        self.assertEqual(texts, ["text1", "text2", "text3", "text4", "text5", "text9"])
+        self.assertLessEqual(max(peak), 2)
+
+    def test_ocr_render_dpi(self):
+        page = self._mock_page("")
+        line = {"spans": [{"size": 10, "text": "Body"}, {"size": 10, "text": "text"}, {"size": 24, "text": "Title"}]}
+        page.get_text.return_value = {"blocks": [{"lines": [line]}, {"type": 1}]}
+        self.assertEqual(app.ocr_render_dpi(page), 288)  # 10pt text rendered 40px tall
+
+        page.get_text.return_value = {"blocks": []}
+        page.get_image_info.return_value = [{"width": 1250, "bbox": (0, 0, 600, 800)}]
+        self.assertEqual(app.ocr_render_dpi(page), 150)  # The scan's own resolution
+
+        page.get_image_info.return_value = []
+        page.rect.width, page.rect.height = 72 * 40, 72 * 40  # A 40x40 inch poster
+        self.assertEqual(app.ocr_render_dpi(page), 158)
+
+    def test_open_pdf_pages_uses_extraction_cache(self):
+        app.fitz.open.return_value.__enter__.return_value = MagicMock(page_count=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            with patch.object(app, "extract_pdf_page", side_effect=lambda data, n, *args: f"Page {n}") as extract_mock:
+                first = app.open_pdf_pages(io.BytesIO(b"pdf"), cache=cache)
+                self.assertEqual(list(first), ["Page 1", "Page 2"])
+
+                # Same content, new upload: served from the cache
+                second = app.open_pdf_pages(io.BytesIO(b"pdf"), cache=cache)
+                self.assertEqual(list(second), ["Page 1", "Page 2"])
+                self.assertEqual(extract_mock.call_count, 2)
+
+                # Different parameters are cached separately
+                app.open_pdf_pages(io.BytesIO(b"pdf"), force_ocr=True, cache=cache)[0]
+                self.assertEqual(extract_mock.call_count, 3)
+
+    def fake_native_range(self, path, first, last):
+        self.assertTrue(os.path.exists(path))
+        return [(f"Page {n}", n == 3) for n in range(first, last + 1)]
+
+    def test_parallel_native_text_merges_in_order(self):
+        app.fitz.open.return_value.__enter__.return_value = MagicMock(page_count=5)
+        reports = []
+        with patch.object(app, "PDF_PARALLEL_MIN_PAGES", 2), \
+                patch.object(app, "ocr_pdf_page", return_value="OCR text " * 20), \
+                patch.object(app, "extract_native_text_range", side_effect=self.fake_native_range), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+            pages = app.extract_text_from_pdf(
+                io.BytesIO(b"pdf"), text_executor=pool, executor=pool, progress=lambda *args: reports.append(args)
+            )
+
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+                native = app.ParallelPdfText(pdf_file.name, 5, pool, progress=lambda *args: reports.append(args), range_size=2)
+                results = native.result()
+
+        self.assertEqual(pages, ["Page 1", "Page 2", "OCR text " * 20, "Page 4", "Page 5"])
+        self.assertEqual([text for text, _ in results], [f"Page {n}" for n in range(1, 6)])
+        self.assertEqual(sorted(reports), [(0, 5), (0, 5), (2, 5), (4, 5), (5, 5), (5, 5)])
+
+    def test_open_pdf_pages_uses_parallel_native_text(self):
+        app.fitz.open.return_value.__enter__.return_value = MagicMock(page_count=4)
+        done = []
+        with patch.object(app, "PDF_PARALLEL_MIN_PAGES", 2), \
+                patch.object(app, "extract_native_text_range", side_effect=self.fake_native_range), \
+                patch.object(app, "extract_pdf_page", wraps=app.extract_pdf_page) as extract_mock, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            pages = app.open_pdf_pages(io.BytesIO(b"pdf"), text_executor=pool, progress=lambda *args: done.append(args))
+            pool.shutdown(wait=True)
+
+            self.assertEqual(pages[1], "Page 2")
+        self.assertEqual(done, [(0, 4), (4, 4)])  # The total is known as soon as the PDF is opened
+        self.assertEqual(extract_mock.call_args.kwargs["native"], ("Page 2", False))
+
+    def test_spooled_path(self):
+        with app.spooled_path(io.BytesIO(b"upload")) as path:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"upload")
+        self.assertFalse(os.path.exists(path))
+
+        with tempfile.NamedTemporaryFile() as on_disk:
+            with open(on_disk.name, "rb") as f, app.spooled_path(f) as path:
+                self.assertEqual(path, on_disk.name)  # Used in place
+            self.assertTrue(os.path.exists(on_disk.name))
+
+    def test_open_pdf_pages_spools_once(self):
+        app.fitz.open.return_value.__enter__.return_value = MagicMock(page_count=1)
+        store = app.SessionStore()
+        self.addCleanup(store.clear)
+        with patch.object(app, "extract_pdf_page", side_effect=lambda path, n, *args: open(path, "rb").read().decode()):
+            pages = app.open_pdf_pages(io.BytesIO(b"pdf text"), store=store)
+            self.assertEqual(pages[0], "pdf text")
+
+        self.assertEqual(len([n for n in os.listdir(store.directory) if n.endswith(".pdf")]), 1)
+        del pages
+        gc.collect()
+        self.assertEqual([n for n in os.listdir(store.directory) if n.endswith(".pdf")], [])
+
+    def photo(self, name, data):
+        file = io.BytesIO(data)
+        file.name = name
+        return file
+
+    def test_open_photo_pages_in_capture_order(self):
+        files = [self.photo("b.jpg", b"second"), self.photo("a.jpg", b"first"), self.photo("c.jpg", b"third")]
+        capture_times = {b"first": "2026:01:01 10:00:00", b"second": "2026:01:01 10:00:05", b"third": "2026:01:01 10:00:09"}
+        reports = []
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor, \
+                patch.object(app, "photo_capture_time", side_effect=lambda path: capture_times[open(path, "rb").read()]), \
+                patch.object(app, "ocr_photo", side_effect=lambda path, threshold: f"  {open(path, 'rb').read().decode()}  "):
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            pages = app.open_photo_pages(files, executor=executor, cache=cache, progress=lambda *args: reports.append(args))
+            self.assertEqual(list(pages), ["first", "second", "third"])
+            executor.shutdown(wait=True)
+            self.assertEqual(reports[0], (0, 3))
+            self.assertEqual(reports[-1], (3, 3))
 
-        app.docx.Document.return_value = mock_doc
+            # Photos read before come from the cache, shared with single photo uploads
+            with patch.object(app, "ocr_photo") as ocr_mock:
+                pages = app.open_photo_pages([self.photo("a.jpg", b"first")], cache=cache)
+                self.assertEqual(list(pages), ["first"])
+            ocr_mock.assert_not_called()
 
-        file_mock = MagicMock()
-        pages = app.extract_text_from_docx(file_mock)
+    def test_photo_pages_read_in_pool_can_be_peeked(self):
+        files = [self.photo("a.jpg", b"first"), self.photo("b.jpg", b"second")]
+
+        def ocr(path, threshold):
+            text = open(path, "rb").read().decode()
+            if text == "second":
+                raise RuntimeError("worker died")
+            return text
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor, \
+                patch.object(app, "photo_capture_time", return_value=None), \
+                patch.object(app, "ocr_photo", side_effect=ocr) as ocr_mock:
+            pages = app.open_photo_pages(files, executor=executor)
+            executor.shutdown(wait=True)
+
+            self.assertEqual([app.loaded_page(pages, 0), app.loaded_page(pages, 1)], ["first", None])
+            ocr_mock.side_effect = lambda path, threshold: "second again"
+            self.assertEqual(pages[1], "second again")  # Failed in the pool, read in the foreground
+
+    def test_open_photo_pages_upload_order_without_capture_times(self):
+        files = [self.photo("b.jpg", b"second"), self.photo("a.jpg", b"first")]
+        with patch.object(app, "photo_capture_time", side_effect=lambda path: None if open(path, "rb").read() == b"first" else "2026:01:01 10:00:00"), \
+                patch.object(app, "ocr_photo", side_effect=lambda path, threshold: open(path, "rb").read().decode()):
+            pages = app.open_photo_pages(files)
+            self.assertEqual(list(pages), ["second", "first"])
+
+    def test_cached_extraction_keyed_by_content(self):
+        key_a = app.extraction_cache_key(app.file_content_hash(io.BytesIO(b"a")), kind="docx")
+        key_b = app.extraction_cache_key(app.file_content_hash(io.BytesIO(b"b")), kind="docx")
+        self.assertNotEqual(key_a, key_b)
+
+        extract = MagicMock(return_value=["Text"])
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            self.assertEqual(app.cached_extraction(cache, key_a, extract), ["Text"])
+            self.assertEqual(app.cached_extraction(cache, key_a, extract), ["Text"])
+        extract.assert_called_once()
+
+    def test_extract_docx_chunks(self):
+        file = make_docx(paragraph("Paragraph 1") + paragraph("Paragraph 2"))
+
+        pages = app.extract_text_from_docx(file)
 
         self.assertEqual(len(pages), 1)
         self.assertIn("Paragraph 1", pages[0])
 
     def test_extract_docx_large_chunks(self):
-        mock_doc = MagicMock()
-        p1 = MagicMock(); p1.text = "A" * 600
-        p2 = MagicMock(); p2.text = "B" * 600
-        mock_doc.paragraphs = [p1, p2]
-
-        app.docx.Document.return_value = mock_doc
+        file = make_docx(paragraph("A" * 600) + paragraph("B" * 600))
 
-        file_mock = MagicMock()
-        pages = app.extract_text_from_docx(file_mock)
+        pages = app.extract_text_from_docx(file)
 
         self.assertEqual(len(pages), 2)
         self.assertIn("A"*600, pages[0])
         self.assertIn("B"*600, pages[1])
 
+    def test_extract_docx_tables_in_document_order(self):
+        table = (
+            "<w:tbl><w:tr>"
+            f"<w:tc>{paragraph('Cell 1')}</w:tc><w:tc>{paragraph('Cell 2')}</w:tc>"
+            "</w:tr></w:tbl>"
+        )
+        runs = (
+            '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+            "<w:r><w:t>Split </w:t></w:r><w:r><w:t>runs</w:t><w:tab/><w:t>tabbed</w:t></w:r></w:p>"
+        )
+        file = make_docx(paragraph("Before") + table + runs + paragraph("After"))
+
+        paragraphs = list(app.iter_docx_paragraphs(file))
+
+        self.assertEqual(paragraphs, ["Before", "Cell 1", "Cell 2", "Split runs\ttabbed", "After"])
+
+    def test_extract_docx_text_box_after_its_anchor(self):
+        # As Word saves a text box: DrawingML, plus a VML copy for older readers
+        box = (
+            "<w:r><mc:AlternateContent>"
+            f"<mc:Choice Requires=\"wps\"><w:drawing><wps:txbx><w:txbxContent>{paragraph('Boxed note')}"
+            "</w:txbxContent></wps:txbx></w:drawing></mc:Choice>"
+            f"<mc:Fallback><w:pict><v:shape><v:textbox><w:txbxContent>{paragraph('Boxed note')}"
+            "</w:txbxContent></v:textbox></v:shape></w:pict></mc:Fallback>"
+            "</mc:AlternateContent></w:r>"
+        )
+        anchor = f"<w:p><w:r><w:t>Anchor para</w:t></w:r>{box}</w:p>"
+        file = make_docx(paragraph("Before") + anchor + paragraph("After"))
+
+        paragraphs = list(app.iter_docx_paragraphs(file))
+
+        self.assertEqual(paragraphs, ["Before", "Anchor para", "Boxed note", "After"])
+
     def test_extract_image(self):
         app.pytesseract.image_to_string.return_value = "Image Text"
         # Since extract_text_from_image now accepts an image directly (PIL or numpy),
         # we pass a mock object representing the image.
         image_mock = MagicMock()
 
-        pages = app.extract_text_from_image(image_mock)
+        with patch.object(app, "get_ocr_engine", return_value=app.SubprocessOcrEngine()):
+            pages = app.extract_text_from_image(image_mock)
 
         self.assertEqual(len(pages), 1)
         self.assertEqual(pages[0], "Image Text")
@@ -87,5 +366,110 @@ class TestExtraction(unittest.TestCase):
         expected = "Line 1\nLine 2\nLine 3"
         self.assertEqual(cleaned, expected)
 
+    def test_remove_boilerplate(self):
+        topics = ["budget", "hiring", "sales", "risks", "outlook"]
+        pages = [
+            f"ACME Annual Report 2024\nThis page covers {topic} in a synthe-\nsis of results.\nSummary\n"
+            f"Next steps for {topic}.\nConfidential - do not distribute\nPage {n} of 5"
+            for n, topic in enumerate(topics, start=1)
+        ]
+
+        cleaned, boilerplate = app.remove_boilerplate(pages)
+
+        self.assertEqual(cleaned[2], "This page covers sales in a synthesis of results.\nSummary\nNext steps for sales.")
+        self.assertEqual(boilerplate.lines_removed, 15)
+        self.assertEqual(boilerplate.chars_removed, 5 * (len("ACME Annual Report 2024") + len("Confidential - do not distribute") + len("Page 1 of 5")))
+        self.assertGreater(boilerplate.seconds_saved(), 0)
+
+    def test_boilerplate_needs_repeats(self):
+        pages = ["Unique title\nBody text.\n- 1 -", "Other title\nMore text.\n- 2 -", "Third title\nText.\n- iii -"]
+
+        cleaned, _ = app.remove_boilerplate(pages)
+
+        self.assertEqual(cleaned, ["Unique title\nBody text.", "Other title\nMore text.", "Third title\nText."])
+
+    def test_lines_that_only_look_like_page_numbers_are_kept(self):
+        boilerplate = app.BoilerplateFilter()
+        self.assertEqual(boilerplate.strip("MIX\nStir the batter well."), "MIX\nStir the batter well.")
+        self.assertEqual(boilerplate.strip("Results\nRevenue grew.\n2024"), "Results\nRevenue grew.\n2024")
+
+        for heading in ["Mix", "CD", "DC", "MD", "CV", "CLI", "XL", "MI", "Dix"]:
+            self.assertIsNone(app.PAGE_NUMBER_RE.match(heading), heading)
+
+        # A lone page number on one page of many isn't a pattern
+        pages = [f"{topic.title()}\nNotes on {topic}." for topic in ["budget", "hiring", "sales", "risks", "outlook"]]
+        pages[2] += "\n7"
+        cleaned, _ = app.remove_boilerplate(pages)
+        self.assertEqual(cleaned[2], "Sales\nNotes on sales.\n7")
+
+    def test_numeric_table_rows_are_kept(self):
+        pages = [f"Name Qty Price\nitem{i}a 3 4.50\nitem{i}b 1 2.00" for i in range(6)]
+        cleaned, _ = app.remove_boilerplate(pages)
+        self.assertEqual(cleaned, [f"item{i}a 3 4.50\nitem{i}b 1 2.00" for i in range(6)])
+
+        # Only the same text repeats; amounts at the bottom of a page are not a footer
+        pages = [f"Statement\nSpent on {topic}.\nBalance 1,234.5{i}" for i, topic in enumerate(["rent", "food", "travel", "books"])]
+        cleaned, _ = app.remove_boilerplate(pages)
+        self.assertEqual(cleaned[1], "Spent on food.\nBalance 1,234.51")
+
+    def test_short_pages_are_never_emptied(self):
+        pages = ["Sign here\nDate"] * 5
+        cleaned, boilerplate = app.remove_boilerplate(pages)
+        self.assertEqual(cleaned, pages)
+        self.assertEqual(boilerplate.lines_removed, 0)
+
+        # Only the first and last line of a short page are looked at
+        pages = [f"Header\nStep one.\nStep two.\nStep {n}." for n in range(5)]
+        cleaned, _ = app.remove_boilerplate(pages)
+        self.assertEqual(cleaned[0], "Step one.\nStep two.\nStep 0.")
+
+class TestWorkerPool(unittest.TestCase):
+
+    def test_pool_recovers_from_dead_worker(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pool = app.WorkerPool(max_workers=1)
+            self.addCleanup(pool.shutdown)
+            marker = os.path.join(tmp, "died")
+
+            self.assertEqual(pool.submit(die_once, marker).result(timeout=60), "read")  # Retried once
+            self.assertEqual(pool.submit(str, 5).result(timeout=60), "5")
+
+    def test_unpicklable_worker_errors_arrive_as_runtime_errors(self):
+        pool = app.WorkerPool(max_workers=1)
+        self.addCleanup(pool.shutdown)
+
+        with self.assertRaisesRegex(RuntimeError, "tesseract: not installed"):
+            app.submit_to_worker(pool, raise_unpicklable).result(timeout=60)
+        self.assertEqual(app.submit_to_worker(pool, str, 5).result(timeout=60), "5")
+
+class TestFileBackends(unittest.TestCase):
+
+    def test_file_kind(self):
+        self.assertEqual(app.file_kind("Scan.PDF"), "pdf")
+        self.assertEqual(app.file_kind("notes.docx"), "docx")
+        self.assertEqual(app.file_kind("photo.jpeg"), "image")
+        self.assertIsNone(app.file_kind("notes.txt"))
+
+    def test_module_is_imported_on_first_use(self):
+        sys.modules.pop("colorsys", None)
+        colorsys = app._LazyModule("colorsys")
+        self.assertNotIn("colorsys", sys.modules)
+
+        self.assertEqual(colorsys.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertIn("colorsys", sys.modules)
+
+    def test_attributes_can_be_patched(self):
+        lazy = app._LazyModule("fitz")
+        with patch.object(lazy, "open", return_value="patched"):
+            self.assertEqual(sys.modules["fitz"].open(), "patched")
+        self.assertNotEqual(lazy.open(), "patched")
+
+    def test_docx_needs_no_heavy_backend(self):
+        with patch.object(app.importlib, "import_module") as import_mock:
+            app.load_extraction_backend("docx")
+            import_mock.assert_not_called()
+            app.load_extraction_backend("image")
+        self.assertIn("cv2", [c.args[0] for c in import_mock.call_args_list])
+
 if __name__ == '__main__':
     unittest.main()
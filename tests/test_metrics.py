@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import tempfile
+import urllib.request
+
+# Mock dependencies globally before import
+sys.modules["streamlit"] = MagicMock()
+sys.modules["edge_tts"] = MagicMock()
+sys.modules["fitz"] = MagicMock()
+sys.modules["docx"] = MagicMock()
+sys.modules["pytesseract"] = MagicMock()
+sys.modules["PIL"] = MagicMock()
+sys.modules["PIL.Image"] = MagicMock()
+sys.modules["PIL.ImageOps"] = MagicMock()
+sys.modules["cv2"] = MagicMock()
+sys.modules["numpy"] = MagicMock()
+
+# Add repo root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_histogram_and_counters(self):
+        metrics = app.StageMetrics()
+        metrics.record({"stage": "pdf_ocr", "seconds": 0.2, "pages": 3, "chars": 900})
+        metrics.record({"stage": "pdf_ocr", "seconds": 2.0, "pages": 1})
+
+        text = metrics.render()
+
+        self.assertIn('tts_app_stage_seconds_bucket{stage="pdf_ocr",le="0.1"} 0', text)
+        self.assertIn('tts_app_stage_seconds_bucket{stage="pdf_ocr",le="0.5"} 1', text)
+        self.assertIn('tts_app_stage_seconds_bucket{stage="pdf_ocr",le="+Inf"} 2', text)
+        self.assertIn('tts_app_stage_seconds_sum{stage="pdf_ocr"} 2.200000', text)
+        self.assertIn('tts_app_stage_pages_total{stage="pdf_ocr"} 4', text)
+        self.assertIn('tts_app_stage_chars_total{stage="pdf_ocr"} 900', text)
+
+    def test_timed_stage_records_span(self):
+        metrics = app.StageMetrics()
+        run_spans = []
+        token = app._current_run_spans.set(run_spans)
+        try:
+            with patch.object(app, "get_metrics", return_value=metrics):
+                cleaned = app.clean_text("  Line 1 \n\n Line 2 ")
+        finally:
+            app._current_run_spans.reset(token)
+
+        self.assertEqual(cleaned, "Line 1\nLine 2")
+        self.assertEqual([span["stage"] for span in run_spans], ["clean_text"])
+        self.assertEqual(run_spans[0]["chars"], 19)
+        self.assertIn('tts_app_stage_seconds_count{stage="clean_text"} 1', metrics.render())
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tts_app.prom")
+            metrics = app.StageMetrics(path=path)
+            metrics.record({"stage": "docx", "seconds": 0.01})
+            with open(path) as f:
+                self.assertIn('stage="docx"', f.read())
+
+    def test_worker_spans_recorded_in_parent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tts_app.prom")
+            metrics = app.StageMetrics(path=path, write_interval=0)
+            with patch.object(app, "get_metrics", return_value=metrics), \
+                    concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+                future = app.submit_to_worker(pool, app.clean_text, " Line 1 \n\n Line 2 ")
+                self.assertEqual(future.result(timeout=30), "Line 1\nLine 2")
+                # The worker's forked copy of the registry neither records nor writes the file
+                pool.submit(app.clean_text, "Stray").result(timeout=30)
+
+            with open(path) as f:
+                exported = f.read()
+        self.assertIn('tts_app_stage_seconds_count{stage="clean_text"} 1', exported)
+        self.assertEqual(exported, metrics.render())
+
+    def test_metrics_server(self):
+        metrics = app.StageMetrics()
+        metrics.record({"stage": "synthesis", "seconds": 1.5, "chars": 100})
+        server = app.start_metrics_server(metrics, 0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(body, metrics.render())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 from unittest.mock import MagicMock
+import concurrent.futures
 import sys
 import os
+import gc
 
 # Mock dependencies globally before import
 sys.modules["streamlit"] = MagicMock()
@@ -9,7 +11,6 @@ sys.modules["edge_tts"] = MagicMock()
 sys.modules["fitz"] = MagicMock()
 sys.modules["docx"] = MagicMock()
 sys.modules["pytesseract"] = MagicMock()
-sys.modules["pdf2image"] = MagicMock()
 sys.modules["PIL"] = MagicMock()
 sys.modules["PIL.Image"] = MagicMock()
 sys.modules["PIL.ImageOps"] = MagicMock()
@@ -97,5 +98,129 @@ class TestPagination(unittest.TestCase):
         # Editor content should be empty string
         self.assertEqual(app.st.session_state.editor, "")
 
+class TestLazyPages(unittest.TestCase):
+
+    def setUp(self):
+        app.st.session_state = SessionState()
+        self.loaded = []
+
+    def load_page(self, number):
+        self.loaded.append(number)
+        return f"Page {number}"
+
+    def test_pages_load_on_access(self):
+        pages = app.LazyPages(100, self.load_page)
+        self.assertEqual(len(pages), 100)
+        self.assertEqual(self.loaded, [])
+
+        self.assertEqual(pages[0], "Page 1")
+        self.assertEqual(pages[0], "Page 1")
+        self.assertEqual(self.loaded, [1])
+
+    def test_navigation_prefetches_ahead(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            app.st.session_state.pages = app.LazyPages(10, self.load_page, prefetch=2, executor=pool)
+            app.st.session_state.current_page = 0
+            app.st.session_state.editor = app.st.session_state.pages[0]
+
+            app.next_page()
+
+        self.assertEqual(app.st.session_state.editor, "Page 2")
+        self.assertEqual(sorted(self.loaded), [1, 2, 3, 4])
+
+    def test_delete_and_edit_pending_pages(self):
+        app.st.session_state.pages = app.LazyPages(3, self.load_page)
+        app.st.session_state.current_page = 0
+
+        app.delete_page()
+        app.st.session_state.pages[1] = "Edited"
+
+        self.assertEqual(app.st.session_state.editor, "Page 2")
+        self.assertEqual("\n".join(app.st.session_state.pages), "Page 2\nEdited")
+        self.assertEqual(self.loaded, [2])
+
+    def test_peek_does_not_extract(self):
+        pages = app.LazyPages(3, self.load_page)
+        pages[0]
+
+        self.assertEqual([pages.peek(0), pages.peek(1)], ["Page 1", None])
+        self.assertEqual([app.loaded_page(pages, 1), app.loaded_page(pages, 3)], [None, None])
+        self.assertEqual(self.loaded, [1])
+
+    def test_page_audio_prefetched_for_prefetched_pages(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            pages = app.LazyPages(5, self.load_page, prefetch=3, executor=pool)
+            app.st.session_state.pages = pages
+            app.st.session_state.current_page = 0
+            app.st.session_state.editor = pages[0]
+        # The pool has finished pages 2-4, which haven't been visited
+        self.assertEqual(sorted(self.loaded), [1, 2, 3, 4])
+
+        page_audio = MagicMock()
+        app.st.session_state.page_audio = page_audio
+        app.render_page_audio("voice", 4)
+
+        current, ahead, voice = page_audio.update.call_args.args
+        self.assertEqual(current, "Page 1")
+        self.assertEqual(ahead, ["Page 2", "Page 3"][:app.PAGE_AUDIO_PREFETCH_PAGES])
+        self.assertEqual(sorted(self.loaded), [1, 2, 3, 4])  # Nothing extracted again
+
+    def test_page_sources_extract_on_call(self):
+        pages = app.LazyPages(3, self.load_page)
+        pages[0]
+
+        sources = pages.page_sources()
+        self.assertEqual(sources[0], "Page 1")
+        self.assertEqual(self.loaded, [1])
+
+        self.assertEqual(sources[2](), "Page 3")
+        self.assertEqual(pages.peek(2), "Page 3")  # Kept for the viewer
+        self.assertEqual(self.loaded, [1, 3])
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        app.st.session_state = SessionState()
+        self.store = app.SessionStore()
+        self.addCleanup(self.store.clear)
+
+    def load_page(self, number):
+        return f"Page {number}"
+
+    def test_loaded_pages_are_kept_on_disk(self):
+        pages = app.LazyPages(3, self.load_page, store=self.store)
+        self.assertEqual(pages[0], "Page 1")
+        pages[1] = "Edited"
+
+        self.assertEqual(pages.memory_size(), 0)
+        self.assertEqual(len(os.listdir(self.store.directory)), 2)
+        self.assertEqual(list(pages), ["Page 1", "Edited", "Page 3"])
+
+        del pages[0]
+        pages.release()
+        self.assertEqual(os.listdir(self.store.directory), [])
+
+    def test_from_texts_spills_page_list(self):
+        app.st.session_state.pages = app.LazyPages.from_texts(["One", "Two"], store=self.store)
+        app.st.session_state.session_store = self.store
+        app.st.session_state.current_page = 1
+
+        app.delete_page()
+
+        self.assertEqual(list(app.st.session_state.pages), ["One"])
+        usage = app.session_memory_usage()
+        self.assertEqual(usage["keys"]["pages"], 0)
+        self.assertGreater(usage["on_disk"], 0)
+
+    def test_directory_removed_with_session(self):
+        store = app.SessionStore()
+        store.put_text("page", "Text")
+        directory = store.directory
+
+        del store
+        gc.collect()
+
+        self.assertFalse(os.path.exists(directory))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,26 @@
 import unittest
-from unittest.mock import MagicMock, call
+from unittest.mock import MagicMock, call, patch
+import concurrent.futures
 import sys
 import os
+import threading
+import importlib
+import tempfile
+import time
+
+def import_real_cv2():
+    """Imports the real cv2 and numpy from behind the mocks, or returns (None, None)."""
+    mocked = {name: sys.modules.pop(name) for name in ("cv2", "numpy") if name in sys.modules}
+    try:
+        cv2 = importlib.import_module("cv2")
+        importlib.import_module("numpy.random")  # Submodules can't be loaded once the mock is back
+        return cv2, importlib.import_module("numpy")
+    except ImportError:
+        return None, None
+    finally:
+        sys.modules.update(mocked)
+
+real_cv2, real_np = import_real_cv2()
 
 # Mock dependencies globally before import
 sys.modules["streamlit"] = MagicMock()
@@ -9,7 +28,6 @@ sys.modules["edge_tts"] = MagicMock()
 sys.modules["fitz"] = MagicMock()
 sys.modules["docx"] = MagicMock()
 sys.modules["pytesseract"] = MagicMock()
-sys.modules["pdf2image"] = MagicMock()
 sys.modules["PIL"] = MagicMock()
 sys.modules["PIL.Image"] = MagicMock()
 sys.modules["PIL.ImageOps"] = MagicMock()
@@ -30,6 +48,9 @@ class TestPreprocessing(unittest.TestCase):
         app.cv2.cvtColor.reset_mock()
         app.cv2.filter2D.reset_mock()
         app.cv2.threshold.reset_mock()
+        engine = patch.object(app, "get_ocr_engine", return_value=app.SubprocessOcrEngine())
+        engine.start()
+        self.addCleanup(engine.stop)
 
     def test_process_image_pipeline(self):
         # Setup mocks
@@ -103,5 +124,317 @@ class TestPreprocessing(unittest.TestCase):
             (3000, expected_new_height), app.Image.Resampling.LANCZOS
         )
 
+    def test_threshold_reapplied_without_preprocessing(self):
+        mock_pil_image = MagicMock()
+        mock_pil_image.width = 1000
+        app.ImageOps.exif_transpose.return_value = mock_pil_image
+        app.np.array.return_value = MagicMock(shape=(100, 100))
+        mock_sharpened = MagicMock()
+        app.cv2.filter2D.return_value = mock_sharpened
+        app.cv2.threshold.return_value = (0, MagicMock())
+
+        resized, sharpened = app.prepare_image_for_threshold(mock_pil_image)
+        for value in (100, 150, 200):
+            app.apply_threshold(sharpened, value)
+
+        self.assertIs(resized, mock_pil_image)
+        self.assertIs(sharpened, mock_sharpened)
+        app.ImageOps.exif_transpose.assert_called_once()
+        app.cv2.filter2D.assert_called_once()
+        self.assertEqual(
+            [c.args[1] for c in app.cv2.threshold.call_args_list], [100, 150, 200]
+        )
+
+    def test_choose_threshold_picks_most_confident_candidate(self):
+        sharpened = MagicMock(shape=(400, 1000))
+        sharpened.__getitem__.return_value = MagicMock(shape=(200, 1000))
+        app.cv2.threshold.return_value = (120.0, MagicMock())
+
+        def fake_image_to_data(image, output_type=None):
+            # The candidate "image" is the threshold value itself; 140 reads best
+            return {"conf": ["-1", str(100 - abs(image - 140)), "50"]}
+
+        with patch.object(app, "apply_threshold", side_effect=lambda img, value: value), \
+                patch.object(app.pytesseract, "image_to_data", side_effect=fake_image_to_data) as data_mock:
+            chosen = app.choose_threshold(sharpened)
+
+        self.assertEqual(chosen, 140)
+        scored = sorted(c.args[0] for c in data_mock.call_args_list)
+        self.assertEqual(scored, [80, 100, 120, 140, 160])
+
+    def test_choose_threshold_clamps_candidates(self):
+        sharpened = MagicMock(shape=(400, 1000))
+        sharpened.__getitem__.return_value = MagicMock(shape=(200, 1000))
+        app.cv2.threshold.return_value = (250.0, MagicMock())
+
+        with patch.object(app, "apply_threshold", side_effect=lambda img, value: value), \
+                patch.object(app.pytesseract, "image_to_data", return_value={"conf": ["90"]}) as data_mock:
+            chosen = app.choose_threshold(sharpened)
+
+        # All candidates tie, so Otsu's threshold is kept
+        self.assertEqual(chosen, 250)
+        self.assertEqual(sorted(c.args[0] for c in data_mock.call_args_list), [210, 230, 250, 255])
+
+    def test_process_image_auto_threshold(self):
+        mock_pil_image = MagicMock()
+        mock_pil_image.width = 1000
+        app.ImageOps.exif_transpose.return_value = mock_pil_image
+        app.np.array.return_value = MagicMock(shape=(100, 100))
+        mock_sharpened = MagicMock()
+        app.cv2.filter2D.return_value = mock_sharpened
+
+        with patch.object(app, "choose_threshold", return_value=90) as choose_mock, \
+                patch.object(app, "apply_threshold") as apply_mock:
+            app.process_image_for_ocr(mock_pil_image, threshold_value=app.AUTO_THRESHOLD)
+
+        choose_mock.assert_called_once_with(mock_sharpened)
+        apply_mock.assert_called_once_with(mock_sharpened, 90)
+
+class TestTextRegions(unittest.TestCase):
+
+    def region(self, x, y, width, height):
+        return app.TextRegion(x, y, width, height, 0.0)
+
+    def test_reading_order_columns_before_rows(self):
+        title = self.region(100, 50, 1800, 60)
+        left_top, left_bottom = self.region(100, 200, 800, 400), self.region(100, 650, 800, 300)
+        right_top, right_bottom = self.region(1000, 210, 800, 200), self.region(1000, 450, 800, 500)
+        footer = self.region(100, 1000, 1800, 40)
+
+        ordered = app._reading_order([right_bottom, footer, left_bottom, title, right_top, left_top])
+
+        self.assertEqual(ordered, [title, left_top, left_bottom, right_top, right_bottom, footer])
+
+    def test_regions_ocr_in_parallel_in_order(self):
+        regions = [self.region(0, 0, 10, 10), self.region(0, 20, 10, 10), self.region(0, 40, 10, 10)]
+        engine = MagicMock()
+        engine.image_to_string.side_effect = lambda crop: f" {crop.y} \n"
+
+        with patch.object(app, "get_ocr_engine", return_value=engine), \
+                patch.object(app, "find_text_regions", return_value=regions), \
+                patch.object(app, "crop_text_region", side_effect=lambda image, region: region), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            pages = app.extract_text_from_image(MagicMock(), crop_to_text=True, executor=executor)
+
+        self.assertEqual(pages, ["0\n20\n40"])
+
+    def test_photo_in_worker_ocrs_blocks_in_its_own_thread(self):
+        regions = [self.region(0, 0, 10, 10), self.region(0, 20, 10, 10)]
+        threads = []
+        engine = MagicMock()
+        engine.image_to_string.side_effect = lambda crop: threads.append(threading.get_ident()) or str(crop.y)
+
+        with patch.object(app, "get_ocr_engine", return_value=engine), \
+                patch.object(app, "process_image_file_for_ocr", return_value=MagicMock()) as process, \
+                patch.object(app, "find_text_regions", return_value=regions), \
+                patch.object(app, "crop_text_region", side_effect=lambda image, region: region):
+            text = app.ocr_photo("photo.jpg", app.AUTO_THRESHOLD)
+
+        self.assertEqual(text, "0\n20")
+        self.assertEqual(threads, [threading.get_ident()] * 2)
+        self.assertIsInstance(process.call_args.kwargs["executor"], app.SerialExecutor)  # Threshold candidates too
+
+    def test_whole_frame_without_regions(self):
+        engine = MagicMock()
+        engine.image_to_string.return_value = "Whole frame"
+        image = MagicMock()
+
+        with patch.object(app, "get_ocr_engine", return_value=engine), \
+                patch.object(app, "find_text_regions", return_value=[]):
+            pages = app.extract_text_from_image(image, crop_to_text=True)
+
+        self.assertEqual(pages, ["Whole frame"])
+        engine.image_to_string.assert_called_once_with(image)
+
+class SessionState(dict):
+    """Stand-in for st.session_state, with attribute access."""
+
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+class TestReadImageFile(unittest.TestCase):
+
+    def setUp(self):
+        self.original_session_state = app.st.session_state
+        app.st.session_state = SessionState()
+        self.addCleanup(setattr, app.st, "session_state", self.original_session_state)
+        self.ocr = MagicMock(return_value=["Image text"])
+        self.choose = MagicMock(return_value=140)
+        self.prepare = MagicMock(return_value="sharpened")
+        patcher = patch.multiple(
+            app,
+            file_content_hash=MagicMock(return_value="hash"),
+            spooled_path=MagicMock(),
+            prepare_image_file_for_threshold=self.prepare,
+            make_file_preview=MagicMock(return_value="original preview"),
+            downscale_array=MagicMock(return_value="small"),
+            choose_threshold=self.choose,
+            apply_threshold=MagicMock(side_effect=lambda image, value: f"{image} at {value}"),
+            make_preview=MagicMock(side_effect=lambda image, image_format: f"preview of {image}"),
+            extract_text_from_image=self.ocr,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_store(self):
+        store = MagicMock()
+        store.get_array.return_value = None  # Cleared for a new upload
+        return store
+
+    def test_cached_image_is_prepared_for_preview_but_not_ocrd(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = app.DiskCache(tmp, max_bytes=1024 * 1024)
+            self.assertEqual(app.read_image_file(MagicMock(), app.AUTO_THRESHOLD, self.new_store(), cache=cache), ["Image text"])
+            app.st.session_state.clear()
+
+            # The same image uploaded again, e.g. in another session
+            pages = app.read_image_file(MagicMock(), app.AUTO_THRESHOLD, self.new_store(), cache=cache)
+
+        self.assertEqual(pages, ["Image text"])
+        self.assertEqual(self.ocr.call_count, 1)
+        self.assertEqual(self.choose.call_count, 1)  # The picked threshold is cached too
+        self.assertEqual(self.prepare.call_count, 2)
+        self.assertEqual(app.st.session_state.auto_threshold_value, 140)
+        self.assertEqual(app.st.session_state.original_preview, "original preview")
+        self.assertEqual(app.st.session_state.processed_preview, "preview of sharpened at 140")
+        self.assertEqual(app.st.session_state.last_preview_threshold, app.AUTO_THRESHOLD)
+
+@unittest.skipIf(real_cv2 is None, "OpenCV is not installed")
+class TestTextRegionsOnImage(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(app, "cv2", real_cv2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def text_image(self, angle):
+        """Returns a block of text rotated counterclockwise by angle degrees, and its bounds."""
+        image = real_np.full((600, 800), 255, real_np.uint8)
+        for line in range(8):
+            real_cv2.putText(image, "The quick brown fox jumps", (200, 200 + 30 * line), real_cv2.FONT_HERSHEY_SIMPLEX, 0.7, 0, 2)
+        rotation = real_cv2.getRotationMatrix2D((400, 300), angle, 1.0)
+        image = real_cv2.warpAffine(image, rotation, (800, 600), borderValue=255)
+        return image, real_cv2.boundingRect(real_cv2.findNonZero((image < 128).astype(real_np.uint8)))
+
+    def noisy_binary(self, image):
+        """Darkens the page, adds sensor noise and thresholds it like a photo."""
+        rng = real_np.random.default_rng(0)
+        gray = image.astype(real_np.float64) * 0.7 + 60 + rng.normal(0, 20, image.shape)
+        _, binary = real_cv2.threshold(real_np.clip(gray, 0, 255).astype(real_np.uint8), 0, 255, real_cv2.THRESH_BINARY + real_cv2.THRESH_OTSU)
+        return binary
+
+    def skew(self, binary):
+        """Returns the tilt in degrees of the ink in a thresholded image."""
+        angle = real_cv2.minAreaRect(real_cv2.findNonZero(real_cv2.bitwise_not(binary)))[2]
+        return (angle + 45) % 90 - 45
+
+    def test_rotated_text_found_and_levelled(self):
+        for angle in (6, -6):
+            with self.subTest(angle=angle):
+                image, (x, y, width, height) = self.text_image(angle)
+                binary = self.noisy_binary(image)
+
+                regions = app.find_text_regions(binary)
+
+                self.assertEqual(len(regions), 1)
+                region = regions[0]
+                # The block covers the text, and not much of the noise around it
+                self.assertTrue(x - 30 <= region.x <= x)
+                self.assertTrue(y - 30 <= region.y <= y)
+                self.assertTrue(x + width <= region.x + region.width <= x + width + 30)
+                self.assertTrue(y + height <= region.y + region.height <= y + height + 30)
+                # Rotating by the region's angle undoes the tilt
+                self.assertAlmostEqual(region.angle, -angle, delta=1)
+                crop = app.crop_text_region(binary, region)
+                self.assertLess(abs(self.skew(crop)), 1)
+
+class FakeTessBaseAPI:
+    instances = []
+
+    def __init__(self, path=None):
+        FakeTessBaseAPI.instances.append(self)
+        self.path = path
+        self.images = []
+
+    def SetImageBytes(self, data, width, height, bytes_per_pixel, bytes_per_line):
+        self.images.append((width, height, bytes_per_pixel, bytes_per_line))
+
+    def GetUTF8Text(self):
+        return f"text {len(self.images)}"
+
+    def Recognize(self):
+        pass
+
+    def AllWordConfidences(self):
+        return [90, 0, 45]
+
+    def Clear(self):
+        pass
+
+class TestOcrEngine(unittest.TestCase):
+
+    def setUp(self):
+        FakeTessBaseAPI.instances = []
+        tesserocr = MagicMock(PyTessBaseAPI=FakeTessBaseAPI)
+        for patcher in (patch.object(app, "tesserocr", tesserocr),
+                        patch.object(app.np, "ascontiguousarray",
+                                     return_value=MagicMock(shape=(30, 40), ndim=2, strides=(40, 1)))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pool_reuses_warm_instances(self):
+        pool = app.TesseractPool(size=2)
+
+        texts = [pool.image_to_string(MagicMock(mode="L")) for _ in range(3)]
+
+        self.assertEqual(texts, ["text 1", "text 2", "text 3"])
+        self.assertEqual(len(FakeTessBaseAPI.instances), 1)
+        self.assertEqual(FakeTessBaseAPI.instances[0].images[0], (40, 30, 1, 40))
+
+    def test_pool_size_bounds_instances(self):
+        pool = app.TesseractPool(size=2)
+        release = threading.Event()
+        original = FakeTessBaseAPI.GetUTF8Text
+
+        def slow_text(api):
+            release.wait(5)
+            return original(api)
+
+        with patch.object(FakeTessBaseAPI, "GetUTF8Text", slow_text), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(pool.image_to_string, MagicMock(mode="L")) for _ in range(4)]
+            time.sleep(0.05)
+            release.set()
+            concurrent.futures.wait(futures)
+
+        self.assertEqual(len(FakeTessBaseAPI.instances), 2)
+
+    def test_word_confidences(self):
+        self.assertEqual(app.TesseractPool(size=1).word_confidences(MagicMock(mode="L")), [90.0, 0.0, 45.0])
+
+    def test_make_ocr_engine(self):
+        with patch.object(app, "tessdata_path", return_value="/usr/share/tessdata"):
+            pool = app.make_ocr_engine("auto")
+        self.assertIsInstance(pool, app.TesseractPool)
+        pool.image_to_string(MagicMock(mode="L"))
+        self.assertEqual(FakeTessBaseAPI.instances[0].path, "/usr/share/tessdata")
+        self.assertIsInstance(app.make_ocr_engine("subprocess"), app.SubprocessOcrEngine)
+        with patch.object(app, "tesserocr", None):
+            self.assertIsInstance(app.make_ocr_engine("auto"), app.SubprocessOcrEngine)
+            with self.assertRaises(RuntimeError):
+                app.make_ocr_engine("tesserocr")
+        with self.assertRaises(ValueError):
+            app.make_ocr_engine("cuneiform")
+
+    def test_tessdata_path(self):
+        listing = MagicMock(stdout='List of available languages in "/usr/share/tesseract-ocr/5/tessdata/" (2):\neng\nosd\n', stderr="")
+        with patch.dict(os.environ), patch.object(app.subprocess, "run", return_value=listing) as run:
+            os.environ.pop("TESSDATA_PREFIX", None)
+            self.assertEqual(app.tessdata_path(), "/usr/share/tesseract-ocr/5/tessdata/")
+            run.side_effect = FileNotFoundError("tesseract")
+            self.assertIsNone(app.tessdata_path())
+            os.environ["TESSDATA_PREFIX"] = "/opt/tessdata"
+            self.assertEqual(app.tessdata_path(), "/opt/tessdata")
+
 if __name__ == '__main__':
     unittest.main()